@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+结构化访问日志
+每个请求结束时记录一行JSON（JSON Lines）：时间、方法、路由、路径、状态码、发送字节数、耗时、用户和客户端IP。
+请求线程只把记录放入队列，由后台线程批量编码和写入，请求不再为每行日志等待一次终端或日志文件的写入。
+服务器内部的事件（客户端断开、发送失败、慢速客户端、登录锁定、工作区移出内存等）以 level 为 info/warning/error
+的事件写入同一个文件；请求处理线程不直接print，终端只输出服务器启动和停止的信息。
+
+配置（环境变量）：
+    PM_ACCESS_LOG              日志文件路径（默认 logs/access.log），设为 - 时写到标准输出（如交给systemd日志）
+    PM_ACCESS_LOG_MAX_MB       单个日志文件的大小上限（默认10MB），超过后轮换为 access.log.1、access.log.2 ...
+    PM_ACCESS_LOG_BACKUPS      保留的轮换文件个数（默认5）
+    PM_ACCESS_LOG_SAMPLE       按路由采样，如 "/api/check-auth=0.1,/api/stats=0.5"，只记录对应比例的成功请求；
+                               状态码大于等于400的请求总是记录
+
+队列已满（写入跟不上）时丢弃新的记录，丢弃的数量在下一次写入时以 access_log_dropped 事件记录。
+"""
+
+import atexit
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+import json_codec
+
+DEFAULT_PATH = os.path.join('logs', 'access.log')
+DEFAULT_MAX_MB = 10
+DEFAULT_BACKUPS = 5
+
+# 队列中最多等待写入的记录数
+MAX_PENDING = 10000
+
+# 每批最多写入的记录数，以及收集一批记录的最长时间（秒）
+BATCH_SIZE = 256
+FLUSH_INTERVAL = 0.5
+
+_STOP = object()
+
+
+def parse_sample_rates(text):
+    """解析 "/api/check-auth=0.1,/api/stats=0.5" 格式的采样设置"""
+    rates = {}
+    for item in (text or '').split(','):
+        route, _, rate = item.strip().rpartition('=')
+        if not route:
+            continue
+        try:
+            rates[route] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            print(f"⚠️  忽略无效的访问日志采样设置: {item}")
+    return rates
+
+
+class AccessLog:
+    """队列 + 后台写入线程的JSON Lines日志"""
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=DEFAULT_MAX_MB * 1024 * 1024, backups=DEFAULT_BACKUPS,
+                 sample_rates=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.sample_rates = sample_rates or {}
+        self.queue = queue.Queue(MAX_PENDING)
+        self.dropped = 0
+        self.dropped_lock = threading.Lock()
+        self.file = None
+        self.writer = None
+        self.start_lock = threading.Lock()
+
+    def sampled(self, route, status):
+        """按路由采样，出错的请求总是记录"""
+        rate = self.sample_rates.get(route)
+        return rate is None or status >= 400 or random.random() < rate
+
+    def put(self, entry):
+        if self.writer is None:
+            self.start()
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            with self.dropped_lock:
+                self.dropped += 1
+
+    def request(self, method, route, path, status, size, latency, user=None, ip=None):
+        """记录一个请求，耗时单位为秒"""
+        if not self.sampled(route, status):
+            return
+        self.put({
+            'ts': time.time(),
+            'type': 'access',
+            'method': method,
+            'route': route,
+            'path': path,
+            'status': status,
+            'bytes': size,
+            'ms': round(latency * 1000, 2),
+            'user': user,
+            'ip': ip
+        })
+
+    def event(self, level, message, **fields):
+        """记录服务器内部的警告或错误"""
+        entry = {'ts': time.time(), 'type': 'event', 'level': level, 'message': message}
+        # 附加字段不能覆盖 ts/type/level/message
+        entry.update((name, value) for name, value in fields.items() if name not in entry)
+        self.put(entry)
+
+    def start(self):
+        with self.start_lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.run, name='access-log', daemon=True)
+                self.writer.start()
+                # 命令行工具等没有调用close就退出的进程，退出前同样写完队列中的记录
+                atexit.register(self.close)
+
+    def open(self):
+        if self.path == '-':
+            return sys.stdout.buffer
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return open(self.path, 'ab')
+
+    def rotate(self):
+        """当前文件改名为 .1，原有的 .1 改名为 .2，依此类推，最旧的文件被覆盖"""
+        self.file.close()
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file = self.open()
+
+    def collect(self):
+        """等待第一条记录，再在 FLUSH_INTERVAL 内尽量多收集一些，一起写入"""
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while len(batch) < BATCH_SIZE and batch[-1] is not _STOP:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def encode(self, entry):
+        entry['ts'] = datetime.fromtimestamp(entry['ts']).isoformat(timespec='milliseconds')
+        return json_codec.dumps(entry) + b'\n'
+
+    def run(self):
+        self.file = self.open()
+        while True:
+            batch = self.collect()
+            stopping = batch[-1] is _STOP
+            lines = [self.encode(entry) for entry in batch if entry is not _STOP]
+            with self.dropped_lock:
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                lines.append(self.encode({'ts': time.time(), 'type': 'event', 'level': 'warning',
+                                          'message': 'access_log_dropped', 'count': dropped}))
+            try:
+                self.file.write(b''.join(lines))
+                self.file.flush()
+                if self.path != '-' and self.file.tell() >= self.max_bytes:
+                    self.rotate()
+            except OSError as e:
+                print(f"⚠️  写入访问日志失败: {e}")
+            if stopping:
+                break
+        if self.path != '-':
+            self.file.close()
+
+    def close(self):
+        """写完队列中的记录后停止写入线程"""
+        if self.writer is not None:
+            self.queue.put(_STOP)
+            self.writer.join()
+            self.writer = None
+
+
+class CountingWriter:
+    """包装连接的wfile，统计发送的字节数（含响应头）"""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        return self.wfile.write(data)
+
+    def flush(self):
+        self.wfile.flush()
+
+    def close(self):
+        self.wfile.close()
+
+    @property
+    def closed(self):
+        return self.wfile.closed
+
+
+_access_log = None
+_access_log_lock = threading.Lock()
+
+
+def get_access_log():
+    """获取按环境变量配置的共享访问日志"""
+    global _access_log
+    with _access_log_lock:
+        if _access_log is None:
+            _access_log = AccessLog(
+                path=os.environ.get('PM_ACCESS_LOG', DEFAULT_PATH),
+                max_bytes=int(float(os.environ.get('PM_ACCESS_LOG_MAX_MB', DEFAULT_MAX_MB)) * 1024 * 1024),
+                backups=int(os.environ.get('PM_ACCESS_LOG_BACKUPS', DEFAULT_BACKUPS)),
+                sample_rates=parse_sample_rates(os.environ.get('PM_ACCESS_LOG_SAMPLE'))
+            )
+        return _access_log
@@ -7,7 +7,6 @@
 
 import json
 import os
-import hashlib
 import secrets
 import time
 from datetime import datetime, timedelta
@@ -16,8 +15,14 @@ from urllib.parse import urlparse, parse_qs
 import mimetypes
 from socketserver import ThreadingMixIn
 
-# 全局会话存储
-sessions = {}
+from data_store import get_store
+import json_codec
+from session_table import SessionTable
+from session_tokens import get_session_tokens, session_mode
+from user_store import get_user_store, hash_password
+
+# 全局会话存储，各请求线程共享，过期会话由后台线程清理
+sessions = SessionTable()
 
 class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
     """线程化的HTTP服务器，更好地处理信号"""
@@ -27,6 +32,8 @@ class AuthProjectManagerHandler(BaseHTTPRequestHandler):
     def __init__(self, *args, **kwargs):
         self.data_dir = "database"
         self.users_file = "users.txt"
+        # PM_SESSION_MODE=token 时使用签名令牌，多个进程之间无需共享会话
+        self.session_tokens = get_session_tokens() if session_mode() == 'token' else None
         self.ensure_database_dir()
         super().__init__(*args, **kwargs)
 
@@ -37,39 +44,36 @@ class AuthProjectManagerHandler(BaseHTTPRequestHandler):
 
     def hash_password(self, password):
         """生成密码的SHA-256哈希"""
-        return hashlib.sha256(password.encode('utf-8')).hexdigest()
+        return hash_password(password)
 
     def verify_user(self, username, password):
-        """验证用户名和密码"""
-        if not os.path.exists(self.users_file):
-            return False
-
-        hashed_password = self.hash_password(password)
-
+        """验证用户名和密码（用户文件缓存在内存中，变化时自动重新加载）"""
         try:
-            with open(self.users_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if line.startswith('#') or ':' not in line:
-                        continue
-                    line_username, line_hash = line.strip().split(':', 1)
-                    if line_username == username and line_hash == hashed_password:
-                        return True
+            return get_user_store(self.users_file).verify(username, password)
         except Exception as e:
             print(f"验证用户时出错: {e}")
-
         return False
 
     def create_session(self, username):
         """创建用户会话"""
+        if self.session_tokens is not None:
+            return self.session_tokens.issue(username, ip=self.client_address[0])
         token = secrets.token_urlsafe(32)
-        sessions[token] = {
+        sessions.add(token, {
             'username': username,
             'created': time.time(),
             'expires': time.time() + 3600,  # 1小时后过期
             'ip': self.client_address[0]
-        }
+        })
         return token
 
+    def verify_token(self, session_token):
+        """令牌模式下验证签名令牌，返回载荷"""
+        payload = self.session_tokens.verify(session_token)
+        if payload is None or payload.get('ip') != self.client_address[0]:
+            return None
+        return payload
+
     def is_authenticated(self):
         """检查是否已认证"""
         # 检查是否有有效的会话token
@@ -88,23 +92,21 @@ class AuthProjectManagerHandler(BaseHTTPRequestHandler):
         if not session_token:
             return False
 
-        # 检查会话是否存在且有效
+        if self.session_tokens is not None:
+            return self.verify_token(session_token) is not None
+
+        # 检查会话是否存在且未过期
         session = sessions.get(session_token)
         if not session:
             return False
 
-        # 检查会话是否过期
-        if time.time() > session['expires']:
-            del sessions[session_token]
-            return False
-
         # 检查IP地址是否匹配（简单的安全措施）
         if session['ip'] != self.client_address[0]:
-            del sessions[session_token]
+            sessions.remove(session_token)
             return False
 
         # 更新会话过期时间
-        session['expires'] = time.time() + 3600
+        sessions.touch(session_token, time.time() + 3600)
         return True
 
     def get_current_user(self):
@@ -120,6 +122,9 @@ class AuthProjectManagerHandler(BaseHTTPRequestHandler):
                 cookies[key] = value
 
         session_token = cookies.get('session_token')
+        if self.session_tokens is not None:
+            payload = self.verify_token(session_token)
+            return payload['u'] if payload else None
         session = sessions.get(session_token)
         return session['username'] if session else None
 
@@ -143,20 +148,15 @@ class AuthProjectManagerHandler(BaseHTTPRequestHandler):
 
     def get_data_path(self, data_type):
         """获取数据文件路径"""
-        return os.path.join(self.data_dir, f"{data_type}.json")
+        return get_store(self.data_dir).get_data_path(data_type)
 
     def load_data(self, data_type):
-        """从文件加载数据"""
-        try:
-            with open(self.get_data_path(data_type), 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+        """从数据存储加载数据"""
+        return get_store(self.data_dir).load(data_type)
 
     def save_data(self, data_type, data):
         """保存数据到文件"""
-        with open(self.get_data_path(data_type), 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        get_store(self.data_dir).save(data_type, data)
 
     def do_GET(self):
         """处理GET请求"""
@@ -186,6 +186,9 @@ class AuthProjectManagerHandler(BaseHTTPRequestHandler):
                 self.handle_get_data()
         elif parsed_path.path == '/api/check-auth':
             self.handle_check_auth()
+        elif parsed_path.path == '/api/sessions':
+            if self.require_auth():
+                self.send_json_response(200, sessions.stats())
         elif parsed_path.path == '/api/logout':
             self.handle_logout()  # 登出不需要认证前置检查
         else:
@@ -216,7 +219,7 @@ class AuthProjectManagerHandler(BaseHTTPRequestHandler):
         try:
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
+            data = json_codec.loads(post_data)
 
             username = data.get('username', '').strip()
             password = data.get('password', '')
@@ -241,7 +244,7 @@ class AuthProjectManagerHandler(BaseHTTPRequestHandler):
                 self.send_header('Access-Control-Allow-Origin', '*')
                 self.set_session_cookie(session_token)
                 self.end_headers()
-                self.wfile.write(json.dumps(response).encode('utf-8'))
+                self.wfile.write(json_codec.dumps(response))
 
                 print(f"✅ 用户 '{username}' 登录成功 (IP: {self.client_address[0]})")
             else:
@@ -279,10 +282,15 @@ class AuthProjectManagerHandler(BaseHTTPRequestHandler):
                     cookies[key] = value
 
             session_token = cookies.get('session_token')
-            if session_token in sessions:
-                username = sessions[session_token]['username']
-                del sessions[session_token]
-                print(f"👋 用户 '{username}' 已登出")
+            if self.session_tokens is not None:
+                payload = self.verify_token(session_token)
+                if payload is not None:
+                    self.session_tokens.revoke(payload)
+                    print(f"👋 用户 '{payload['u']}' 已登出")
+            else:
+                session = sessions.remove(session_token)
+                if session is not None:
+                    print(f"👋 用户 '{session['username']}' 已登出")
 
         # 清除Cookie并重定向到登录页面
         self.send_response(302)
@@ -305,7 +313,7 @@ class AuthProjectManagerHandler(BaseHTTPRequestHandler):
             self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
-            self.wfile.write(json.dumps(data).encode('utf-8'))
+            self.wfile.write(json_codec.dumps(data))
 
         except Exception as e:
             self.send_error(500, str(e))
@@ -322,7 +330,7 @@ class AuthProjectManagerHandler(BaseHTTPRequestHandler):
                 return
 
             post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
+            data = json_codec.loads(post_data)
 
             # 处理图片数据 - 如果太大则移除
             for data_type in ['plans', 'projects']:
@@ -387,7 +395,7 @@ class AuthProjectManagerHandler(BaseHTTPRequestHandler):
         self.send_header('Content-type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode('utf-8'))
+        self.wfile.write(json_codec.dumps(data))
 
     def do_OPTIONS(self):
         """处理CORS预检请求"""
@@ -401,20 +409,6 @@ class AuthProjectManagerHandler(BaseHTTPRequestHandler):
         """自定义日志消息"""
         print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {format % args}")
 
-def cleanup_expired_sessions():
-    """清理过期会话"""
-    current_time = time.time()
-    expired_tokens = []
-
-    for token, session in sessions.items():
-        if current_time > session['expires']:
-            expired_tokens.append(token)
-
-    for token in expired_tokens:
-        username = sessions[token]['username']
-        del sessions[token]
-        print(f"🕐 会话过期: {username}")
-
 def run_server(port=8001):
     """运行HTTP服务器"""
     import signal
@@ -431,6 +425,7 @@ def run_server(port=8001):
     print(f"🌐 支持公网访问，可在防火墙开放 {port} 端口")
     print("⏹️  按 Ctrl+C 停止服务器")
 
+    sessions.start_sweeper()
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
@@ -440,6 +435,9 @@ def run_server(port=8001):
     finally:
         try:
             print("正在关闭服务器...")
+            sessions.stop_sweeper()
+            stats = sessions.stats()
+            print(f"📊 会话统计: 在线 {stats['live']}，已过期 {stats['expired']}，超出上限移出 {stats['evicted']}")
             httpd.shutdown()
             httpd.server_close()
             print("✅ 服务器已安全停止")
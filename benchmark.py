@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能基准测试
+使用生成的模拟数据测量数据层的内存占用和耗时，不读写 database/ 中的真实数据
+
+用法:
+    python benchmark.py memory --count 100000
+    python benchmark.py json --count 50000
+    python benchmark.py login --logins 64 --concurrency 16
+    python benchmark.py pbkdf2
+"""
+
+import argparse
+import gc
+import hashlib
+import json
+import os
+import random
+import secrets
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import json_codec
+from entities import from_json
+from json_codec import available_codecs
+from password_hasher import PBKDF2_ITERATIONS, PasswordHasher, configured_iterations, measure_derive
+
+STATUSES = ['planning', 'active', 'in-progress', 'completed', 'paused']
+PRIORITIES = ['high', 'medium', 'low']
+CATEGORIES = ['work', 'study', 'personal', 'skill', 'career']
+
+
+def iso_time(moment):
+    """与前端 toISOString() 相同格式的时间"""
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.') + f'{moment.microsecond // 1000:03d}Z'
+
+
+def generate_items(data_type, count, seed=0):
+    """生成模拟数据"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    items = []
+    for i in range(count):
+        created = start + timedelta(milliseconds=rng.randrange(0, 700 * 86400 * 1000))
+        if data_type == 'tasks':
+            items.append({
+                'id': f'id_{i}_{rng.getrandbits(40):x}',
+                'projectId': f'project_{rng.randrange(count // 20 + 1)}',
+                'name': f'任务 {i}',
+                'description': '任务描述' * rng.randrange(0, 4),
+                'status': rng.choice(STATUSES),
+                'priority': rng.choice(PRIORITIES),
+                'dueDate': (created + timedelta(days=rng.randrange(1, 60))).strftime('%Y-%m-%d'),
+                'createdAt': iso_time(created)
+            })
+        elif data_type == 'records':
+            items.append({
+                'id': f'id_{i}_{rng.getrandbits(40):x}',
+                'taskId': f'task_{rng.randrange(count // 5 + 1)}',
+                'name': f'file_{i}.pdf',
+                'size': rng.randrange(1, 10 ** 7),
+                'type': 'application/pdf',
+                'uploadDate': iso_time(created)
+            })
+        elif data_type == 'projects':
+            items.append({
+                'id': f'id_{i}_{rng.getrandbits(40):x}',
+                'planId': f'plan_{rng.randrange(count // 20 + 1)}',
+                'name': f'项目 {i}',
+                'description': '项目描述',
+                'category': rng.choice(CATEGORIES),
+                'status': rng.choice(STATUSES),
+                'priority': rng.choice(PRIORITIES),
+                'deadline': (created + timedelta(days=rng.randrange(1, 90))).strftime('%Y-%m-%d'),
+                'image': None,
+                'createdAt': iso_time(created)
+            })
+        else:
+            items.append({
+                'id': f'id_{i}_{rng.getrandbits(40):x}',
+                'name': f'计划 {i}',
+                'description': '计划描述',
+                'category': rng.choice(CATEGORIES),
+                'status': rng.choice(STATUSES),
+                'startDate': created.strftime('%Y-%m-%d'),
+                'endDate': (created + timedelta(days=rng.randrange(1, 180))).strftime('%Y-%m-%d'),
+                'color': '#6366f1',
+                'image': None,
+                'createdAt': iso_time(created)
+            })
+    return items
+
+
+def measure(build):
+    """返回 (build() 结果占用的字节数, 耗时秒数)"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size, elapsed
+
+
+def run_memory(args):
+    codec = json_codec.codec
+    print(f"📊 内存占用对比（每类 {args.count} 条，编码使用 {codec.name}）")
+    print(f"{'数据类型':<10}{'dict':>12}{'实体':>12}{'节省':>8}{'每条(dict/实体)':>20}"
+          f"{'加载耗时(dict/实体)':>24}{'编码耗时(dict/实体)':>24}")
+    for data_type in ['plans', 'projects', 'tasks', 'records']:
+        text = json.dumps(generate_items(data_type, args.count), ensure_ascii=False)
+        dict_size, dict_time = measure(lambda: json.loads(text))
+        entity_size, entity_time = measure(lambda: [from_json(data_type, item) for item in json.loads(text)])
+        items = json.loads(text)
+        entity_items = [from_json(data_type, item) for item in items]
+        dict_encode = best_time(lambda: codec.dumps(items), 3)
+        entity_encode = best_time(lambda: codec.dumps(entity_items), 3)
+        saved = 1 - entity_size / dict_size if dict_size else 0
+        print(f"{data_type:<10}{dict_size / 1024 / 1024:>10.1f}MB{entity_size / 1024 / 1024:>10.1f}MB"
+              f"{saved:>8.0%}{dict_size // args.count:>12}B / {entity_size // args.count}B"
+              f"{dict_time:>14.2f}s / {entity_time:.2f}s{dict_encode:>14.2f}s / {entity_encode:.2f}s")
+
+
+def best_time(action, repeat):
+    """多次执行取最短耗时"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        action()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def load_entities(data):
+    return {data_type: [from_json(data_type, item) for item in items] for data_type, items in data.items()}
+
+
+def run_json(args):
+    data = {data_type: generate_items(data_type, args.count) for data_type in ['plans', 'projects', 'tasks', 'records']}
+    # 与启用 PM_COMPACT_ENTITIES 时DataStore中保存的形式相同：from_json转换后的实体
+    entity_data = load_entities(data)
+    print(f"📊 JSON编解码对比（每类 {args.count} 条，取 {args.repeat} 次中最快的一次）")
+    print(f"{'实现':<8}{'格式':<8}{'文件大小':>12}{'编码dict':>12}{'编码实体':>12}{'解码dict':>12}{'解码实体':>12}")
+    for codec in available_codecs():
+        for pretty in (True, False):
+            encoded = codec.dumps(data, pretty=pretty)
+            size_mb = len(encoded) / 1024 / 1024
+            encode_time = best_time(lambda: codec.dumps(data, pretty=pretty), args.repeat)
+            entity_time = best_time(lambda: codec.dumps(entity_data, pretty=pretty), args.repeat)
+            decode_time = best_time(lambda: codec.loads(encoded), args.repeat)
+            load_time = best_time(lambda: load_entities(codec.loads(encoded)), args.repeat)
+            print(f"{codec.name:<8}{'缩进' if pretty else '紧凑':<8}{size_mb:>10.1f}MB"
+                  f"{size_mb / encode_time:>8.0f}MB/s{size_mb / entity_time:>8.0f}MB/s"
+                  f"{size_mb / decode_time:>8.0f}MB/s{size_mb / load_time:>8.0f}MB/s")
+
+
+def run_login(args):
+    """模拟并发登录：多个请求线程同时验证密码，比较不同进程数下的吞吐量"""
+    cores = os.cpu_count() or 1
+    worker_counts = args.workers or sorted({0, 1, max(cores // 2, 1), cores})
+    salt = secrets.token_hex(32)
+    print(f"📊 并发登录吞吐量（{args.logins} 次登录，{args.concurrency} 个并发请求，"
+          f"PBKDF2 {args.iterations} 次迭代，CPU核心 {cores} 个）")
+    print(f"{'进程数':<8}{'登录/秒':>10}{'平均延迟':>12}{'P95延迟':>12}{'加速比':>10}（以第一行为基准）")
+
+    baseline = None
+    for workers in worker_counts:
+        hasher = PasswordHasher(workers=workers, max_pending=args.concurrency, timeout=600)
+        try:
+            # 预热：启动全部工作进程
+            with ThreadPoolExecutor(max(workers, 1)) as pool:
+                list(pool.map(lambda _: hasher.derive('warmup1', salt, 1), range(max(workers, 1))))
+
+            def login(_):
+                started = time.perf_counter()
+                hasher.derive('password123', salt, args.iterations)
+                return time.perf_counter() - started
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                latencies = sorted(pool.map(login, range(args.logins)))
+            elapsed = time.perf_counter() - started
+        finally:
+            hasher.close()
+
+        rate = args.logins / elapsed
+        baseline = baseline or rate
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        label = '线程内' if workers == 0 else str(workers)
+        print(f"{label:<8}{rate:>10.1f}{sum(latencies) / len(latencies) * 1000:>10.0f}ms"
+              f"{p95 * 1000:>10.0f}ms{rate / baseline:>9.2f}x")
+
+
+def run_pbkdf2(args):
+    """各迭代次数下单次验证的耗时和每个CPU核心每秒可处理的登录次数"""
+    settings = sorted(set(args.iterations) | {configured_iterations(args.data_dir)})
+    print(f"📊 密码验证成本（取 {args.samples} 次中最快的一次，当前设置 {configured_iterations(args.data_dir)} 次迭代）")
+    print(f"{'哈希方式':<24}{'单次验证':>12}{'登录/秒/核':>14}")
+
+    legacy = best_time(lambda: hashlib.sha256(b'password123').hexdigest(), args.samples)
+    print(f"{'SHA-256（旧格式，无salt）':<24}{legacy * 1000:>10.3f}ms{1 / legacy:>14.0f}")
+    for iterations in settings:
+        elapsed = measure_derive(iterations, args.samples)
+        print(f"{'PBKDF2 ' + str(iterations):<24}{elapsed * 1000:>10.1f}ms{1 / elapsed:>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='数据层性能基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    memory_parser = subparsers.add_parser('memory', help='比较dict与紧凑实体的内存占用')
+    memory_parser.add_argument('--count', type=int, default=100000, help='每类数据条数（默认: 100000）')
+
+    json_parser = subparsers.add_parser('json', help='比较各JSON实现和格式的编解码速度与文件大小（dict和实体）')
+    json_parser.add_argument('--count', type=int, default=50000, help='每类数据条数（默认: 50000）')
+    json_parser.add_argument('--repeat', type=int, default=3, help='重复次数（默认: 3）')
+
+    login_parser = subparsers.add_parser('login', help='测量不同密码哈希进程数下的并发登录吞吐量')
+    login_parser.add_argument('--logins', type=int, default=64, help='登录次数（默认: 64）')
+    login_parser.add_argument('--concurrency', type=int, default=16, help='并发请求数（默认: 16）')
+    login_parser.add_argument('--iterations', type=int, default=PBKDF2_ITERATIONS,
+                              help=f'PBKDF2迭代次数（默认: {PBKDF2_ITERATIONS}）')
+    login_parser.add_argument('--workers', type=int, nargs='+', help='要测试的进程数（默认: 0、1、一半核心数、全部核心数）')
+
+    pbkdf2_parser = subparsers.add_parser('pbkdf2', help='测量各迭代次数下每个CPU核心的登录处理能力')
+    pbkdf2_parser.add_argument('--iterations', type=int, nargs='+', default=[100000, 210000, 310000, 600000],
+                               help='要测试的迭代次数（默认: 100000 210000 310000 600000，另加当前设置）')
+    pbkdf2_parser.add_argument('--samples', type=int, default=3, help='每个设置的测量次数（默认: 3）')
+    pbkdf2_parser.add_argument('--data-dir', default='database', help='读取当前设置的数据目录（默认: database）')
+
+    args = parser.parse_args()
+    if args.command == 'memory':
+        run_memory(args)
+    elif args.command == 'json':
+        run_json(args)
+    elif args.command == 'login':
+        run_login(args)
+    elif args.command == 'pbkdf2':
+        run_pbkdf2(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+连接读取保护
+每个连接由一个线程处理，客户端缓慢发送请求头，或者声明了很大的 Content-Length 却迟迟不发送请求体时，
+处理线程会一直阻塞在读取上。这里替换请求处理类的 rfile，所有读取都经过期限检查：
+
+- 请求头：收到请求的第一个字节后，必须在 PM_HEADER_TIMEOUT 秒（默认10）内收完全部请求头
+- 请求头大小：请求行和请求头合计不超过 MAX_HEADER_BYTES，请求头不超过 MAX_HEADERS 行，超出时返回431
+- 请求体：开始读取后有 PM_BODY_GRACE 秒（默认10）的宽限时间，之后平均速度不能低于
+  PM_MIN_BODY_RATE 字节/秒（默认10240），否则断开连接
+- 写入：发送响应时单次写入最长等待 PM_WRITE_TIMEOUT 秒（默认30），客户端不读取响应时不会无限阻塞
+
+空闲的长连接等待下一个请求的时间仍由请求处理类的 timeout 控制。
+因超时或超限被断开的连接按原因计数，可通过 /api/connections 查看。
+"""
+
+import http.client
+import os
+import threading
+import time
+
+HEADER_TIMEOUT = float(os.environ.get('PM_HEADER_TIMEOUT', 10))
+BODY_GRACE = float(os.environ.get('PM_BODY_GRACE', 10))
+MIN_BODY_RATE = float(os.environ.get('PM_MIN_BODY_RATE', 10 * 1024))
+WRITE_TIMEOUT = float(os.environ.get('PM_WRITE_TIMEOUT', 30))
+
+# 请求行加全部请求头的最大字节数
+MAX_HEADER_BYTES = 32 * 1024
+
+# 请求头的最大行数
+MAX_HEADERS = 64
+
+# 每次从socket读取的最大字节数
+RECV_SIZE = 64 * 1024
+
+# 断开原因
+DROP_REASONS = ('header_timeout', 'body_timeout', 'too_slow', 'header_too_large', 'too_many_headers')
+
+
+class SlowClientError(TimeoutError):
+    """客户端发送过慢，连接已不能继续使用"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class HeaderLimitError(http.client.HTTPException):
+    """请求头超出大小或行数限制"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class ConnectionStats:
+    """按原因统计被断开的连接"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dropped = dict.fromkeys(DROP_REASONS, 0)
+
+    def record(self, reason):
+        with self.lock:
+            self.dropped[reason] += 1
+
+    def snapshot(self):
+        with self.lock:
+            dropped = dict(self.dropped)
+        return {
+            'dropped': dropped,
+            'total_dropped': sum(dropped.values()),
+            'limits': {
+                'header_timeout': HEADER_TIMEOUT,
+                'body_grace': BODY_GRACE,
+                'min_body_rate': MIN_BODY_RATE,
+                'write_timeout': WRITE_TIMEOUT,
+                'max_header_bytes': MAX_HEADER_BYTES,
+                'max_headers': MAX_HEADERS
+            }
+        }
+
+
+class GuardedReader:
+    """带读取期限的socket读取器，提供请求处理类用到的 readline/read"""
+
+    def __init__(self, sock, stats, idle_timeout):
+        self.sock = sock
+        self.stats = stats
+        self.idle_timeout = idle_timeout
+        self.buffer = bytearray()
+        self.eof = False
+        self.failed = False
+        self.closed = False
+        self.start_request()
+
+    def start_request(self):
+        """开始等待下一个请求"""
+        # idle 等待请求 -> headers 读取请求头 -> request 请求头已读完 -> body 读取请求体
+        self.phase = 'idle'
+        # 收到请求第一个字节的时间，用于计算请求耗时
+        self.request_started = None
+        self.header_deadline = None
+        self.header_bytes = 0
+        self.header_lines = 0
+
+    def start_body(self):
+        """开始读取请求体，按最低速度计算期限"""
+        self.phase = 'body'
+        self.body_started = time.monotonic()
+        self.body_received = len(self.buffer)
+
+    def begin_headers(self):
+        self.phase = 'headers'
+        self.request_started = time.monotonic()
+        self.header_deadline = self.request_started + HEADER_TIMEOUT
+
+    def fail(self, reason):
+        self.failed = True
+        self.stats.record(reason)
+        raise SlowClientError(reason)
+
+    def recv_timeout(self):
+        """本次读取最长的等待时间，以及超时时的断开原因（None表示空闲超时，不计为慢速客户端）"""
+        now = time.monotonic()
+        if self.phase == 'headers':
+            return self.header_deadline - now, 'header_timeout'
+        if self.phase == 'body':
+            # 宽限时间之后，已收到的字节数不能少于 (经过时间 - 宽限时间) × 最低速度
+            deadline = self.body_started + BODY_GRACE + (self.body_received + 1) / MIN_BODY_RATE
+            return deadline - now, 'too_slow' if self.body_received else 'body_timeout'
+        return self.idle_timeout, None
+
+    def fill(self):
+        """从socket读取一次，连接关闭时返回False"""
+        if self.failed:
+            raise SlowClientError('connection already dropped')
+        if self.eof:
+            return False
+        timeout, reason = self.recv_timeout()
+        if timeout is not None and timeout <= 0:
+            self.fail(reason)
+        self.sock.settimeout(timeout)
+        try:
+            data = self.sock.recv(RECV_SIZE)
+        except TimeoutError:
+            if reason is None:
+                raise
+            self.fail(reason)
+        finally:
+            # 读取之外的时间（发送响应）使用写入超时
+            self.sock.settimeout(WRITE_TIMEOUT)
+        if not data:
+            self.eof = True
+            return False
+        if self.phase == 'idle':
+            self.begin_headers()
+        elif self.phase == 'body':
+            self.body_received += len(data)
+        self.buffer += data
+        return True
+
+    def readline(self, limit=-1):
+        while True:
+            end = self.buffer.find(b'\n')
+            if 0 <= limit <= len(self.buffer) and (end < 0 or end >= limit):
+                size = limit
+                break
+            if end >= 0:
+                size = end + 1
+                break
+            if not self.fill():
+                size = len(self.buffer)
+                break
+        line = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        if self.phase == 'idle' and line:
+            # 上一个请求之后已经缓冲了下一个请求的数据
+            self.begin_headers()
+        if self.phase == 'headers':
+            self.count_header_line(line)
+        return line
+
+    def count_header_line(self, line):
+        self.header_bytes += len(line)
+        self.header_lines += 1
+        if self.header_bytes > MAX_HEADER_BYTES:
+            self.failed = True
+            self.stats.record('header_too_large')
+            raise HeaderLimitError('header_too_large')
+        if self.header_lines > MAX_HEADERS + 1:
+            self.failed = True
+            self.stats.record('too_many_headers')
+            raise HeaderLimitError('too_many_headers')
+        if line in (b'\r\n', b'\n') and self.header_lines > 1:
+            self.phase = 'request'
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            while self.fill():
+                pass
+            size = len(self.buffer)
+        while len(self.buffer) < size and self.fill():
+            pass
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def close(self):
+        self.closed = True
+        self.buffer.clear()
+
+
+_stats = ConnectionStats()
+
+
+def get_connection_stats():
+    """获取进程内共享的连接统计"""
+    return _stats
+
+
+def guard_connection(sock, idle_timeout):
+    """为连接创建带读取期限的读取器"""
+    sock.settimeout(WRITE_TIMEOUT)
+    return GuardedReader(sock, _stats, idle_timeout)
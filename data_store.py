@@ -0,0 +1,598 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据存储层
+在内存中缓存plans/projects/tasks/records四类数据，统一负责读取、保存和批量操作，
+并在每次数据变化时增量维护各类索引
+"""
+
+import os
+import stat
+import tempfile
+import threading
+from collections.abc import Mapping
+
+import json_codec
+from access_log import get_access_log
+from entities import from_json
+from schemas import validate_item
+
+access_log = get_access_log()
+
+DATA_TYPES = ['plans', 'projects', 'tasks', 'records']
+
+# 数据类型 -> (父级字段, 父级数据类型)
+PARENT_FIELDS = {
+    'projects': ('planId', 'plans'),
+    'tasks': ('projectId', 'projects'),
+    'records': ('taskId', 'tasks'),
+}
+
+# 父级数据类型 -> 子级数据类型
+CHILD_TYPES = {parent_type: child_type for child_type, (_, parent_type) in PARENT_FIELDS.items()}
+
+# 按月分区存储的数据类型 -> 分区依据的时间字段
+# 分区文件为 <数据目录>/<数据类型>/YYYY-MM.json，没有合法时间的数据放在 undated.json
+PARTITION_FIELDS = {
+    'records': 'uploadDate',
+}
+UNDATED_PARTITION = 'undated'
+
+# 单次批量请求允许的最大操作数
+MAX_BATCH_OPERATIONS = 1000
+
+# 是否把数据保存为紧凑的实体对象（见entities.py）：内存占用减少约四成，但加载和编码明显变慢，
+# 默认保存为dict，内存紧张时设置 PM_COMPACT_ENTITIES=1 启用
+COMPACT_ENTITIES = os.environ.get('PM_COMPACT_ENTITIES', '') not in ('', '0')
+
+
+def create_temp_file(path):
+    """在目标文件所在目录创建唯一的临时文件，返回 (文件对象, 临时文件路径)
+
+    同时写入同一个文件的线程（如提交和快照）各自使用不同的临时文件，不会互相覆盖；
+    目标文件已存在时沿用它的权限
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    try:
+        os.chmod(temp_path, stat.S_IMODE(os.stat(path).st_mode))
+    except FileNotFoundError:
+        pass
+    return os.fdopen(fd, 'wb'), temp_path
+
+
+class BatchError(Exception):
+    """批量操作中的单个操作执行失败"""
+
+
+class WorkingIds:
+    """工作区中某类数据的id集合视图，用于批量操作中的引用检查"""
+
+    def __init__(self, store, working, data_type):
+        self.store = store
+        self.working = working
+        self.data_type = data_type
+
+    def __contains__(self, item_id):
+        return self.store.working_item(self.working, self.data_type, item_id) is not None
+
+
+class StoreIndex:
+    """索引基类，由DataStore在数据变化时逐条通知"""
+
+    def __init__(self, store):
+        self.store = store
+        self.reset()
+
+    def __getstate__(self):
+        # 写入快照时不保存所属的数据存储，加载后由快照模块重新关联
+        state = self.__dict__.copy()
+        state.pop('store', None)
+        return state
+
+    def reset(self):
+        """清空索引"""
+
+    def on_add(self, data_type, item):
+        """新增一条数据"""
+
+    def on_remove(self, data_type, item):
+        """删除一条数据"""
+
+    def on_update(self, data_type, old_item, new_item):
+        """修改一条数据，默认按先删除再新增处理"""
+        self.on_remove(data_type, old_item)
+        self.on_add(data_type, new_item)
+
+
+class DataStore:
+    """单个数据目录的内存数据存储"""
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.lock = threading.RLock()
+        self.collections = {}
+        self.by_id = {}
+        self.mtimes = {}
+        self.indexes = {}
+        # 数据每次被替换（加载、提交、外部修改后重新读取）时递增，供缓存判断数据是否变化
+        self.generation = 0
+        # 数据类型 -> 编码后的JSON字节，数据被替换时失效
+        self.encoded_cache = {}
+        self.compact = COMPACT_ENTITIES
+
+    def get_data_path(self, data_type):
+        """获取数据文件路径"""
+        return os.path.join(self.data_dir, f"{data_type}.json")
+
+    def get_partition_dir(self, data_type):
+        """获取分区存储目录"""
+        return os.path.join(self.data_dir, data_type)
+
+    def get_partition_path(self, data_type, partition):
+        """获取分区文件路径"""
+        return os.path.join(self.get_partition_dir(data_type), f"{partition}.json")
+
+    def partition_of(self, data_type, item):
+        """计算数据所属的分区（YYYY-MM）"""
+        value = item.get(PARTITION_FIELDS[data_type]) if isinstance(item, Mapping) else None
+        if isinstance(value, str) and len(value) >= 7 and value[:4].isdigit() and value[4] == '-' and value[5:7].isdigit():
+            return value[:7]
+        return UNDATED_PARTITION
+
+    def list_partitions(self, data_type):
+        """列出已有的分区名称，按时间顺序排列"""
+        try:
+            names = os.listdir(self.get_partition_dir(data_type))
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in names if name.endswith('.json'))
+
+    def file_mtime(self, data_type):
+        """获取数据文件的修改时间，文件不存在时返回None；分区存储返回全部分区文件的修改时间"""
+        if data_type in PARTITION_FIELDS:
+            signature = []
+            for path in [self.get_data_path(data_type)] + [
+                self.get_partition_path(data_type, partition) for partition in self.list_partitions(data_type)
+            ]:
+                try:
+                    signature.append((path, os.stat(path).st_mtime_ns))
+                except FileNotFoundError:
+                    continue
+            return tuple(signature)
+        try:
+            return os.stat(self.get_data_path(data_type)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def read_json_list(self, path):
+        """读取一个JSON数组文件，不存在或格式错误时返回空列表"""
+        try:
+            data = json_codec.read_file(path)
+        except (FileNotFoundError, ValueError):
+            return []
+        return data if isinstance(data, list) else []
+
+    def read_file(self, data_type):
+        """从文件读取数据"""
+        if data_type not in PARTITION_FIELDS:
+            return self.read_json_list(self.get_data_path(data_type))
+
+        items = []
+        for partition in self.list_partitions(data_type):
+            items.extend(self.read_json_list(self.get_partition_path(data_type, partition)))
+
+        if os.path.exists(self.get_data_path(data_type)):
+            items = self.migrate_to_partitions(data_type, items)
+        return items
+
+    def migrate_to_partitions(self, data_type, items):
+        """把旧的单文件数据合并进分区存储，旧文件重命名为 .migrated 保留"""
+        legacy_path = self.get_data_path(data_type)
+        known_ids = {item.get('id') for item in items if isinstance(item, dict)}
+        merged = list(items)
+        for item in self.read_json_list(legacy_path):
+            if not isinstance(item, dict) or item.get('id') not in known_ids:
+                merged.append(item)
+
+        if len(merged) != len(items):
+            writes, _ = self.partition_writes(data_type, items, merged)
+            self.write_files(writes)
+        os.replace(legacy_path, f"{legacy_path}.migrated")
+        access_log.event('info', 'partitions_migrated', data_type=data_type, directory=self.get_partition_dir(data_type))
+        return self.read_file(data_type)
+
+    def group_partitions(self, data_type, items):
+        """把数据按分区分组"""
+        partitions = {}
+        for item in items:
+            partitions.setdefault(self.partition_of(data_type, item), []).append(item)
+        return partitions
+
+    def partition_writes(self, data_type, old_items, new_items):
+        """比较新旧数据，只返回内容发生变化的分区文件和需要删除的空分区文件"""
+        old_partitions = self.group_partitions(data_type, old_items)
+        new_partitions = self.group_partitions(data_type, new_items)
+        writes = {}
+        for partition, items in new_partitions.items():
+            if old_partitions.get(partition) != items:
+                writes[self.get_partition_path(data_type, partition)] = items
+        removals = [
+            self.get_partition_path(data_type, partition)
+            for partition in old_partitions if partition not in new_partitions
+        ]
+        return writes, removals
+
+    def write_files(self, writes):
+        """写入一组文件：先写全部临时文件，再逐个原子替换"""
+        temp_paths = {}
+        try:
+            for path, items in writes.items():
+                os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                f, temp_paths[path] = create_temp_file(path)
+                with f:
+                    f.write(json_codec.dumps_file(items))
+                    f.flush()
+                    os.fsync(f.fileno())
+        except Exception:
+            for temp_path in temp_paths.values():
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            raise
+
+        for path, temp_path in temp_paths.items():
+            os.replace(temp_path, path)
+
+    def load(self, data_type):
+        """获取数据，文件在外部被修改时自动重新加载"""
+        with self.lock:
+            mtime = self.file_mtime(data_type)
+            if data_type not in self.collections or self.mtimes.get(data_type) != mtime:
+                items = self.read_file(data_type)
+                if data_type in PARTITION_FIELDS:
+                    # 读取时可能完成了旧文件迁移，重新获取分区文件的修改时间
+                    mtime = self.file_mtime(data_type)
+                self.set_collection(data_type, items)
+                self.mtimes[data_type] = mtime
+            return self.collections[data_type]
+
+    def load_all(self):
+        """获取全部四类数据"""
+        with self.lock:
+            return {data_type: self.load(data_type) for data_type in DATA_TYPES}
+
+    def get_item(self, data_type, item_id):
+        """按id获取单条数据"""
+        with self.lock:
+            self.load(data_type)
+            return self.by_id[data_type].get(item_id)
+
+    def to_entities(self, data_type, items):
+        """启用 PM_COMPACT_ENTITIES 时把JSON数据转换为紧凑的实体对象（见entities.py），否则保持dict"""
+        if not self.compact:
+            return list(items)
+        return [from_json(data_type, item) for item in items]
+
+    def encoded(self, data_type):
+        """某类数据编码后的JSON字节，数据没有变化时直接返回上次编码的结果"""
+        with self.lock:
+            items = self.load(data_type)
+            data = self.encoded_cache.get(data_type)
+            if data is None:
+                data = self.encoded_cache[data_type] = json_codec.dumps(items)
+            return data
+
+    def set_collection(self, data_type, items):
+        """替换某类数据，并把新旧数据按id比较后的差异通知给各索引"""
+        items = self.to_entities(data_type, items)
+        old_by_id = self.by_id.get(data_type, {})
+        new_by_id = {}
+        for item in items:
+            if isinstance(item, Mapping) and item.get('id'):
+                new_by_id[item['id']] = item
+
+        self.collections[data_type] = items
+        self.generation += 1
+        self.encoded_cache.pop(data_type, None)
+        self.by_id[data_type] = new_by_id
+
+        if not self.indexes:
+            return
+
+        removed = [item for item_id, item in old_by_id.items() if item_id not in new_by_id]
+        added = []
+        updated = []
+        for item_id, item in new_by_id.items():
+            old_item = old_by_id.get(item_id)
+            if old_item is None:
+                added.append(item)
+            elif old_item is not item and old_item != item:
+                updated.append((old_item, item))
+
+        for index in self.indexes.values():
+            for item in removed:
+                index.on_remove(data_type, item)
+            for old_item, item in updated:
+                index.on_update(data_type, old_item, item)
+            for item in added:
+                index.on_add(data_type, item)
+
+    def get_index(self, index_class):
+        """获取索引，首次使用时按当前数据构建，之后随数据变化增量维护"""
+        with self.lock:
+            self.load_all()
+            index = self.indexes.get(index_class)
+            if index is None:
+                index = index_class(self)
+                for data_type in DATA_TYPES:
+                    for item in self.by_id[data_type].values():
+                        index.on_add(data_type, item)
+                self.indexes[index_class] = index
+            return index
+
+    def save(self, data_type, items):
+        """保存单类数据"""
+        self.commit({data_type: items})
+
+    def commit(self, changes):
+        """将多类数据作为一次提交写入磁盘
+
+        先写入全部临时文件，再逐个原子替换，任何一步写入失败都不会留下半新半旧的数据文件；
+        分区存储的数据只重写内容有变化的分区
+        """
+        with self.lock:
+            changes = {data_type: self.to_entities(data_type, items) for data_type, items in changes.items()}
+            writes = {}
+            removals = []
+            for data_type, items in changes.items():
+                if data_type in PARTITION_FIELDS:
+                    partition_writes, partition_removals = self.partition_writes(
+                        data_type, self.load(data_type), items)
+                    writes.update(partition_writes)
+                    removals.extend(partition_removals)
+                else:
+                    writes[self.get_data_path(data_type)] = items
+
+            self.write_files(writes)
+            for path in removals:
+                if os.path.exists(path):
+                    os.remove(path)
+
+            for data_type, items in changes.items():
+                self.set_collection(data_type, items)
+                self.mtimes[data_type] = self.file_mtime(data_type)
+
+    def apply_batch(self, operations):
+        """原子地执行一组批量操作
+
+        所有修改先记录在工作区（id -> 新数据，删除记为None），只有全部成功时才作为一次提交保存。
+        返回 (是否全部成功, 每个操作的结果列表)
+        """
+        with self.lock:
+            self.load_all()
+            working = {}
+            results = []
+
+            for index, operation in enumerate(operations):
+                try:
+                    result = self.apply_operation(working, operation)
+                    result.update({'index': index, 'success': True})
+                except BatchError as e:
+                    result = {'index': index, 'success': False, 'error': str(e)}
+                results.append(result)
+
+            success = all(result['success'] for result in results)
+            if success and working:
+                changes = {}
+                for data_type, overlay in working.items():
+                    items = []
+                    for item in self.collections[data_type]:
+                        item_id = item.get('id') if isinstance(item, Mapping) else None
+                        if item_id in overlay:
+                            if overlay[item_id] is not None:
+                                items.append(overlay[item_id])
+                        else:
+                            items.append(item)
+                    changes[data_type] = items
+                self.commit(changes)
+            return success, results
+
+    def working_item(self, working, data_type, item_id):
+        """获取工作区中某条数据的当前值，已删除或不存在时返回None"""
+        overlay = working.get(data_type, {})
+        if item_id in overlay:
+            return overlay[item_id]
+        return self.by_id[data_type].get(item_id)
+
+    def working_children(self, working, child_type, parent_id):
+        """获取工作区中某个父级的全部子数据id"""
+        parent_field, _ = PARENT_FIELDS[child_type]
+        references = self.get_index(ReferenceIndex)
+        candidates = dict.fromkeys(references.children_of(child_type, parent_id))
+        for child_id, child in working.get(child_type, {}).items():
+            if child is not None and child.get(parent_field) == parent_id:
+                candidates[child_id] = None
+
+        children = []
+        for child_id in candidates:
+            child = self.working_item(working, child_type, child_id)
+            if child is not None and child.get(parent_field) == parent_id:
+                children.append(child_id)
+        return children
+
+    def apply_operation(self, working, operation):
+        """在工作区上执行单个操作"""
+        if not isinstance(operation, dict):
+            raise BatchError('操作格式错误')
+
+        op = operation.get('op')
+        data_type = operation.get('type')
+        item_id = operation.get('id')
+
+        if data_type not in DATA_TYPES:
+            raise BatchError(f'未知的数据类型: {data_type}')
+        if not item_id:
+            raise BatchError('缺少id')
+
+        current = self.working_item(working, data_type, item_id)
+        if current is None:
+            raise BatchError(f'{data_type}中不存在id为 {item_id} 的数据')
+
+        result = {'op': op, 'type': data_type, 'id': item_id}
+        overlay = working.setdefault(data_type, {})
+
+        if op == 'delete':
+            overlay[item_id] = None
+            result['cascaded'] = self.cascade_delete(working, data_type, item_id)
+            return result
+
+        item = dict(current)
+
+        if op == 'status':
+            status = operation.get('status')
+            if not isinstance(status, str) or not status:
+                raise BatchError('缺少status')
+            item['status'] = status
+        elif op == 'patch':
+            fields = operation.get('fields')
+            if not isinstance(fields, dict) or not fields:
+                raise BatchError('缺少fields')
+            if 'id' in fields and fields['id'] != item_id:
+                raise BatchError('不允许修改id')
+            item.update(fields)
+        elif op == 'move':
+            if data_type not in PARENT_FIELDS:
+                raise BatchError(f'{data_type}不支持移动')
+            parent_field, parent_type = PARENT_FIELDS[data_type]
+            target = operation.get('to', '')
+            # 任务必须属于某个项目，项目和记录可以不关联父级
+            if target or data_type == 'tasks':
+                if self.working_item(working, parent_type, target) is None:
+                    raise BatchError(f'{parent_type}中不存在id为 {target} 的数据')
+            item[parent_field] = target
+        else:
+            raise BatchError(f'未知的操作: {op}')
+
+        # 只校验本次修改的字段，修改的引用字段（如patch改projectId）按工作区中的数据检查是否存在
+        changed = set(fields) if op == 'patch' else {'status'} if op == 'status' else set()
+        known_ids = {ref_type: WorkingIds(self, working, ref_type) for ref_type in DATA_TYPES}
+        errors = [error for error in validate_item(data_type, item, known_ids) if error['field'] in changed]
+        if errors:
+            raise BatchError('；'.join(f"{error['field']}: {error['message']}" for error in errors))
+
+        overlay[item_id] = item
+        result['item'] = item
+        return result
+
+    def cascade_delete(self, working, data_type, item_id):
+        """删除后的级联处理，规则与前端保持一致，只访问受影响的子数据
+
+        删除计划：关联项目解除关联，计划中的项目改为进行中
+        删除项目：删除其全部任务
+        删除任务：关联记录解除关联
+        """
+        affected = []
+        child_type = CHILD_TYPES.get(data_type)
+        if child_type is None:
+            return affected
+
+        parent_field, _ = PARENT_FIELDS[child_type]
+        overlay = working.setdefault(child_type, {})
+        for child_id in self.working_children(working, child_type, item_id):
+            if data_type == 'projects':
+                overlay[child_id] = None
+                affected.append({'type': child_type, 'id': child_id, 'action': 'delete'})
+                affected.extend(self.cascade_delete(working, child_type, child_id))
+            else:
+                child = dict(self.working_item(working, child_type, child_id))
+                child[parent_field] = ''
+                if data_type == 'plans' and child.get('status') == 'planning':
+                    child['status'] = 'active'
+                overlay[child_id] = child
+                affected.append({'type': child_type, 'id': child_id, 'action': 'unlink'})
+        return affected
+
+
+class ReferenceIndex(StoreIndex):
+    """计划→项目→任务→记录的反向索引"""
+
+    def reset(self):
+        # 子级数据类型 -> {父级id: {子级id: None}}，用dict保持插入顺序
+        self.children = {child_type: {} for child_type in PARENT_FIELDS}
+
+    def on_add(self, data_type, item):
+        if data_type not in PARENT_FIELDS:
+            return
+        parent_id = item.get(PARENT_FIELDS[data_type][0])
+        if parent_id:
+            self.children[data_type].setdefault(parent_id, {})[item['id']] = None
+
+    def on_remove(self, data_type, item):
+        if data_type not in PARENT_FIELDS:
+            return
+        parent_id = item.get(PARENT_FIELDS[data_type][0])
+        siblings = self.children[data_type].get(parent_id)
+        if siblings is not None:
+            siblings.pop(item['id'], None)
+            if not siblings:
+                del self.children[data_type][parent_id]
+
+    def on_update(self, data_type, old_item, new_item):
+        if data_type not in PARENT_FIELDS:
+            return
+        parent_field = PARENT_FIELDS[data_type][0]
+        if old_item.get(parent_field) != new_item.get(parent_field):
+            self.on_remove(data_type, old_item)
+            self.on_add(data_type, new_item)
+
+    def children_of(self, child_type, parent_id):
+        """获取父级下全部子数据的id"""
+        with self.store.lock:
+            return list(self.children[child_type].get(parent_id, ()))
+
+    def get_children(self, parent_type, parent_id):
+        """获取父级下的全部子数据，父级不存在时返回None"""
+        with self.store.lock:
+            if self.store.get_item(parent_type, parent_id) is None:
+                return None
+            child_type = CHILD_TYPES[parent_type]
+            by_id = self.store.by_id[child_type]
+            return [by_id[child_id] for child_id in self.children_of(child_type, parent_id)]
+
+    def check_integrity(self):
+        """找出引用了不存在父级的数据"""
+        with self.store.lock:
+            orphans = []
+            for child_type, (parent_field, parent_type) in PARENT_FIELDS.items():
+                parents = self.store.by_id[parent_type]
+                for parent_id, child_ids in self.children[child_type].items():
+                    if parent_id in parents:
+                        continue
+                    for child_id in child_ids:
+                        orphans.append({
+                            'type': child_type,
+                            'id': child_id,
+                            'field': parent_field,
+                            'missing': parent_id
+                        })
+            return orphans
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(data_dir):
+    """获取数据目录对应的共享数据存储"""
+    key = os.path.abspath(data_dir)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = DataStore(data_dir)
+        return _stores[key]
+
+
+def release_store(data_dir):
+    """从共享表中移除数据目录对应的数据存储，返回被移除的存储（不存在时返回None）"""
+    key = os.path.abspath(data_dir)
+    with _stores_lock:
+        return _stores.pop(key, None)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日期索引
+截止日期索引：项目deadline和任务dueDate组成的有序列表，按日期范围二分查找
+时间线索引：计划startDate~endDate组成的区间树，查询与某个时间段重叠的计划
+
+两者都随数据变化增量维护，查询耗时为 O(log n + 结果数)
+"""
+
+import bisect
+import random
+import re
+from datetime import date
+
+from data_store import StoreIndex
+
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}')
+
+# 数据类型 -> 截止日期字段
+DEADLINE_FIELDS = {'projects': 'deadline', 'tasks': 'dueDate'}
+
+
+def parse_date(value):
+    """取合法日期字符串的YYYY-MM-DD部分，格式不符或不是真实存在的日期（如2025-13-01）时返回None"""
+    if not isinstance(value, str) or not DATE_PATTERN.match(value):
+        return None
+    try:
+        date.fromisoformat(value[:10])
+    except ValueError:
+        return None
+    return value[:10]
+
+
+def plan_interval(plan):
+    """获取计划的 (开始日期, 结束日期)，只有一端时视为单日计划"""
+    start = parse_date(plan.get('startDate'))
+    end = parse_date(plan.get('endDate'))
+    if start is None and end is None:
+        return None
+    start = start or end
+    end = end or start
+    if end < start:
+        start, end = end, start
+    return start, end
+
+
+class IntervalNode:
+    __slots__ = ('key', 'priority', 'max_end', 'left', 'right')
+
+    def __init__(self, key):
+        self.key = key
+        self.priority = random.random()
+        self.max_end = key[1]
+        self.left = None
+        self.right = None
+
+    def update(self):
+        self.max_end = self.key[1]
+        if self.left is not None and self.left.max_end > self.max_end:
+            self.max_end = self.left.max_end
+        if self.right is not None and self.right.max_end > self.max_end:
+            self.max_end = self.right.max_end
+
+
+class IntervalTree:
+    """以 (开始, 结束, id) 为键的treap，节点记录子树最大结束日期"""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def rotate_right(self, node):
+        child = node.left
+        node.left = child.right
+        child.right = node
+        node.update()
+        child.update()
+        return child
+
+    def rotate_left(self, node):
+        child = node.right
+        node.right = child.left
+        child.left = node
+        node.update()
+        child.update()
+        return child
+
+    def insert(self, key):
+        self.root = self._insert(self.root, key)
+        self.size += 1
+
+    def _insert(self, node, key):
+        if node is None:
+            return IntervalNode(key)
+        if key < node.key:
+            node.left = self._insert(node.left, key)
+            if node.left.priority > node.priority:
+                return self.rotate_right(node)
+        else:
+            node.right = self._insert(node.right, key)
+            if node.right.priority > node.priority:
+                return self.rotate_left(node)
+        node.update()
+        return node
+
+    def remove(self, key):
+        self.root, removed = self._remove(self.root, key)
+        if removed:
+            self.size -= 1
+
+    def _remove(self, node, key):
+        if node is None:
+            return None, False
+        if key < node.key:
+            node.left, removed = self._remove(node.left, key)
+        elif key > node.key:
+            node.right, removed = self._remove(node.right, key)
+        else:
+            if node.left is None:
+                return node.right, True
+            if node.right is None:
+                return node.left, True
+            # 把优先级较高的子节点转上来，再在下面继续删除
+            if node.left.priority > node.right.priority:
+                node = self.rotate_right(node)
+                node.right, removed = self._remove(node.right, key)
+            else:
+                node = self.rotate_left(node)
+                node.left, removed = self._remove(node.left, key)
+        node.update()
+        return node, removed
+
+    def overlapping(self, start, end):
+        """按开始日期顺序返回与 [start, end] 重叠的全部键"""
+        result = []
+        self._overlapping(self.root, start, end, result)
+        return result
+
+    def _overlapping(self, node, start, end, result):
+        if node is None or node.max_end < start:
+            return
+        self._overlapping(node.left, start, end, result)
+        if node.key[0] <= end:
+            if node.key[1] >= start:
+                result.append(node.key)
+            self._overlapping(node.right, start, end, result)
+
+
+class DateIndex(StoreIndex):
+    """截止日期索引和计划时间线索引"""
+
+    def reset(self):
+        # 有序列表，元素为 (日期, 数据类型, id)
+        self.deadlines = []
+        self.plan_intervals = IntervalTree()
+
+    def on_add(self, data_type, item):
+        if data_type == 'plans':
+            interval = plan_interval(item)
+            if interval:
+                self.plan_intervals.insert(interval + (item['id'],))
+        elif data_type in DEADLINE_FIELDS:
+            deadline = parse_date(item.get(DEADLINE_FIELDS[data_type]))
+            if deadline:
+                bisect.insort(self.deadlines, (deadline, data_type, item['id']))
+
+    def on_remove(self, data_type, item):
+        if data_type == 'plans':
+            interval = plan_interval(item)
+            if interval:
+                self.plan_intervals.remove(interval + (item['id'],))
+        elif data_type in DEADLINE_FIELDS:
+            deadline = parse_date(item.get(DEADLINE_FIELDS[data_type]))
+            if deadline:
+                entry = (deadline, data_type, item['id'])
+                position = bisect.bisect_left(self.deadlines, entry)
+                if position < len(self.deadlines) and self.deadlines[position] == entry:
+                    del self.deadlines[position]
+
+    def on_update(self, data_type, old_item, new_item):
+        if data_type == 'plans':
+            changed = plan_interval(old_item) != plan_interval(new_item)
+        elif data_type in DEADLINE_FIELDS:
+            field = DEADLINE_FIELDS[data_type]
+            changed = parse_date(old_item.get(field)) != parse_date(new_item.get(field))
+        else:
+            changed = False
+        if changed:
+            self.on_remove(data_type, old_item)
+            self.on_add(data_type, new_item)
+
+    def due_between(self, start=None, end=None, include_completed=False):
+        """获取截止日期在 [start, end] 之间的项目和任务，start/end为None表示不限"""
+        with self.store.lock:
+            low = 0 if start is None else bisect.bisect_left(self.deadlines, (start,))
+            high = len(self.deadlines) if end is None else bisect.bisect_left(self.deadlines, (end + '\x00',))
+            result = []
+            for deadline, data_type, item_id in self.deadlines[low:high]:
+                item = self.store.by_id[data_type].get(item_id)
+                if item is None:
+                    continue
+                if not include_completed and item.get('status') == 'completed':
+                    continue
+                result.append({'type': data_type, 'date': deadline, 'item': item})
+            return result
+
+    def plans_overlapping(self, start, end):
+        """获取时间段与 [start, end] 重叠的计划"""
+        with self.store.lock:
+            plans = self.store.by_id['plans']
+            return [plans[key[2]] for key in self.plan_intervals.overlapping(start, end) if key[2] in plans]
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+紧凑的数据实体
+设置 PM_COMPACT_ENTITIES=1 后，内存中的计划、项目、任务、记录不再以dict保存，而是使用带 __slots__ 的实体对象
+（节省内存，但加载和编码比dict慢，默认不启用）：
+
+- 已知字段保存在固定槽位中，不需要每条数据一个哈希表；未知字段放在extra中原样保留
+- 状态、分类、优先级等取值有限的字段使用驻留字符串，所有数据共享同一个对象
+- 前端 toISOString() 生成的时间（YYYY-MM-DDTHH:MM:SS.mmmZ）以毫秒整数保存，读取时还原为原字符串；
+  数据中原本就是整数的时间不做转换
+
+实体实现了只读的Mapping接口（get、[]、in、keys、items），索引和查询代码无需区分dict和实体。
+与JSON之间的转换只在边界进行：from_json 在数据进入数据存储时调用；
+编码前由 to_plain 把数据列表中的实体批量转换为dict（json_codec中自动进行），
+to_json 作为 json.dump/json.dumps 的 default 参数兜底处理嵌套在其他位置的实体。
+"""
+
+import re
+import sys
+from collections.abc import Mapping
+from datetime import datetime, timedelta
+from functools import lru_cache
+from operator import attrgetter
+
+
+class _Missing:
+    """缺失字段的占位值，与值为None的字段区分；pickle时按名称引用，加载后仍是同一个对象"""
+
+    def __reduce__(self):
+        return 'MISSING'
+
+    def __repr__(self):
+        return 'MISSING'
+
+
+MISSING = _Missing()
+
+# 取值有限的字段，使用驻留字符串
+ENUM_FIELDS = {'status', 'category', 'priority', 'type', 'color'}
+
+# 日期字段（YYYY-MM-DD），重复度高，同样驻留
+DATE_FIELDS = {'startDate', 'endDate', 'deadline', 'dueDate'}
+
+# 时间戳字段，符合toISOString格式时以毫秒整数保存
+TIMESTAMP_FIELDS = {'createdAt', 'updatedAt', 'uploadDate', 'completedAt'}
+
+TIMESTAMP_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}Z$')
+EPOCH = datetime(1970, 1, 1)
+MILLISECOND = timedelta(milliseconds=1)
+
+
+class _Timestamp(int):
+    """由encode_timestamp转换得到的毫秒整数
+
+    与数据中原本就是整数的时间（如旧数据中的毫秒时间戳）区分，只有这种整数在读取时还原为字符串，
+    原本的整数原样保留。
+    """
+    __slots__ = ()
+
+
+def encode_timestamp(value):
+    """把toISOString格式的时间转为毫秒整数，格式不符时原样返回"""
+    if not isinstance(value, str) or not TIMESTAMP_PATTERN.match(value):
+        return value
+    try:
+        return _Timestamp((datetime.fromisoformat(value[:23]) - EPOCH) // MILLISECOND)
+    except ValueError:
+        return value
+
+
+@lru_cache(maxsize=4096)
+def day_prefix(days):
+    """1970-01-01之后第days天的 "YYYY-MM-DDT"，同一天的时间共用"""
+    return (EPOCH + timedelta(days=days)).date().isoformat() + 'T'
+
+
+def decode_timestamp(value):
+    """把encode_timestamp得到的毫秒整数还原为toISOString格式的时间，其他值原样返回"""
+    if type(value) is not _Timestamp:
+        return value
+    seconds, milliseconds = divmod(value, 1000)
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return '%s%02d:%02d:%02d.%03dZ' % (day_prefix(days), hours, minutes, seconds, milliseconds)
+
+
+def intern_text(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def field_encoder(field):
+    """字段保存到槽位前的转换，不需要转换时返回None"""
+    if field in TIMESTAMP_FIELDS:
+        return encode_timestamp
+    if field in ENUM_FIELDS or field in DATE_FIELDS:
+        return intern_text
+    return None
+
+
+class Entity(Mapping):
+    """实体基类，子类通过FIELDS声明已知字段"""
+
+    __slots__ = ('extra',)
+    FIELDS = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.FIELD_SET = frozenset(cls.FIELDS)
+        # 槽位描述符的__set__，绕过只读检查直接赋值
+        cls.SLOT_SETTERS = tuple(getattr(cls, field).__set__ for field in cls.FIELDS)
+        cls.SLOT_ENCODERS = tuple(
+            (field, set_slot, field_encoder(field)) for field, set_slot in zip(cls.FIELDS, cls.SLOT_SETTERS)
+        )
+        # 一次取出全部槽位的值，以及需要还原的时间戳字段，供to_dict使用
+        cls.SLOT_VALUES = attrgetter(*cls.FIELDS)
+        cls.TIMESTAMP_SLOTS = tuple(field for field in cls.FIELDS if field in TIMESTAMP_FIELDS)
+
+    def __init__(self, data):
+        known = 0
+        for field, set_slot, encode in self.SLOT_ENCODERS:
+            value = data.get(field, MISSING)
+            if value is not MISSING:
+                known += 1
+                if encode is not None:
+                    value = encode(value)
+            set_slot(self, value)
+        extra = None
+        if known < len(data):
+            extra = {field: value for field, value in data.items() if field not in self.FIELD_SET}
+        object.__setattr__(self, 'extra', extra)
+
+    def __setattr__(self, name, value):
+        raise TypeError('实体是只读的，请用 dict(实体) 复制后修改')
+
+    def __getitem__(self, field):
+        if field in self.FIELD_SET:
+            value = getattr(self, field)
+            if value is MISSING:
+                raise KeyError(field)
+            return decode_timestamp(value) if field in TIMESTAMP_FIELDS else value
+        if self.extra is not None and field in self.extra:
+            return self.extra[field]
+        raise KeyError(field)
+
+    def get(self, field, default=None):
+        if field in self.FIELD_SET:
+            value = getattr(self, field)
+            if value is MISSING:
+                return default
+            return decode_timestamp(value) if field in TIMESTAMP_FIELDS else value
+        if self.extra is not None:
+            return self.extra.get(field, default)
+        return default
+
+    def __contains__(self, field):
+        if field in self.FIELD_SET:
+            return getattr(self, field) is not MISSING
+        return self.extra is not None and field in self.extra
+
+    def __iter__(self):
+        for field in self.FIELDS:
+            if getattr(self, field) is not MISSING:
+                yield field
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self):
+        count = sum(1 for field in self.FIELDS if getattr(self, field) is not MISSING)
+        return count + (len(self.extra) if self.extra is not None else 0)
+
+    def __eq__(self, other):
+        if type(other) is type(self):
+            # 时间字段还要比较类型：原本的整数与转换得到的整数数值相同，但写出的JSON不同
+            return all(
+                getattr(self, field) == getattr(other, field) for field in self.FIELDS
+            ) and all(
+                type(getattr(self, field)) is type(getattr(other, field)) for field in self.TIMESTAMP_SLOTS
+            ) and (self.extra or None) == (other.extra or None)
+        return Mapping.__eq__(self, other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def __reduce__(self):
+        # 直接保存槽位中的值，快照加载时不必重新解析时间
+        return (restore_entity, (type(self), tuple(getattr(self, field) for field in self.FIELDS), self.extra))
+
+    def to_dict(self):
+        """转换为普通dict，时间字段还原为原字符串"""
+        data = {field: value for field, value in zip(self.FIELDS, self.SLOT_VALUES(self)) if value is not MISSING}
+        for field in self.TIMESTAMP_SLOTS:
+            if field in data:
+                data[field] = decode_timestamp(data[field])
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+class Plan(Entity):
+    __slots__ = FIELDS = (
+        'id', 'name', 'description', 'category', 'status',
+        'startDate', 'endDate', 'color', 'image', 'createdAt', 'updatedAt'
+    )
+
+
+class Project(Entity):
+    __slots__ = FIELDS = (
+        'id', 'planId', 'name', 'description', 'category', 'status', 'priority',
+        'deadline', 'color', 'image', 'createdAt', 'updatedAt'
+    )
+
+
+class Task(Entity):
+    __slots__ = FIELDS = (
+        'id', 'projectId', 'name', 'description', 'status', 'priority',
+        'dueDate', 'createdAt', 'updatedAt', 'completedAt'
+    )
+
+
+class Record(Entity):
+    __slots__ = FIELDS = (
+        'id', 'taskId', 'projectId', 'name', 'description', 'size', 'type',
+        'path', 'uploadDate'
+    )
+
+
+ENTITY_TYPES = {
+    'plans': Plan,
+    'projects': Project,
+    'tasks': Task,
+    'records': Record,
+}
+
+
+def restore_entity(entity_class, values, extra):
+    """按槽位值重建实体（pickle使用）"""
+    entity = object.__new__(entity_class)
+    for set_slot, value in zip(entity_class.SLOT_SETTERS, values):
+        set_slot(entity, value)
+    object.__setattr__(entity, 'extra', extra)
+    return entity
+
+
+def from_json(data_type, item):
+    """把JSON解析出的dict转换为实体；已是实体或不是dict时原样返回"""
+    entity_class = ENTITY_TYPES.get(data_type)
+    if entity_class is None or type(item) is not dict:
+        return item
+    return entity_class(item)
+
+
+def to_plain(obj):
+    """编码前批量展开实体：实体列表以及 {数据类型: 实体列表} 中的实体一次转换为dict
+
+    编码器对每个无法识别的对象回调一次default，逐条回调的开销比转换本身还大，
+    在编码前用列表推导式转换可以让编码器只处理原生的dict和list。其他位置的实体仍由to_json处理。
+    """
+    if type(obj) is list:
+        if obj and isinstance(obj[0], Entity):
+            return [item.to_dict() if isinstance(item, Entity) else item for item in obj]
+        return obj
+    if type(obj) is dict:
+        return {key: to_plain(value) if type(value) is list else value for key, value in obj.items()}
+    if isinstance(obj, Entity):
+        return obj.to_dict()
+    return obj
+
+
+def to_json(value):
+    """json.dump/json.dumps 的 default 参数，把实体转换为可序列化的dict"""
+    if isinstance(value, Entity):
+        return value.to_dict()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
@@ -5,9 +5,10 @@
 从init_data.json初始化数据库文件
 """
 
-import json
 import os
 
+import json_codec
+
 def init_database():
     """初始化数据库"""
     database_dir = "database"
@@ -18,16 +19,17 @@ def init_database():
         return False
 
     # 读取初始化数据
-    with open(init_file, 'r', encoding='utf-8') as f:
-        init_data = json.load(f)
+    init_data = json_codec.read_file(init_file)
 
     # 创建各种数据文件
     for data_type in ['plans', 'projects', 'tasks', 'records']:
         data_file = os.path.join(database_dir, f"{data_type}.json")
 
-        if not os.path.exists(data_file):
-            with open(data_file, 'w', encoding='utf-8') as f:
-                json.dump(init_data[data_type], f, ensure_ascii=False, indent=2)
+        # 记录已迁移为按月分区存储（database/records/目录）
+        if os.path.isdir(os.path.join(database_dir, data_type)):
+            print(f"⚠️  {data_type}/ 分区目录已存在，跳过")
+        elif not os.path.exists(data_file):
+            json_codec.write_file(data_file, init_data[data_type])
             print(f"✅ 创建 {data_type}.json")
         else:
             print(f"⚠️  {data_type}.json 已存在，跳过")
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSON编解码
+所有数据文件、会话文件和HTTP响应都通过这里读写JSON，底层实现可替换：
+
+    stdlib   Python标准库json，始终可用
+    orjson   安装了orjson时使用，编解码速度快数倍
+
+默认（auto）有orjson就用orjson，否则用标准库；可用环境变量 PM_JSON_CODEC=stdlib|orjson|auto 指定。
+写入磁盘默认使用紧凑格式（无缩进和多余空格），需要便于人工查看时设置 PM_JSON_PRETTY=1 使用2空格缩进。
+两种格式、两种实现读写的文件完全兼容。
+"""
+
+import json
+import os
+
+from entities import to_json, to_plain
+
+
+class StdlibCodec:
+    """标准库json"""
+
+    name = 'stdlib'
+
+    def dumps(self, obj, pretty=False):
+        obj = to_plain(obj)
+        if pretty:
+            text = json.dumps(obj, ensure_ascii=False, indent=2, default=to_json)
+        else:
+            text = json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=to_json)
+        return text.encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    """orjson，输出即为UTF-8字节"""
+
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+
+    def dumps(self, obj, pretty=False):
+        obj = to_plain(obj)
+        try:
+            return self.orjson.dumps(obj, default=to_json, option=self.orjson.OPT_INDENT_2 if pretty else 0)
+        except TypeError:
+            # 超出orjson支持范围的数据（如超过64位的整数、非字符串的键）退回标准库
+            return STDLIB_CODEC.dumps(obj, pretty)
+
+    def loads(self, data):
+        return self.orjson.loads(data)
+
+
+STDLIB_CODEC = StdlibCodec()
+
+CODEC_CLASSES = {
+    'stdlib': StdlibCodec,
+    'orjson': OrjsonCodec,
+}
+
+
+def available_codecs():
+    """当前环境中可用的全部实现"""
+    codecs = []
+    for codec_class in CODEC_CLASSES.values():
+        try:
+            codecs.append(STDLIB_CODEC if codec_class is StdlibCodec else codec_class())
+        except ImportError:
+            continue
+    return codecs
+
+
+def create_codec(name='auto'):
+    """按名称创建实现，auto或指定的库未安装时选择可用的最快实现"""
+    if name in CODEC_CLASSES and name != 'stdlib':
+        try:
+            return CODEC_CLASSES[name]()
+        except ImportError:
+            print(f"⚠️  未安装 {name}，使用标准库json")
+            return STDLIB_CODEC
+    if name == 'stdlib':
+        return STDLIB_CODEC
+    return available_codecs()[-1]
+
+
+codec = create_codec(os.environ.get('PM_JSON_CODEC', 'auto'))
+
+# 磁盘文件是否使用缩进格式
+PRETTY_FILES = os.environ.get('PM_JSON_PRETTY', '') not in ('', '0')
+
+
+def dumps(obj):
+    """编码为紧凑的UTF-8字节，用于HTTP响应和归档行"""
+    return codec.dumps(obj)
+
+
+def dumps_file(obj):
+    """按磁盘文件格式编码为UTF-8字节"""
+    return codec.dumps(obj, pretty=PRETTY_FILES)
+
+
+def loads(data):
+    """解码str或UTF-8字节，格式错误时抛出json.JSONDecodeError（ValueError的子类）"""
+    return codec.loads(data)
+
+
+def read_file(path):
+    """读取JSON文件"""
+    with open(path, 'rb') as f:
+        return codec.loads(f.read())
+
+
+def write_file(path, obj):
+    """写入JSON文件"""
+    with open(path, 'wb') as f:
+        f.write(dumps_file(obj))
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+登录频率限制
+取代原来每次登录固定等待500ms的做法：正常登录不再占用处理线程的时间，暴力破解由以下规则拦截：
+
+- 令牌桶：每个IP、每个（用户名, IP）组合各有一个令牌桶，每次登录尝试消耗一个令牌，令牌按固定速率恢复
+- 失败锁定：同一IP或同一（用户名, IP）连续失败达到阈值后锁定，锁定时间从30秒开始，每多失败一次翻倍，最长1小时；
+  一段时间内没有再失败则失败次数清零，登录成功时立即清零
+- 分布式猜测：同一用户名的失败来自 USERNAME_LOCKOUT_IPS 个以上不同IP时，才锁定该用户名（对所有IP生效）
+- 定期清理：令牌已恢复满、没有锁定和失败记录的条目会被移除，内存占用与活跃的IP/用户名数量成正比
+
+取舍：只按用户名锁定时，任何人故意输错几次密码就能把 admin 锁在门外。按（用户名, IP）锁定后，
+攻击者只能锁住自己的IP；代价是换IP的猜测不会被单个用户名的计数拦住，所以当失败来自多个IP时仍会锁定用户名——
+这时拥有足够多IP的攻击者仍能锁住某个账户，但单个IP做不到。
+
+全部状态只保存在内存中，服务器重启后重新计数。
+"""
+
+import threading
+import time
+
+# 令牌桶：容量（允许的连续尝试次数）和每秒恢复的令牌数
+IP_BUCKET_CAPACITY = 20
+IP_REFILL_RATE = 20 / 60
+ACCOUNT_BUCKET_CAPACITY = 10
+ACCOUNT_REFILL_RATE = 10 / 60
+
+# 连续失败多少次后开始锁定，以及锁定时长（秒）
+LOCKOUT_THRESHOLD = 5
+LOCKOUT_BASE_SECONDS = 30
+LOCKOUT_MAX_SECONDS = 3600
+
+# 同一用户名的失败来自多少个不同IP时锁定该用户名
+USERNAME_LOCKOUT_IPS = 5
+
+# 超过这段时间（秒）没有失败，失败次数清零
+FAILURE_RESET_SECONDS = 15 * 60
+
+# 清理间隔（秒）
+SWEEP_INTERVAL = 60
+
+
+class LimiterEntry:
+    """单个IP、（用户名, IP）或用户名的状态"""
+
+    __slots__ = ('tokens', 'updated', 'failures', 'last_failure', 'locked_until', 'ips')
+
+    def __init__(self, capacity, now):
+        self.tokens = capacity
+        self.updated = now
+        self.failures = 0
+        self.last_failure = 0.0
+        self.locked_until = 0.0
+        # 用户名条目：最近失败来自的IP（最多记录USERNAME_LOCKOUT_IPS个）
+        self.ips = None
+
+
+def lockout_seconds(failures):
+    return min(LOCKOUT_MAX_SECONDS, LOCKOUT_BASE_SECONDS * 2 ** min(failures - LOCKOUT_THRESHOLD, 16))
+
+
+class LoginLimiter:
+    """按IP和用户名限制登录尝试"""
+
+    # 键的种类 -> (令牌桶容量, 每秒恢复的令牌数)；用户名条目只用于分布式猜测的锁定，没有令牌桶
+    BUCKETS = {
+        'ip': (IP_BUCKET_CAPACITY, IP_REFILL_RATE),
+        'account': (ACCOUNT_BUCKET_CAPACITY, ACCOUNT_REFILL_RATE),
+        'username': (0, 0.0),
+    }
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.last_sweep = clock()
+
+    def keys(self, ip, username):
+        """有令牌桶和失败锁定的键：IP，以及（用户名, IP）"""
+        return [('ip', ip), ('account', username.lower(), ip)]
+
+    def username_key(self, username):
+        return ('username', username.lower())
+
+    def entry(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = LimiterEntry(self.BUCKETS[key[0]][0], now)
+        return entry
+
+    def refill(self, key, entry, now):
+        capacity, rate = self.BUCKETS[key[0]]
+        entry.tokens = min(capacity, entry.tokens + (now - entry.updated) * rate)
+        entry.updated = now
+
+    def acquire(self, ip, username):
+        """登录尝试前调用，允许时消耗令牌并返回0，否则返回需要等待的秒数（不消耗令牌）"""
+        with self.lock:
+            now = self.clock()
+            if now - self.last_sweep >= SWEEP_INTERVAL:
+                self.remove_idle(now)
+
+            retry_after = 0.0
+            keys = self.keys(ip, username)
+            for key in keys:
+                entry = self.entry(key, now)
+                self.refill(key, entry, now)
+                if entry.locked_until > now:
+                    retry_after = max(retry_after, entry.locked_until - now)
+                elif entry.tokens < 1:
+                    retry_after = max(retry_after, (1 - entry.tokens) / self.BUCKETS[key[0]][1])
+            user_entry = self.entries.get(self.username_key(username))
+            if user_entry is not None and user_entry.locked_until > now:
+                retry_after = max(retry_after, user_entry.locked_until - now)
+
+            if retry_after > 0:
+                return retry_after
+            for key in keys:
+                self.entries[key].tokens -= 1
+            return 0.0
+
+    def record_failure(self, ip, username):
+        """登录失败后调用，返回因此触发的锁定秒数（未锁定时为0）"""
+        with self.lock:
+            now = self.clock()
+            locked = 0.0
+            for key in self.keys(ip, username):
+                entry = self.entry(key, now)
+                if now - entry.last_failure > FAILURE_RESET_SECONDS:
+                    entry.failures = 0
+                entry.failures += 1
+                entry.last_failure = now
+                if entry.failures >= LOCKOUT_THRESHOLD:
+                    seconds = lockout_seconds(entry.failures)
+                    entry.locked_until = now + seconds
+                    locked = max(locked, seconds)
+
+            entry = self.entry(self.username_key(username), now)
+            if now - entry.last_failure > FAILURE_RESET_SECONDS or entry.ips is None:
+                entry.failures = 0
+                entry.ips = set()
+            entry.failures += 1
+            entry.last_failure = now
+            if len(entry.ips) < USERNAME_LOCKOUT_IPS:
+                entry.ips.add(ip)
+            if len(entry.ips) >= USERNAME_LOCKOUT_IPS and entry.failures >= LOCKOUT_THRESHOLD:
+                seconds = lockout_seconds(entry.failures)
+                entry.locked_until = now + seconds
+                locked = max(locked, seconds)
+            return locked
+
+    def record_success(self, ip, username):
+        """登录成功后调用，清除该（用户名, IP）和用户名的失败记录"""
+        with self.lock:
+            for key in (self.keys(ip, username)[1], self.username_key(username)):
+                entry = self.entries.get(key)
+                if entry is not None:
+                    entry.failures = 0
+                    entry.locked_until = 0.0
+                    entry.ips = None
+
+    def sweep(self):
+        """移除已经没有限制作用的条目，返回移除的数量"""
+        with self.lock:
+            return self.remove_idle(self.clock())
+
+    def remove_idle(self, now):
+        idle = []
+        for key, entry in self.entries.items():
+            capacity, rate = self.BUCKETS[key[0]]
+            refilled = entry.tokens + (now - entry.updated) * rate >= capacity
+            failures_expired = entry.failures == 0 or now - entry.last_failure > FAILURE_RESET_SECONDS
+            if refilled and failures_expired and entry.locked_until <= now:
+                idle.append(key)
+        for key in idle:
+            del self.entries[key]
+        self.last_sweep = now
+        return len(idle)
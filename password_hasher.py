@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+密码哈希进程池
+PBKDF2每次计算需要数十到上百毫秒的CPU时间，在请求线程中直接计算时，集中登录（例如服务器重启后会话失效）
+会占满处理能力。这里把计算交给独立的进程池，多个登录可以同时利用多个CPU核心：
+
+- 进程数默认为CPU核心数（PM_HASH_WORKERS，设为0时在当前线程中计算）；只有一个核心时默认为0
+- 正在计算和排队的任务总数有上限（PM_HASH_QUEUE，默认每个进程8个），超出时立即拒绝，不再无限排队
+- 单次计算等待超时（PM_HASH_TIMEOUT，默认10秒）后放弃
+
+拒绝和超时都抛出 HasherUnavailable，调用方应返回503让客户端稍后重试。
+
+迭代次数可以按本机性能校准：校准结果保存在 database/password_policy.json，新设置的密码和登录时
+自动升级的旧密码使用校准后的迭代次数，迭代次数不会低于 MIN_ITERATIONS。
+
+用法:
+    python password_hasher.py calibrate --target-ms 100   # 测量本机，选择单次验证约100ms的迭代次数
+    python password_hasher.py info                        # 查看当前设置
+"""
+
+import argparse
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+import json_codec
+
+PBKDF2_ITERATIONS = 100000
+
+# 校准结果不会低于这个迭代次数
+MIN_ITERATIONS = PBKDF2_ITERATIONS
+ITERATION_STEP = 10000
+DEFAULT_TARGET_MS = 100
+POLICY_FILE_NAME = 'password_policy.json'
+
+DEFAULT_QUEUE_PER_WORKER = 8
+DEFAULT_TIMEOUT_SECONDS = 10
+
+
+class HasherUnavailable(Exception):
+    """进程池繁忙、超时或不可用"""
+
+
+def pbkdf2_hex(password, salt, iterations):
+    """计算PBKDF2-SHA256，返回十六进制字符串（在工作进程中执行）"""
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), iterations).hex()
+
+
+def default_workers():
+    """默认进程数：CPU核心数；只有一个核心时进程池没有可并行的核心，只多出进程间通信的开销，改为在请求线程中计算"""
+    cores = os.cpu_count() or 1
+    return cores if cores > 1 else 0
+
+
+class PasswordHasher:
+    """有界的PBKDF2进程池，进程在第一次使用时启动"""
+
+    def __init__(self, workers=None, max_pending=None, timeout=None):
+        if workers is None:
+            workers = int(os.environ.get('PM_HASH_WORKERS', default_workers()))
+        if max_pending is None:
+            max_pending = int(os.environ.get('PM_HASH_QUEUE', max(workers, 1) * DEFAULT_QUEUE_PER_WORKER))
+        if timeout is None:
+            timeout = float(os.environ.get('PM_HASH_TIMEOUT', DEFAULT_TIMEOUT_SECONDS))
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                # 服务器是多线程的，使用spawn启动工作进程，避免fork时复制其他线程持有的锁
+                self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self.executor
+
+    def derive(self, password, salt, iterations=PBKDF2_ITERATIONS):
+        """计算PBKDF2-SHA256，返回十六进制字符串"""
+        if self.workers <= 0:
+            return pbkdf2_hex(password, salt, iterations)
+
+        if not self.slots.acquire(blocking=False):
+            raise HasherUnavailable('密码计算任务过多')
+        try:
+            future = self.get_executor().submit(pbkdf2_hex, password, salt, iterations)
+        except BrokenProcessPool:
+            self.slots.release()
+            self.reset()
+            raise HasherUnavailable('密码计算进程异常退出')
+        except BaseException:
+            self.slots.release()
+            raise
+        # 超时后任务可能仍在计算，直到真正结束才释放名额
+        future.add_done_callback(lambda _: self.slots.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise HasherUnavailable('密码计算超时')
+        except BrokenProcessPool:
+            self.reset()
+            raise HasherUnavailable('密码计算进程异常退出')
+
+    def reset(self):
+        """丢弃异常的进程池，下次使用时重新创建"""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def get_policy_path(data_dir):
+    return os.path.join(data_dir, POLICY_FILE_NAME)
+
+
+def read_policy(data_dir):
+    """读取校准结果，不存在或格式错误时返回None"""
+    try:
+        policy = json_codec.read_file(get_policy_path(data_dir))
+    except (FileNotFoundError, ValueError):
+        return None
+    return policy if isinstance(policy, dict) else None
+
+
+# 数据目录 -> (文件修改时间, 迭代次数)
+_iterations_cache = {}
+
+
+def configured_iterations(data_dir):
+    """新密码哈希使用的迭代次数：有校准结果时使用校准值，否则使用默认值"""
+    try:
+        mtime = os.stat(get_policy_path(data_dir)).st_mtime_ns
+    except FileNotFoundError:
+        return PBKDF2_ITERATIONS
+    cached = _iterations_cache.get(data_dir)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    iterations = PBKDF2_ITERATIONS
+    policy = read_policy(data_dir)
+    if policy is not None and isinstance(policy.get('iterations'), int):
+        iterations = max(policy['iterations'], MIN_ITERATIONS)
+    _iterations_cache[data_dir] = (mtime, iterations)
+    return iterations
+
+
+def measure_derive(iterations, samples=3):
+    """在当前线程中计算若干次，返回单次计算的最短耗时（秒）"""
+    salt = os.urandom(32).hex()
+    best = None
+    for _ in range(samples):
+        started = time.perf_counter()
+        pbkdf2_hex('calibration1', salt, iterations)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def calibrate(target_ms, samples=3):
+    """选择单次验证耗时接近target_ms的迭代次数，返回 (迭代次数, 实测耗时秒数)"""
+    per_iteration = measure_derive(PBKDF2_ITERATIONS, samples) / PBKDF2_ITERATIONS
+    iterations = int(target_ms / 1000 / per_iteration) // ITERATION_STEP * ITERATION_STEP
+    iterations = max(iterations, MIN_ITERATIONS)
+    return iterations, measure_derive(iterations, samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='密码哈希迭代次数校准')
+    parser.add_argument('--data-dir', default='database', help='数据目录（默认: database）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    calibrate_parser = subparsers.add_parser('calibrate', help='测量本机性能并保存迭代次数')
+    calibrate_parser.add_argument('--target-ms', type=float, default=DEFAULT_TARGET_MS,
+                                  help=f'单次密码验证的目标耗时（毫秒，默认: {DEFAULT_TARGET_MS}）')
+    calibrate_parser.add_argument('--dry-run', action='store_true', help='只显示结果，不保存')
+    subparsers.add_parser('info', help='查看当前迭代次数')
+    args = parser.parse_args()
+
+    if args.command == 'calibrate':
+        print(f"⏱️  正在测量本机PBKDF2性能（目标 {args.target_ms:.0f}ms）...")
+        iterations, elapsed = calibrate(args.target_ms)
+        print(f"✅ 迭代次数: {iterations}，单次验证 {elapsed * 1000:.0f}ms，单核每秒约 {1 / elapsed:.1f} 次登录")
+        if iterations == MIN_ITERATIONS and elapsed * 1000 > args.target_ms:
+            print(f"⚠️  本机在最低迭代次数 {MIN_ITERATIONS} 下已超过目标耗时")
+        if not args.dry_run:
+            json_codec.write_file(get_policy_path(args.data_dir), {
+                'algorithm': 'pbkdf2_sha256',
+                'iterations': iterations,
+                'target_ms': args.target_ms,
+                'measured_ms': round(elapsed * 1000, 1),
+                'calibrated_at': datetime.now().isoformat()
+            })
+            print(f"💾 已保存到 {get_policy_path(args.data_dir)}，用户下次登录时自动升级密码哈希")
+    elif args.command == 'info':
+        policy = read_policy(args.data_dir)
+        if policy is None:
+            print(f"📭 未校准，使用默认迭代次数 {PBKDF2_ITERATIONS}")
+        else:
+            print(f"🔐 迭代次数: {configured_iterations(args.data_dir)}（目标 {policy.get('target_ms')}ms，"
+                  f"校准时实测 {policy.get('measured_ms')}ms，校准于 {policy.get('calibrated_at')}）")
+
+
+if __name__ == "__main__":
+    main()
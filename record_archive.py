@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史记录归档
+把早期的记录从内存数据中移出，存放在按行存储的归档文件中，通过mmap按需读取
+
+文件布局（database/records_archive/）：
+    records.jsonl   每行一条记录（紧凑JSON），按上传时间排序
+    records.idx     定长偏移索引，每条为 (行偏移, 行长度, 上传时间戳)
+    summary.json    归档记录的日/周/月汇总，与记录时间序列汇总合并展示；同时记下汇总时的归档记录数，
+                    与索引不一致（写完记录后、写汇总前被中断）时根据归档记录重新生成
+
+分页和按时间范围读取只解码请求的那一段记录，常驻内存不随归档大小增长。
+"""
+
+import argparse
+import bisect
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+from collections.abc import Mapping
+from datetime import datetime, timezone
+
+from data_store import get_store
+import json_codec
+from record_rollup_index import BUCKET_KINDS, bucket_keys, record_size
+
+ARCHIVE_DIR_NAME = 'records_archive'
+
+# 索引项：偏移(uint64)、长度(uint32)、时间戳(int64)
+INDEX_ENTRY = struct.Struct('<QIq')
+
+
+def record_timestamp(record):
+    """记录上传时间的UTC时间戳，时间不合法时返回None"""
+    value = record.get('uploadDate') if isinstance(record, Mapping) else None
+    if not isinstance(value, str):
+        return None
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+def date_timestamp(value):
+    """YYYY-MM-DD 当天0点（UTC）的时间戳，不是合法日期时抛出ValueError"""
+    if not isinstance(value, str):
+        raise ValueError(f'日期格式错误: {value!r}')
+    return int(datetime.fromisoformat(value[:10]).replace(tzinfo=timezone.utc).timestamp())
+
+
+class TimestampView:
+    """把索引文件中的时间戳列暴露为可二分查找的序列"""
+
+    def __init__(self, archive):
+        self.archive = archive
+
+    def __len__(self):
+        return self.archive.count()
+
+    def __getitem__(self, position):
+        return self.archive.entry(position)[2]
+
+
+class RecordArchive:
+    """单个数据目录的记录归档"""
+
+    def __init__(self, data_dir):
+        self.directory = os.path.join(data_dir, ARCHIVE_DIR_NAME)
+        self.data_path = os.path.join(self.directory, 'records.jsonl')
+        self.index_path = os.path.join(self.directory, 'records.idx')
+        self.summary_path = os.path.join(self.directory, 'summary.json')
+        self.lock = threading.RLock()
+        self.data_map = None
+        self.index_map = None
+        self.index_size = -1
+        self.summary_cache = None
+        self.summary_mtime = None
+
+    def close(self):
+        """关闭内存映射"""
+        with self.lock:
+            for mapped in (self.data_map, self.index_map):
+                if mapped is not None:
+                    mapped.close()
+            self.data_map = None
+            self.index_map = None
+            self.index_size = -1
+
+    def map_file(self, path):
+        """只读映射文件，空文件或不存在时返回None"""
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return None
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+
+    def refresh(self):
+        """索引文件大小变化（本进程或其他进程追加了记录）时重新映射"""
+        try:
+            size = os.path.getsize(self.index_path)
+        except FileNotFoundError:
+            size = 0
+        if size != self.index_size:
+            self.close()
+            self.index_map = self.map_file(self.index_path)
+            self.data_map = self.map_file(self.data_path)
+            self.index_size = size
+
+    def count(self):
+        """归档记录数"""
+        with self.lock:
+            self.refresh()
+            return self.index_size // INDEX_ENTRY.size
+
+    def entry(self, position):
+        return INDEX_ENTRY.unpack_from(self.index_map, position * INDEX_ENTRY.size)
+
+    def read(self, position):
+        """读取并解码第position条记录"""
+        offset, length, _ = self.entry(position)
+        return json_codec.loads(self.data_map[offset:offset + length])
+
+    def read_range(self, start, stop):
+        with self.lock:
+            self.refresh()
+            return [self.read(position) for position in range(start, stop)]
+
+    def page(self, page=1, limit=50, newest_first=True):
+        """分页读取，默认最新的记录在前"""
+        with self.lock:
+            total = self.count()
+            start = max(page - 1, 0) * limit
+            stop = min(start + limit, total)
+            if start >= stop:
+                records = []
+            elif newest_first:
+                records = [self.read(total - 1 - position) for position in range(start, stop)]
+            else:
+                records = [self.read(position) for position in range(start, stop)]
+            return {'total': total, 'page': page, 'limit': limit, 'records': records}
+
+    def between(self, start=None, end=None, offset=0, limit=50):
+        """读取上传日期在 [start, end]（YYYY-MM-DD）之间的记录，按时间顺序；日期不合法时抛出ValueError"""
+        start_time = date_timestamp(start) if start else None
+        end_time = date_timestamp(end) + 86400 if end else None
+        with self.lock:
+            timestamps = TimestampView(self)
+            low = bisect.bisect_left(timestamps, start_time) if start_time is not None else 0
+            high = bisect.bisect_left(timestamps, end_time) if end_time is not None else len(timestamps)
+            first = low + offset
+            last = min(first + limit, high)
+            records = self.read_range(first, last) if first < last else []
+            return {'total': max(high - low, 0), 'offset': offset, 'limit': limit, 'records': records}
+
+    def repair(self):
+        """截掉数据文件中没有对应索引项的尾部（追加过程中被中断时产生）"""
+        count = self.count()
+        expected = 0
+        if count:
+            offset, length, _ = self.entry(count - 1)
+            expected = offset + length
+        if os.path.exists(self.data_path) and os.path.getsize(self.data_path) > expected:
+            self.close()
+            with open(self.data_path, 'r+b') as f:
+                f.truncate(expected)
+
+    def archived_ids(self, start_time, end_time):
+        """上传时间在 [start_time, end_time] 之间的已归档记录的id"""
+        with self.lock:
+            timestamps = TimestampView(self)
+            low = bisect.bisect_left(timestamps, start_time)
+            high = bisect.bisect_right(timestamps, end_time)
+            return {record.get('id') for record in self.read_range(low, high) if isinstance(record, Mapping)}
+
+    def append(self, records, project_of=None):
+        """追加记录，返回实际归档的记录数
+
+        只归档有合法uploadDate的记录，id已经在归档中的记录跳过（上次归档后、从数据中删除前被中断）。
+        新记录早于已有记录时整体重写以保持时间顺序。
+        project_of(record) 返回记录所属项目id，用于汇总。
+        """
+        entries = []
+        for record in records:
+            timestamp = record_timestamp(record)
+            if timestamp is not None:
+                entries.append((timestamp, record))
+        if not entries:
+            return 0
+        entries.sort(key=lambda entry: entry[0])
+
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            self.repair()
+            if self.read_summary().get('count', 0) != self.count():
+                self.rebuild_summary(project_of)
+
+            archived = self.archived_ids(entries[0][0], entries[-1][0])
+            entries = [entry for entry in entries if entry[1].get('id') is None or entry[1].get('id') not in archived]
+            if not entries:
+                return 0
+
+            count = self.count()
+            last_timestamp = self.entry(count - 1)[2] if count else None
+
+            if last_timestamp is not None and entries[0][0] < last_timestamp:
+                existing = [(self.entry(position)[2], self.read(position)) for position in range(count)]
+                merged = sorted(existing + entries, key=lambda entry: entry[0])
+                self.close()
+                self.write_entries(merged, rewrite=True)
+            else:
+                self.write_entries(entries, rewrite=False)
+
+            self.refresh()
+            self.update_summary([record for _, record in entries], project_of)
+            return len(entries)
+
+    def write_entries(self, entries, rewrite):
+        """写入数据和索引，先写数据再写索引，中断时由repair截掉多余数据"""
+        if rewrite:
+            data_path = f"{self.data_path}.tmp"
+            index_path = f"{self.index_path}.tmp"
+            mode = 'wb'
+            offset = 0
+        else:
+            data_path = self.data_path
+            index_path = self.index_path
+            mode = 'ab'
+            offset = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+
+        index_entries = bytearray()
+        with open(data_path, mode) as data_file:
+            for timestamp, record in entries:
+                line = json_codec.dumps(record) + b'\n'
+                data_file.write(line)
+                index_entries += INDEX_ENTRY.pack(offset, len(line) - 1, timestamp)
+                offset += len(line)
+            data_file.flush()
+            os.fsync(data_file.fileno())
+
+        with open(index_path, mode) as index_file:
+            index_file.write(index_entries)
+            index_file.flush()
+            os.fsync(index_file.fileno())
+
+        if rewrite:
+            os.replace(data_path, self.data_path)
+            os.replace(index_path, self.index_path)
+
+    def read_summary(self):
+        """读取汇总文件：{"count": 汇总时的归档记录数, "scopes": 各范围的汇总}"""
+        try:
+            mtime = os.stat(self.summary_path).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if self.summary_cache is None or mtime != self.summary_mtime:
+            self.summary_cache = json_codec.read_file(self.summary_path)
+            self.summary_mtime = mtime
+        return self.summary_cache
+
+    def load_summary(self):
+        """读取归档汇总：{"范围类型:范围id": {时间桶类型: {时间桶键: [记录数, 文件大小]}}}"""
+        return self.read_summary().get('scopes', {})
+
+    def rebuild_summary(self, project_of):
+        """根据全部归档记录重新生成汇总"""
+        with self.lock:
+            self.update_summary(self.read_range(0, self.count()), project_of, base={})
+
+    def update_summary(self, records, project_of, base=None):
+        """把records计入汇总后与当前归档记录数一起写入汇总文件"""
+        summary = json_codec.loads(json_codec.dumps(self.load_summary() if base is None else base))
+        for record in records:
+            keys = bucket_keys(record.get('uploadDate'))
+            if keys is None:
+                continue
+            scopes = ['all:']
+            project_id = record.get('projectId') or (project_of(record) if project_of else None)
+            if project_id:
+                scopes.append(f'projects:{project_id}')
+            if record.get('taskId'):
+                scopes.append(f"tasks:{record['taskId']}")
+            for scope in scopes:
+                scope_buckets = summary.setdefault(scope, {kind: {} for kind in BUCKET_KINDS})
+                for kind, key in keys.items():
+                    entry = scope_buckets[kind].setdefault(key, [0, 0])
+                    entry[0] += 1
+                    entry[1] += record_size(record)
+
+        temp_path = f"{self.summary_path}.tmp"
+        json_codec.write_file(temp_path, {'count': self.count(), 'scopes': summary})
+        os.replace(temp_path, self.summary_path)
+
+    def summary(self, kind, scope=('all', ''), start=None, end=None):
+        """获取归档记录在某个范围内的时间桶列表，格式与RecordRollupIndex.summary相同"""
+        with self.lock:
+            buckets = self.load_summary().get(f'{scope[0]}:{scope[1]}', {}).get(kind, {})
+            low = bucket_keys(start)[kind] if start else None
+            high = bucket_keys(end)[kind] if end else None
+            return [
+                {'key': key, 'count': buckets[key][0], 'size': buckets[key][1]}
+                for key in sorted(buckets)
+                if (low is None or key >= low) and (high is None or key <= high)
+            ]
+
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def get_archive(data_dir):
+    """获取数据目录对应的共享归档"""
+    key = os.path.abspath(data_dir)
+    with _archives_lock:
+        if key not in _archives:
+            _archives[key] = RecordArchive(data_dir)
+        return _archives[key]
+
+
+def archive_before(data_dir, month):
+    """把上传月份早于month（YYYY-MM）的记录移入归档，返回归档数量
+
+    先写归档再从数据文件中删除，中途中断不会丢失记录；重新运行时已归档的记录不会重复归档，只从数据中删除
+    """
+    store = get_store(data_dir)
+    archive = get_archive(data_dir)
+    with store.lock:
+        records = store.load('records')
+        store.load('tasks')
+        tasks = store.by_id['tasks']
+        cold = [
+            record for record in records
+            if isinstance(record, Mapping) and record_timestamp(record) is not None
+            and record['uploadDate'][:7] < month
+        ]
+        if not cold:
+            return 0
+
+        def project_of(record):
+            return (tasks.get(record.get('taskId')) or {}).get('projectId')
+
+        archived = archive.append(cold, project_of)
+        cold_ids = {id(record) for record in cold}
+        store.save('records', [record for record in records if id(record) not in cold_ids])
+        return archived
+
+
+def main():
+    parser = argparse.ArgumentParser(description='历史记录归档工具')
+    parser.add_argument('--data-dir', default='database', help='数据目录（默认: database）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    archive_parser = subparsers.add_parser('archive', help='归档早于指定月份的记录')
+    archive_parser.add_argument('--before', required=True, help='月份，格式 YYYY-MM')
+
+    subparsers.add_parser('info', help='查看归档状态')
+
+    args = parser.parse_args()
+
+    if args.command == 'archive':
+        if not re.match(r'^\d{4}-\d{2}$', args.before):
+            print("❌ 月份格式错误，应为 YYYY-MM")
+            sys.exit(1)
+        count = archive_before(args.data_dir, args.before)
+        print(f"✅ 已归档 {count} 条记录")
+    elif args.command == 'info':
+        archive = get_archive(args.data_dir)
+        total = archive.count()
+        print(f"📦 归档目录: {os.path.abspath(archive.directory)}")
+        print(f"📄 归档记录数: {total}")
+        if total:
+            first = archive.read_range(0, 1)[0]
+            last = archive.read_range(total - 1, total)[0]
+            print(f"🕐 时间范围: {first.get('uploadDate')} ~ {last.get('uploadDate')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+记录时间序列汇总索引
+按上传时间（uploadDate）把记录汇总为日、周、月三种时间桶，分别统计全部记录、
+每个项目和每个任务的记录数与文件大小，随数据变化增量维护。
+
+记录所属的项目取记录自身的projectId，没有时取所属任务（taskId）的projectId。
+"""
+
+from datetime import date
+
+from data_store import StoreIndex
+
+BUCKET_KINDS = ['day', 'week', 'month']
+
+# 汇总范围：全部记录 / 项目 / 任务
+SCOPE_ALL = ('all', '')
+
+
+def bucket_keys(value):
+    """计算时间对应的各时间桶键，时间不合法时返回None"""
+    if not isinstance(value, str):
+        return None
+    try:
+        day = date.fromisoformat(value[:10])
+    except ValueError:
+        return None
+    iso_year, iso_week, _ = day.isocalendar()
+    return {
+        'day': day.isoformat(),
+        'week': f'{iso_year}-W{iso_week:02d}',
+        'month': day.isoformat()[:7]
+    }
+
+
+def merge_buckets(*bucket_lists):
+    """合并多个时间桶列表（如内存中的记录和归档记录），按时间顺序返回"""
+    merged = {}
+    for buckets in bucket_lists:
+        for bucket in buckets:
+            entry = merged.setdefault(bucket['key'], [0, 0])
+            entry[0] += bucket['count']
+            entry[1] += bucket['size']
+    return [{'key': key, 'count': merged[key][0], 'size': merged[key][1]} for key in sorted(merged)]
+
+
+def record_size(record):
+    size = record.get('size')
+    return size if isinstance(size, (int, float)) and not isinstance(size, bool) else 0
+
+
+class RecordRollupIndex(StoreIndex):
+    """记录的日/周/月汇总"""
+
+    def reset(self):
+        # (范围类型, 范围id) -> {时间桶类型: {时间桶键: [记录数, 文件大小]}}
+        self.buckets = {}
+        # 任务id -> 项目id
+        self.task_projects = {}
+        # 任务id -> {记录id: 记录}，任务换项目时用来调整项目汇总
+        self.task_records = {}
+
+    def record_project(self, record):
+        return record.get('projectId') or self.task_projects.get(record.get('taskId'))
+
+    def apply_scope(self, record, scope, sign):
+        """把记录计入（sign=1）或移出（sign=-1）某个范围的全部时间桶"""
+        keys = bucket_keys(record.get('uploadDate'))
+        if keys is None:
+            return
+        size = record_size(record)
+        scope_buckets = self.buckets.setdefault(scope, {kind: {} for kind in BUCKET_KINDS})
+        for kind, key in keys.items():
+            entry = scope_buckets[kind].setdefault(key, [0, 0])
+            entry[0] += sign
+            entry[1] += sign * size
+            if entry[0] <= 0:
+                del scope_buckets[kind][key]
+        if not scope_buckets['month']:
+            del self.buckets[scope]
+
+    def apply_record(self, record, sign):
+        self.apply_scope(record, SCOPE_ALL, sign)
+        project_id = self.record_project(record)
+        if project_id:
+            self.apply_scope(record, ('projects', project_id), sign)
+        task_id = record.get('taskId')
+        if task_id:
+            self.apply_scope(record, ('tasks', task_id), sign)
+
+    def move_task_records(self, task_id, old_project_id, new_project_id):
+        """任务换项目时，把其下没有自带projectId的记录从旧项目汇总移到新项目汇总"""
+        if old_project_id == new_project_id:
+            return
+        for record in self.task_records.get(task_id, {}).values():
+            if record.get('projectId'):
+                continue
+            if old_project_id:
+                self.apply_scope(record, ('projects', old_project_id), -1)
+            if new_project_id:
+                self.apply_scope(record, ('projects', new_project_id), 1)
+
+    def track_record(self, record, sign):
+        task_id = record.get('taskId')
+        if not task_id:
+            return
+        if sign > 0:
+            self.task_records.setdefault(task_id, {})[record['id']] = record
+        else:
+            records = self.task_records.get(task_id)
+            if records is not None:
+                records.pop(record['id'], None)
+                if not records:
+                    del self.task_records[task_id]
+
+    def on_add(self, data_type, item):
+        if data_type == 'records':
+            self.apply_record(item, 1)
+            self.track_record(item, 1)
+        elif data_type == 'tasks':
+            project_id = item.get('projectId') or None
+            self.move_task_records(item['id'], None, project_id)
+            self.task_projects[item['id']] = project_id
+
+    def on_remove(self, data_type, item):
+        if data_type == 'records':
+            self.apply_record(item, -1)
+            self.track_record(item, -1)
+        elif data_type == 'tasks':
+            project_id = self.task_projects.pop(item['id'], None)
+            self.move_task_records(item['id'], project_id, None)
+
+    def on_update(self, data_type, old_item, new_item):
+        if data_type == 'records':
+            fields = ('uploadDate', 'size', 'taskId', 'projectId')
+            if any(old_item.get(field) != new_item.get(field) for field in fields):
+                self.on_remove(data_type, old_item)
+                self.on_add(data_type, new_item)
+            else:
+                self.track_record(new_item, 1)
+        elif data_type == 'tasks':
+            project_id = new_item.get('projectId') or None
+            self.move_task_records(new_item['id'], self.task_projects.get(new_item['id']), project_id)
+            self.task_projects[new_item['id']] = project_id
+
+    def summary(self, kind, scope=SCOPE_ALL, start=None, end=None):
+        """获取某个范围的时间桶列表，按时间顺序排列；start/end为日期字符串，可为None"""
+        with self.store.lock:
+            buckets = self.buckets.get(scope, {}).get(kind, {})
+            low = bucket_keys(start)[kind] if start else None
+            high = bucket_keys(end)[kind] if end else None
+            result = []
+            for key in sorted(buckets):
+                if low is not None and key < low:
+                    continue
+                if high is not None and key > high:
+                    break
+                count, size = buckets[key]
+                result.append({'key': key, 'count': count, 'size': size})
+            return result
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+计划/项目进度汇总索引
+沿 计划→项目→任务 层级增量维护任务状态计数、完成率和逾期数量
+
+任务的截止日期取任务自身的dueDate，没有时取所属项目的deadline；
+未完成且截止日期早于今天的任务计为逾期。
+"""
+
+from collections import Counter
+from datetime import date
+
+from data_store import StoreIndex
+
+COMPLETED_STATUS = 'completed'
+
+
+def adjust(counter, key, delta):
+    """调整计数，归零时移除该键"""
+    if not delta:
+        return
+    counter[key] += delta
+    if counter[key] == 0:
+        del counter[key]
+
+
+def date_part(value):
+    """取日期字符串的YYYY-MM-DD部分，空值返回None"""
+    if isinstance(value, str) and len(value) >= 10:
+        return value[:10]
+    return None
+
+
+def new_rollup():
+    return {'total': 0, 'status': Counter(), 'due': Counter(), 'undated': 0, 'projects': Counter()}
+
+
+class RollupIndex(StoreIndex):
+    """项目和计划的进度汇总"""
+
+    def reset(self):
+        # 项目汇总中due只记录自带dueDate的未完成任务，undated为没有dueDate的未完成任务数；
+        # 计划汇总中due记录的是生效截止日期（任务dueDate或项目deadline）
+        self.project_rollups = {}
+        self.plan_rollups = {}
+        # 项目id -> (计划id, 截止日期)
+        self.project_info = {}
+
+    def get_rollup(self, rollups, key):
+        if key not in rollups:
+            rollups[key] = new_rollup()
+        return rollups[key]
+
+    def discard_if_empty(self, rollups, key):
+        rollup = rollups.get(key)
+        if rollup is not None and not rollup['total'] and not rollup['projects']:
+            del rollups[key]
+
+    def apply_task(self, task, sign):
+        """把单个任务计入（sign=1）或移出（sign=-1）所属项目和计划的汇总"""
+        project_id = task.get('projectId')
+        if not project_id:
+            return
+
+        status = task.get('status') or ''
+        is_open = status != COMPLETED_STATUS
+        due = date_part(task.get('dueDate'))
+
+        rollup = self.get_rollup(self.project_rollups, project_id)
+        rollup['total'] += sign
+        adjust(rollup['status'], status, sign)
+        if is_open:
+            if due:
+                adjust(rollup['due'], due, sign)
+            else:
+                rollup['undated'] += sign
+        self.discard_if_empty(self.project_rollups, project_id)
+
+        plan_id, deadline = self.project_info.get(project_id, (None, None))
+        if not plan_id:
+            return
+        plan_rollup = self.get_rollup(self.plan_rollups, plan_id)
+        plan_rollup['total'] += sign
+        adjust(plan_rollup['status'], status, sign)
+        effective_due = due or deadline
+        if is_open and effective_due:
+            adjust(plan_rollup['due'], effective_due, sign)
+        self.discard_if_empty(self.plan_rollups, plan_id)
+
+    def apply_project(self, project, sign):
+        """把项目及其全部任务的汇总计入或移出所属计划"""
+        plan_id = project.get('planId')
+        if not plan_id:
+            return
+
+        plan_rollup = self.get_rollup(self.plan_rollups, plan_id)
+        adjust(plan_rollup['projects'], project.get('status') or '', sign)
+
+        rollup = self.project_rollups.get(project['id'])
+        if rollup is not None:
+            plan_rollup['total'] += sign * rollup['total']
+            for status, count in rollup['status'].items():
+                adjust(plan_rollup['status'], status, sign * count)
+            for due, count in rollup['due'].items():
+                adjust(plan_rollup['due'], due, sign * count)
+            deadline = date_part(project.get('deadline'))
+            if deadline:
+                adjust(plan_rollup['due'], deadline, sign * rollup['undated'])
+        self.discard_if_empty(self.plan_rollups, plan_id)
+
+    def on_add(self, data_type, item):
+        if data_type == 'tasks':
+            self.apply_task(item, 1)
+        elif data_type == 'projects':
+            self.project_info[item['id']] = (item.get('planId') or None, date_part(item.get('deadline')))
+            self.apply_project(item, 1)
+
+    def on_remove(self, data_type, item):
+        if data_type == 'tasks':
+            self.apply_task(item, -1)
+        elif data_type == 'projects':
+            self.apply_project(item, -1)
+            self.project_info.pop(item['id'], None)
+
+    def on_update(self, data_type, old_item, new_item):
+        if data_type == 'tasks':
+            fields = ('projectId', 'status', 'dueDate')
+        elif data_type == 'projects':
+            fields = ('planId', 'status', 'deadline')
+        else:
+            return
+        if any(old_item.get(field) != new_item.get(field) for field in fields):
+            self.on_remove(data_type, old_item)
+            self.on_add(data_type, new_item)
+
+    def summarize(self, rollup, today, deadline=None):
+        """把内部汇总转换为接口输出格式"""
+        if rollup is None:
+            rollup = new_rollup()
+        completed = rollup['status'][COMPLETED_STATUS]
+        overdue = sum(count for due, count in rollup['due'].items() if due < today)
+        if deadline and deadline < today:
+            overdue += rollup['undated']
+        total = rollup['total']
+        return {
+            'total': total,
+            'completed': completed,
+            'status': dict(rollup['status']),
+            'completionRate': round(completed * 100 / total, 1) if total else 0,
+            'overdue': overdue
+        }
+
+    def project_rollup(self, project_id, today=None):
+        """获取单个项目的进度汇总"""
+        with self.store.lock:
+            today = today or date.today().isoformat()
+            _, deadline = self.project_info.get(project_id, (None, None))
+            return self.summarize(self.project_rollups.get(project_id), today, deadline)
+
+    def plan_rollup(self, plan_id, today=None):
+        """获取单个计划的进度汇总（含项目状态分布）"""
+        with self.store.lock:
+            today = today or date.today().isoformat()
+            rollup = self.plan_rollups.get(plan_id)
+            summary = self.summarize(rollup, today)
+            projects = rollup['projects'] if rollup else Counter()
+            summary['projectCount'] = sum(projects.values())
+            summary['projectStatus'] = dict(projects)
+            return summary
+
+    def all_rollups(self, today=None):
+        """获取全部计划和项目的进度汇总"""
+        with self.store.lock:
+            today = today or date.today().isoformat()
+            return {
+                'plans': {plan_id: self.plan_rollup(plan_id, today) for plan_id in self.store.by_id['plans']},
+                'projects': {project_id: self.project_rollup(project_id, today) for project_id in self.store.by_id['projects']}
+            }
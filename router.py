@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求路由表与中间件链
+路由在模块加载时注册并编译一次：固定路径放在 (方法, 路径) 字典中一次查找，带参数的路径按注册顺序逐个匹配正则。
+中间件链在创建路由表时组合好，请求到来时只需查表后调用，不再逐个比较 if/elif 分支。
+
+中间件的签名为 middleware(handler, route, args, next_call)，可以在调用 next_call(handler, route, args)
+之前检查或拒绝请求（如认证），之后处理结果（如计时），或者捕获异常（如错误映射）。
+"""
+
+import re
+from urllib.parse import parse_qs, urlparse
+
+
+class Route:
+    """一条路由：处理函数为请求处理类上未绑定的方法，args为固定参数"""
+    __slots__ = ('method', 'path', 'pattern', 'target', 'name', 'args', 'auth', 'query', 'compress')
+
+    def __init__(self, method, path, target, args=(), auth=True, query=False, compress=True):
+        self.method = method
+        self.path = path
+        # 包含正则分组的路径，如 /api/(plans|projects)/([^/]+)
+        self.pattern = re.compile(f'^{path}$') if '(' in path else None
+        self.target = target
+        self.name = target.__name__
+        self.args = tuple(args)
+        self.auth = auth
+        self.query = query
+        self.compress = compress
+
+
+def call_target(handler, route, args):
+    """中间件链的最后一环：调用路由的处理函数"""
+    return route.target(handler, *args)
+
+
+def build_pipeline(middlewares, endpoint=call_target):
+    """把中间件依次包在处理函数外面，返回 call(handler, route, args)，列表中的第一个中间件最先执行"""
+    call = endpoint
+    for middleware in reversed(middlewares):
+        call = wrap(middleware, call)
+    return call
+
+
+def wrap(middleware, next_call):
+    def call(handler, route, args):
+        return middleware(handler, route, args, next_call)
+    return call
+
+
+class Router:
+    """按方法和路径查找路由"""
+
+    def __init__(self, middlewares=()):
+        self.pipeline = build_pipeline(list(middlewares))
+        self.exact = {}
+        self.patterns = []
+        self.fallbacks = {}
+
+    def add(self, method, path, target, **options):
+        route = Route(method, path, target, **options)
+        if route.pattern is None:
+            self.exact[(method, path)] = route
+        else:
+            self.patterns.append(route)
+        return route
+
+    def fallback(self, method, target, **options):
+        """没有匹配的路由时使用的处理函数，路径作为参数传入"""
+        route = Route(method, '*', target, **options)
+        self.fallbacks[method] = route
+        return route
+
+    def match(self, method, path):
+        """返回 (路由, 路径参数)，没有匹配时返回 (None, ())"""
+        route = self.exact.get((method, path))
+        if route is not None:
+            return route, ()
+        for route in self.patterns:
+            if route.method == method:
+                match = route.pattern.match(path)
+                if match:
+                    return route, match.groups()
+        route = self.fallbacks.get(method)
+        if route is not None:
+            return route, (path,)
+        return None, ()
+
+    def dispatch(self, handler, method, target):
+        """按请求的方法和地址查找路由，经过中间件链调用处理函数；没有匹配时返回False"""
+        url = urlparse(target)
+        route, path_args = self.match(method, url.path)
+        if route is None:
+            return False
+        args = route.args + path_args
+        if route.query:
+            args += (parse_qs(url.query),)
+        self.pipeline(handler, route, args)
+        return True
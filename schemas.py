@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据校验
+用声明式的字段定义描述计划、项目、任务、记录的结构，模块加载时编译为校验函数，
+保存数据时对整个请求只遍历一遍，按条汇总错误。
+
+字段定义：
+    type      id / string / number / date（YYYY-MM-DD）/ datetime（ISO 8601）
+    enum      允许的取值
+    ref       引用的数据类型，值必须是该类型中存在的id（空字符串表示不关联）
+    required  必填；非必填字段可以缺失或为null，日期和引用还可以为空字符串
+
+取值与前端表单（server_index.html）中的选项一致。未声明的字段（如color、image）不做检查，原样保存。
+"""
+
+import re
+from datetime import datetime
+
+# 按父级在前的顺序排列，与 data_store.DATA_TYPES 一致
+SCHEMAS = {
+    'plans': {
+        'id': {'type': 'id', 'required': True},
+        'name': {'type': 'string', 'required': True},
+        'description': {'type': 'string'},
+        'category': {'enum': ['career', 'skill', 'life', 'creative']},
+        'status': {'enum': ['draft', 'active', 'completed', 'archived']},
+        'startDate': {'type': 'date'},
+        'endDate': {'type': 'date'},
+        'color': {'type': 'string'},
+        'image': {'type': 'string'},
+        'createdAt': {'type': 'datetime'},
+        'updatedAt': {'type': 'datetime'},
+    },
+    'projects': {
+        'id': {'type': 'id', 'required': True},
+        'planId': {'ref': 'plans'},
+        'name': {'type': 'string', 'required': True},
+        'description': {'type': 'string'},
+        'category': {'enum': ['work', 'personal', 'study', 'creative']},
+        'status': {'enum': ['planning', 'active', 'completed', 'paused']},
+        'priority': {'enum': ['low', 'medium', 'high']},
+        'deadline': {'type': 'date'},
+        'color': {'type': 'string'},
+        'image': {'type': 'string'},
+        'createdAt': {'type': 'datetime'},
+        'updatedAt': {'type': 'datetime'},
+    },
+    'tasks': {
+        'id': {'type': 'id', 'required': True},
+        'projectId': {'ref': 'projects', 'required': True},
+        'name': {'type': 'string', 'required': True},
+        'description': {'type': 'string'},
+        'status': {'enum': ['pending', 'in-progress', 'completed', 'blocked']},
+        'priority': {'enum': ['low', 'medium', 'high']},
+        'dueDate': {'type': 'date'},
+        'createdAt': {'type': 'datetime'},
+        'updatedAt': {'type': 'datetime'},
+        'completedAt': {'type': 'datetime'},
+    },
+    'records': {
+        'id': {'type': 'id', 'required': True},
+        'taskId': {'ref': 'tasks'},
+        'projectId': {'ref': 'projects'},
+        'name': {'type': 'string', 'required': True},
+        'description': {'type': 'string'},
+        'size': {'type': 'number'},
+        'type': {'type': 'string'},
+        'path': {'type': 'string'},
+        'uploadDate': {'type': 'datetime'},
+    },
+}
+
+# 单次响应最多报告的出错数据条数
+MAX_REPORTED_ERRORS = 100
+
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+def check_id(value):
+    if not isinstance(value, str) or not value:
+        return '必须是非空字符串'
+    return None
+
+
+def check_string(value):
+    if not isinstance(value, str):
+        return '必须是字符串'
+    return None
+
+
+def check_number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return '必须是数字'
+    return None
+
+
+def check_date(value):
+    if value == '':
+        return None
+    if not isinstance(value, str) or not DATE_PATTERN.match(value):
+        return '日期格式应为 YYYY-MM-DD'
+    try:
+        datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return '日期不存在'
+    return None
+
+
+def check_datetime(value):
+    if not isinstance(value, str):
+        return '时间必须是ISO 8601格式的字符串'
+    try:
+        datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return '时间必须是ISO 8601格式'
+    return None
+
+
+TYPE_CHECKS = {
+    'id': check_id,
+    'string': check_string,
+    'number': check_number,
+    'date': check_date,
+    'datetime': check_datetime,
+}
+
+
+def compile_field(spec):
+    """把单个字段定义编译为 (是否必填, 检查函数, 引用类型)"""
+    if 'enum' in spec:
+        allowed = frozenset(spec['enum'])
+        message = f"只能是 {', '.join(spec['enum'])} 之一"
+
+        def check(value):
+            return None if isinstance(value, str) and value in allowed else message
+    elif 'ref' in spec:
+        check = check_id
+    else:
+        check = TYPE_CHECKS[spec['type']]
+    return spec.get('required', False), check, spec.get('ref')
+
+
+def compile_schema(schema):
+    return [(field,) + compile_field(spec) for field, spec in schema.items()]
+
+
+VALIDATORS = {data_type: compile_schema(schema) for data_type, schema in SCHEMAS.items()}
+
+
+def validate_item(data_type, item, known_ids=None):
+    """校验单条数据，返回错误列表 [{'field', 'message'}]
+
+    known_ids为 {数据类型: id集合}，提供时检查引用的id是否存在
+    """
+    if not isinstance(item, dict):
+        return [{'field': None, 'message': '数据必须是对象'}]
+    errors = []
+    for field, required, check, ref in VALIDATORS[data_type]:
+        value = item.get(field)
+        if value is None or (value == '' and not required and check is not check_string):
+            if required:
+                errors.append({'field': field, 'message': '必填'})
+            continue
+        message = check(value)
+        if message is None and ref is not None and known_ids is not None and value not in known_ids[ref]:
+            message = f'{ref}中不存在id为 {value} 的数据'
+        if message is not None:
+            errors.append({'field': field, 'message': message})
+    return errors
+
+
+def validate_changes(changes, store):
+    """校验一次保存请求中的全部数据，返回出错数据的列表
+
+    按计划→项目→任务→记录的顺序只遍历一遍：父级类型先处理，其id在检查子级引用前已收集完毕。
+    请求中没有包含的类型使用已保存的数据作为引用目标。
+    与已保存内容完全相同的数据不再检查，避免历史遗留数据阻止保存。
+    每条出错数据为 {'type', 'index', 'id', 'errors': [{'field', 'message'}]}
+    """
+    with store.lock:
+        store.load_all()
+        known_ids = {data_type: store.by_id[data_type].keys() for data_type in SCHEMAS if data_type not in changes}
+
+        failures = []
+        for data_type in SCHEMAS:
+            items = changes.get(data_type)
+            if items is None:
+                continue
+            if not isinstance(items, list):
+                failures.append({'type': data_type, 'index': None, 'id': None,
+                                 'errors': [{'field': None, 'message': '必须是数组'}]})
+                known_ids[data_type] = set()
+                continue
+
+            stored = store.by_id[data_type]
+            ids = known_ids[data_type] = set()
+            for index, item in enumerate(items):
+                item_id = item.get('id') if isinstance(item, dict) else None
+                if isinstance(item_id, str) and item_id in ids:
+                    errors = [{'field': 'id', 'message': f'id重复: {item_id}'}]
+                elif isinstance(item_id, str) and item_id in stored and stored[item_id] == item:
+                    errors = []
+                else:
+                    errors = validate_item(data_type, item, known_ids)
+                if isinstance(item_id, str) and item_id:
+                    ids.add(item_id)
+                if errors:
+                    failures.append({'type': data_type, 'index': index, 'id': item_id, 'errors': errors})
+        return failures
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全文搜索索引
+对计划、项目、任务、记录的name/description建立倒排索引，随数据变化增量更新
+
+分词规则：中日韩文字按单字和相邻两字（bigram）切分，拉丁字母和数字按单词切分并转为小写。
+查询时所有词都必须命中，最后一个拉丁单词按前缀匹配，便于输入时实时提示。
+"""
+
+import bisect
+import heapq
+import math
+import re
+
+from data_store import DATA_TYPES, StoreIndex
+
+# 字段 -> 权重，名称命中比描述命中更重要
+FIELD_WEIGHTS = {'name': 3.0, 'description': 1.0}
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# 前缀最多展开的词数，避免很短的前缀拖慢查询
+MAX_PREFIX_TERMS = 50
+
+CJK_RANGES = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+TOKEN_PATTERN = re.compile(f'[a-z0-9]+|[{CJK_RANGES}]+')
+CJK_PATTERN = re.compile(f'[{CJK_RANGES}]')
+
+
+def tokenize(text):
+    """把文本切分为 (词, 是否拉丁单词) 列表"""
+    tokens = []
+    if not isinstance(text, str):
+        return tokens
+    for run in TOKEN_PATTERN.findall(text.lower()):
+        if CJK_PATTERN.match(run):
+            tokens.extend((char, False) for char in run)
+            tokens.extend((run[i:i + 2], False) for i in range(len(run) - 1))
+        else:
+            tokens.append((run, True))
+    return tokens
+
+
+def query_terms(text):
+    """把查询切分为词，单字只在整段查询只有一个字时使用"""
+    terms = []
+    latin_last = False
+    if not isinstance(text, str):
+        return terms, latin_last
+    for run in TOKEN_PATTERN.findall(text.lower()):
+        if CJK_PATTERN.match(run):
+            if len(run) == 1:
+                terms.append(run)
+            else:
+                terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+            latin_last = False
+        else:
+            terms.append(run)
+            latin_last = True
+    return list(dict.fromkeys(terms)), latin_last
+
+
+class SearchIndex(StoreIndex):
+    """name/description倒排索引"""
+
+    def reset(self):
+        # 词 -> {(数据类型, id): 权重}
+        self.postings = {}
+        # (数据类型, id) -> {词: 权重}，删除和修改时使用
+        self.doc_terms = {}
+        # 有序的拉丁单词表，用于前缀匹配
+        self.latin_terms = []
+
+    def on_add(self, data_type, item):
+        weights = {}
+        latin = set()
+        for field, field_weight in FIELD_WEIGHTS.items():
+            for term, is_latin in tokenize(item.get(field)):
+                weights[term] = weights.get(term, 0.0) + field_weight
+                if is_latin:
+                    latin.add(term)
+        if not weights:
+            return
+
+        key = (data_type, item['id'])
+        self.doc_terms[key] = weights
+        for term, weight in weights.items():
+            docs = self.postings.get(term)
+            if docs is None:
+                docs = self.postings[term] = {}
+                if term in latin:
+                    bisect.insort(self.latin_terms, term)
+            docs[key] = weight
+
+    def on_remove(self, data_type, item):
+        key = (data_type, item['id'])
+        weights = self.doc_terms.pop(key, None)
+        if not weights:
+            return
+        for term in weights:
+            docs = self.postings.get(term)
+            if docs is None:
+                continue
+            docs.pop(key, None)
+            if not docs:
+                del self.postings[term]
+                position = bisect.bisect_left(self.latin_terms, term)
+                if position < len(self.latin_terms) and self.latin_terms[position] == term:
+                    del self.latin_terms[position]
+
+    def on_update(self, data_type, old_item, new_item):
+        if any(old_item.get(field) != new_item.get(field) for field in FIELD_WEIGHTS):
+            self.on_remove(data_type, old_item)
+            self.on_add(data_type, new_item)
+
+    def expand_prefix(self, prefix):
+        """找出以prefix开头的拉丁单词"""
+        terms = []
+        position = bisect.bisect_left(self.latin_terms, prefix)
+        while position < len(self.latin_terms) and len(terms) < MAX_PREFIX_TERMS:
+            term = self.latin_terms[position]
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+            position += 1
+        return terms
+
+    def match_term(self, term, prefix):
+        """获取单个查询词命中的文档及得分"""
+        candidates = self.expand_prefix(term) if prefix else [term]
+        total_docs = max(len(self.doc_terms), 1)
+        matches = {}
+        for candidate in candidates:
+            docs = self.postings.get(candidate)
+            if not docs:
+                continue
+            idf = math.log(1 + total_docs / len(docs))
+            # 前缀展开出的词打折，完整命中优先
+            factor = 1.0 if candidate == term else 0.5
+            for key, weight in docs.items():
+                score = weight * idf * factor
+                if score > matches.get(key, 0.0):
+                    matches[key] = score
+        return matches
+
+    def search(self, text, data_types=None, limit=DEFAULT_LIMIT):
+        """搜索，返回按得分排序的前limit条结果"""
+        limit = max(1, min(limit, MAX_LIMIT))
+        data_types = [data_type for data_type in (data_types or DATA_TYPES) if data_type in DATA_TYPES]
+
+        with self.store.lock:
+            terms, latin_last = query_terms(text)
+            if not terms:
+                return {'query': text, 'total': 0, 'results': []}
+
+            # 先处理命中文档最少的词，逐步求交集
+            term_matches = []
+            for position, term in enumerate(terms):
+                prefix = latin_last and position == len(terms) - 1
+                matches = self.match_term(term, prefix)
+                if not matches:
+                    return {'query': text, 'total': 0, 'results': []}
+                term_matches.append(matches)
+            term_matches.sort(key=len)
+
+            scores = {key: score for key, score in term_matches[0].items() if key[0] in data_types}
+            for matches in term_matches[1:]:
+                scores = {key: score + matches[key] for key, score in scores.items() if key in matches}
+                if not scores:
+                    break
+
+            top = heapq.nlargest(limit, scores.items(), key=lambda entry: entry[1])
+            results = []
+            for (data_type, item_id), score in top:
+                item = self.store.by_id[data_type].get(item_id, {})
+                results.append({
+                    'type': data_type,
+                    'id': item_id,
+                    'name': item.get('name', ''),
+                    'score': round(score, 4)
+                })
+            return {'query': text, 'total': len(scores), 'results': results}
@@ -11,23 +11,49 @@ import uuid
 import secrets
 import re
 from datetime import datetime, timedelta
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 import mimetypes
 import hashlib
 import hmac
-
-def secure_hash_password(password, salt=None):
-    """安全的密码哈希函数，使用随机salt"""
+import math
+import signal
+import sys
+import threading
+import time
+import traceback
+import zlib
+
+from access_log import CountingWriter, get_access_log
+from connection_guard import HeaderLimitError, SlowClientError, get_connection_stats, guard_connection
+from data_store import CHILD_TYPES, DATA_TYPES, MAX_BATCH_OPERATIONS, ReferenceIndex
+from date_index import DateIndex, parse_date
+import json_codec
+from login_limiter import LoginLimiter
+from password_hasher import PBKDF2_ITERATIONS, HasherUnavailable, PasswordHasher, configured_iterations
+from record_archive import get_archive
+from record_rollup_index import BUCKET_KINDS, RecordRollupIndex, merge_buckets
+from router import Router
+from rollup_index import RollupIndex
+from schemas import MAX_REPORTED_ERRORS, validate_changes
+from search_index import DEFAULT_LIMIT, SearchIndex
+from session_tokens import get_session_tokens, session_mode
+from stats_index import StatsIndex
+from user_directory import get_user_directory
+from workspaces import DEFAULT_WORKSPACE, can_access, get_workspace_manager, user_workspaces
+
+# 密码哈希进程池，PBKDF2计算不占用请求线程的CPU时间
+password_hasher = PasswordHasher()
+
+def secure_hash_password(password, salt=None, iterations=None):
+    """安全的密码哈希函数，使用随机salt，迭代次数默认使用本机的校准值"""
     if salt is None:
         salt = secrets.token_hex(32)
+    if iterations is None:
+        iterations = configured_iterations('database')
 
     # 使用PBKDF2算法进行密码哈希
-    iterations = 100000
-    dk = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), iterations)
-
     return {
-        'hash': dk.hex(),
+        'hash': password_hasher.derive(password, salt, iterations),
         'salt': salt,
         'iterations': iterations
     }
@@ -36,13 +62,57 @@ def verify_password(password, stored_hash_data):
     """验证密码"""
     if isinstance(stored_hash_data, str):
         # 兼容旧的简单哈希格式
-        return hashlib.sha256(password.encode()).hexdigest() == stored_hash_data
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored_hash_data)
     elif isinstance(stored_hash_data, dict):
         # 新的安全格式
-        calculated_hash = secure_hash_password(password, stored_hash_data['salt'])['hash']
+        iterations = stored_hash_data.get('iterations', PBKDF2_ITERATIONS)
+        calculated_hash = secure_hash_password(password, stored_hash_data['salt'], iterations)['hash']
         return hmac.compare_digest(calculated_hash, stored_hash_data['hash'])
     return False
 
+# 服务器为多线程，会话文件的读取-修改-写入需要串行执行
+sessions_lock = threading.RLock()
+
+# 登录频率限制，所有请求共享
+login_limiter = LoginLimiter()
+
+# 访问日志，由后台线程写入
+access_log = get_access_log()
+
+def needs_rehash(stored_hash_data):
+    """密码哈希是否需要升级：旧的无salt SHA-256格式，或迭代次数低于当前设置"""
+    if not isinstance(stored_hash_data, dict):
+        return True
+    return stored_hash_data.get('iterations', PBKDF2_ITERATIONS) < configured_iterations('database')
+
+# 截止日期查询的时间范围，如 7d、2w
+WITHIN_PATTERN = re.compile(r'^(\d+)([dw]?)$')
+
+# 截止日期查询最多向后查的天数
+MAX_DUE_DAYS = 3650
+
+# 长连接空闲超时（秒）：连接上超过这个时间没有新请求就关闭，释放处理线程
+KEEPALIVE_TIMEOUT = float(os.environ.get('PM_KEEPALIVE_TIMEOUT', 15))
+
+# 每个连接最多处理的请求数，达到后在响应中带上 Connection: close
+MAX_KEEPALIVE_REQUESTS = int(os.environ.get('PM_KEEPALIVE_MAX', 100))
+
+# 处理程序没有读取请求体时，不超过这个大小就读完丢弃以继续复用连接，否则关闭连接
+MAX_DRAIN_BYTES = 64 * 1024
+
+# 静态文件服务不提供的目录：数据、会话和日志
+PRIVATE_DIRS = ('database', 'sessions', 'logs')
+
+# 分块传输时每块的目标大小
+CHUNK_SIZE = 64 * 1024
+
+# 响应体超过这个大小且客户端支持时使用gzip压缩
+COMPRESS_MIN_BYTES = 1024
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'text/')
+
+# 处理时间超过这个秒数的请求打印提示
+SLOW_REQUEST_SECONDS = 1.0
+
 def validate_username(username):
     """验证用户名格式"""
     if not username or len(username) < 3 or len(username) > 20:
@@ -57,14 +127,133 @@ def validate_password(password):
     return re.search(r'[a-zA-Z]', password) and re.search(r'[0-9]', password)
 
 class ProjectManagerHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1长连接：每个响应都必须带 Content-Length 或使用分块传输
+    protocol_version = 'HTTP/1.1'
+    # 连接空闲超时，由socketserver设置到连接的socket上
+    timeout = KEEPALIVE_TIMEOUT
+    # 响应头和响应体分两次写入，长连接上开启Nagle算法时第二次写入要等客户端的延迟确认（约40ms）
+    disable_nagle_algorithm = True
+
     def __init__(self, *args, **kwargs):
         self.data_dir = "database"
         self.sessions_dir = "sessions"
         self.users_file = os.path.join(self.data_dir, "users.json")
         self.sessions_file = os.path.join(self.sessions_dir, "sessions.json")
+        self.user_directory = get_user_directory(self.users_file)
+        # 令牌模式下会话信息保存在签名令牌中，不读写会话文件
+        self.session_tokens = get_session_tokens() if session_mode() == 'token' else None
         self.ensure_database_dir()
+        self.workspaces = get_workspace_manager(self.data_dir)
+        # 当前请求使用的工作区和数据存储，在get_current_user中按会话确定
+        self.workspace = DEFAULT_WORKSPACE
+        self.store = None
+        # 当前请求标记为使用中的工作区，请求结束时释放
+        self.pinned_workspace = None
+        # 当前连接已处理的请求数，请求体是否已被读取
+        self.requests_handled = 0
+        self.reset_request_state()
         super().__init__(*args, **kwargs)
 
+    def reset_request_state(self):
+        """每个请求开始时清空上一个请求留下的状态"""
+        self.workspace = DEFAULT_WORKSPACE
+        self.store = None
+        self.body_read = False
+        # 会话和用户每个请求最多解析一次，由中间件和处理函数共用
+        self.user_resolved = False
+        self.current_user = None
+        self.route = None
+        self.request_started = None
+        self.response_started = False
+        self.status_code = None
+        self.path = ''
+        self.compress = False
+
+    def setup(self):
+        """读取请求时使用带期限的读取器，缓慢发送的客户端不能长期占用处理线程"""
+        super().setup()
+        self.rfile.close()
+        self.rfile = guard_connection(self.connection, self.timeout)
+        self.wfile = CountingWriter(self.wfile)
+
+    def handle_one_request(self):
+        """处理连接上的一个请求，同一连接上的请求之间不共享工作区等状态"""
+        self.reset_request_state()
+        self.requests_handled += 1
+        self.rfile.start_request()
+        written = self.wfile.written
+        try:
+            super().handle_one_request()
+        except HeaderLimitError:
+            # 请求行超出限制（请求头超出限制时由parse_request返回431）
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(431)
+        finally:
+            self.release_workspace()
+            self.log_access(self.wfile.written - written)
+        if self.rfile.failed:
+            self.close_connection = True
+        elif not self.close_connection and getattr(self, 'command', None):
+            self.discard_unread_body()
+
+    def log_access(self, size):
+        """请求结束时写一条访问日志，没有发送响应（如空闲连接关闭）时不记录"""
+        if self.status_code is None:
+            return
+        started = self.rfile.request_started
+        access_log.request(
+            self.command or None,
+            self.route.path if self.route else None,
+            self.path.split('?', 1)[0] or None,
+            self.status_code,
+            size,
+            time.monotonic() - started if started is not None else 0.0,
+            user=self.current_user.get('username') if self.current_user else None,
+            ip=self.client_address[0]
+        )
+
+    def send_response(self, code, message=None):
+        self.response_started = True
+        self.status_code = code
+        super().send_response(code, message)
+
+    def end_headers(self):
+        """达到单个连接的请求数上限时通知客户端关闭连接"""
+        if self.requests_handled >= MAX_KEEPALIVE_REQUESTS and not self.close_connection:
+            self.send_header('Connection', 'close')
+        if self.request_started is not None:
+            self.send_header('Server-Timing', f'app;dur={(time.perf_counter() - self.request_started) * 1000:.1f}')
+        super().end_headers()
+
+    def read_body(self):
+        """读取请求体"""
+        self.body_read = True
+        content_length = int(self.headers.get('Content-Length') or 0)
+        if content_length <= 0:
+            return b''
+        self.rfile.start_body()
+        return self.rfile.read(content_length)
+
+    def discard_unread_body(self):
+        """处理程序提前返回（如未认证）时请求体还留在连接中，读完丢弃后下一个请求才能正确解析"""
+        if self.body_read:
+            return
+        if 'Transfer-Encoding' in self.headers:
+            self.close_connection = True
+            return
+        try:
+            content_length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self.close_connection = True
+            return
+        if content_length > MAX_DRAIN_BYTES:
+            self.close_connection = True
+        elif content_length > 0:
+            self.rfile.start_body()
+            self.rfile.read(content_length)
+
     def ensure_database_dir(self):
         """确保数据库目录存在"""
         if not os.path.exists(self.data_dir):
@@ -75,103 +264,158 @@ class ProjectManagerHandler(BaseHTTPRequestHandler):
 
     def ensure_default_user(self):
         """确保默认用户存在"""
-        if not os.path.exists(self.users_file):
+        if not self.user_directory.exists():
             # 使用安全的密码哈希
             admin_password_data = secure_hash_password("admin123")
             project_manager_password_data = secure_hash_password("123456")
 
-            default_users = {
-                "admin": {
+            default_users = [
+                {
                     "username": "admin",
                     "password_hash": admin_password_data,
                     "created_at": datetime.now().isoformat(),
                     "role": "admin",
                     "password_changed": False  # 标记需要修改密码
                 },
-                "project_manager": {
+                {
                     "username": "project_manager",
                     "password_hash": project_manager_password_data,
                     "created_at": datetime.now().isoformat(),
                     "role": "user",
                     "password_changed": False  # 标记需要修改密码
                 }
-            }
-            self.save_json(self.users_file, default_users)
+            ]
+            for user in default_users:
+                try:
+                    self.user_directory.add_user(user)
+                except ValueError:
+                    # 其他请求已同时创建
+                    pass
 
     def load_json(self, filepath):
         """加载JSON文件"""
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return json_codec.read_file(filepath)
         except (FileNotFoundError, json.JSONDecodeError):
             return {}
 
     def save_json(self, filepath, data):
         """保存JSON文件"""
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        json_codec.write_file(filepath, data)
 
     def get_session(self, session_id):
         """获取会话信息"""
-        sessions = self.load_json(self.sessions_file)
-        session = sessions.get(session_id)
-        if session:
-            # 检查会话是否过期
-            expires_at = datetime.fromisoformat(session['expires_at'])
-            if datetime.now() > expires_at:
-                del sessions[session_id]
+        if self.session_tokens is not None:
+            return self.get_token_session(session_id)
+        with sessions_lock:
+            sessions = self.load_json(self.sessions_file)
+            session = sessions.get(session_id)
+            if session:
+                # 检查会话是否过期
+                expires_at = datetime.fromisoformat(session['expires_at'])
+                if datetime.now() > expires_at:
+                    del sessions[session_id]
+                    self.save_json(self.sessions_file, sessions)
+                    return None
+
+                # 检查IP地址是否匹配
+                client_ip = self.client_address[0] if hasattr(self, 'client_address') else 'unknown'
+                if session.get('client_ip') and session['client_ip'] != client_ip:
+                    del sessions[session_id]
+                    self.save_json(self.sessions_file, sessions)
+                    return None
+
+                # 更新最后活动时间（滑动过期）
+                session['last_activity'] = datetime.now().isoformat()
+                sessions[session_id] = session
                 self.save_json(self.sessions_file, sessions)
-                return None
+            return session
+
+    def get_token_session(self, token):
+        """验证签名令牌，返回与文件会话相同结构的会话信息"""
+        payload = self.session_tokens.verify(token)
+        if payload is None:
+            return None
+        client_ip = self.client_address[0] if hasattr(self, 'client_address') else 'unknown'
+        if payload.get('ip') and payload['ip'] != client_ip:
+            return None
+        return {
+            'username': payload['u'],
+            'workspace': payload.get('ws') or DEFAULT_WORKSPACE,
+            'client_ip': payload.get('ip'),
+            'token': payload
+        }
 
-            # 检查IP地址是否匹配
+    def create_session(self, username, workspace=DEFAULT_WORKSPACE):
+        """创建会话，返回写入Cookie的会话id（令牌模式下为签名令牌）"""
+        if self.session_tokens is not None:
+            client_ip = self.client_address[0] if hasattr(self, 'client_address') else 'unknown'
+            return self.session_tokens.issue(username, ip=client_ip, ws=workspace)
+        with sessions_lock:
+            session_id = secrets.token_urlsafe(32)
+            expires_at = datetime.now() + timedelta(hours=4)  # 4小时过期
             client_ip = self.client_address[0] if hasattr(self, 'client_address') else 'unknown'
-            if session.get('client_ip') and session['client_ip'] != client_ip:
-                del sessions[session_id]
-                self.save_json(self.sessions_file, sessions)
-                return None
 
-            # 更新最后活动时间（滑动过期）
-            session['last_activity'] = datetime.now().isoformat()
-            sessions[session_id] = session
+            sessions = self.load_json(self.sessions_file)
+            sessions[session_id] = {
+                'username': username,
+                'created_at': datetime.now().isoformat(),
+                'expires_at': expires_at.isoformat(),
+                'client_ip': client_ip,
+                'last_activity': datetime.now().isoformat(),
+                'workspace': workspace
+            }
             self.save_json(self.sessions_file, sessions)
-        return session
-
-    def create_session(self, username):
-        """创建会话"""
-        session_id = secrets.token_urlsafe(32)
-        expires_at = datetime.now() + timedelta(hours=4)  # 4小时过期
-        client_ip = self.client_address[0] if hasattr(self, 'client_address') else 'unknown'
-
-        sessions = self.load_json(self.sessions_file)
-        sessions[session_id] = {
-            'username': username,
-            'created_at': datetime.now().isoformat(),
-            'expires_at': expires_at.isoformat(),
-            'client_ip': client_ip,
-            'last_activity': datetime.now().isoformat()
-        }
-        self.save_json(self.sessions_file, sessions)
-        return session_id
+            return session_id
 
     def delete_session(self, session_id):
         """删除会话"""
-        sessions = self.load_json(self.sessions_file)
-        if session_id in sessions:
-            del sessions[session_id]
-            self.save_json(self.sessions_file, sessions)
+        if self.session_tokens is not None:
+            payload = self.session_tokens.verify(session_id)
+            if payload is not None:
+                self.session_tokens.revoke(payload)
+            return
+        with sessions_lock:
+            sessions = self.load_json(self.sessions_file)
+            if session_id in sessions:
+                del sessions[session_id]
+                self.save_json(self.sessions_file, sessions)
 
     def get_current_user(self):
-        """获取当前用户"""
+        """获取当前用户，同一请求中只解析一次会话"""
+        if not self.user_resolved:
+            self.current_user = self.resolve_current_user()
+            self.user_resolved = True
+        return self.current_user
+
+    def resolve_current_user(self):
         session_id = self.get_cookie('session_id')
         if not session_id:
             return None
 
         session = self.get_session(session_id)
         if session:
-            users = self.load_json(self.users_file)
-            return users.get(session['username'])
+            user = self.user_directory.get(session['username'])
+            if user:
+                workspace = session.get('workspace') or DEFAULT_WORKSPACE
+                if not can_access(user, workspace):
+                    workspace = user_workspaces(user)[0]
+                self.use_workspace(workspace)
+            return user
         return None
 
+    def use_workspace(self, workspace):
+        """切换当前请求使用的工作区，请求结束前该工作区不会被移出内存"""
+        self.release_workspace()
+        self.store = self.workspaces.acquire(workspace)
+        self.workspace = workspace
+        self.pinned_workspace = workspace
+
+    def release_workspace(self):
+        if self.pinned_workspace is not None:
+            self.workspaces.release(self.pinned_workspace)
+            self.pinned_workspace = None
+
     def get_cookie(self, name):
         """获取Cookie值"""
         cookie_header = self.headers.get('Cookie', '')
@@ -189,76 +433,117 @@ class ProjectManagerHandler(BaseHTTPRequestHandler):
 
     def get_data_path(self, data_type):
         """获取数据文件路径"""
-        return os.path.join(self.data_dir, f"{data_type}.json")
+        return self.store.get_data_path(data_type)
 
     def load_data(self, data_type):
-        """从文件加载数据"""
-        try:
-            with open(self.get_data_path(data_type), 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+        """从数据存储加载数据"""
+        return self.store.load(data_type)
 
     def save_data(self, data_type, data):
         """保存数据到文件"""
-        with open(self.get_data_path(data_type), 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        self.store.save(data_type, data)
 
     def do_GET(self):
         """处理GET请求"""
-        parsed_path = urlparse(self.path)
-
-        if parsed_path.path == '/':
-            # 检查用户是否已登录
-            current_user = self.get_current_user()
-            if current_user:
-                self.serve_file('server_index.html')
-            else:
-                self.serve_file('login.html')
-        elif parsed_path.path == '/login.html':
-            current_user = self.get_current_user()
-            if current_user:
-                self.redirect_to('/')
-            else:
-                self.serve_file('login.html')
-        elif parsed_path.path == '/server_index.html':
-            current_user = self.get_current_user()
-            if current_user:
-                self.serve_file('server_index.html')
-            else:
-                self.redirect_to('/login.html')
-        elif parsed_path.path == '/styles.css':
-            self.serve_file('styles.css', 'text/css')
-        elif parsed_path.path in ['/script.js', '/server_script.js', '/ui_functions.js']:
-            self.serve_file(parsed_path.path[1:], 'application/javascript')
-        elif parsed_path.path == '/favicon.ico':
-            self.serve_file('favicon.ico', 'image/x-icon') if os.path.exists('favicon.ico') else self.send_error(404)
-        elif parsed_path.path == '/api/data':
-            self.handle_get_data()
-        elif parsed_path.path == '/api/check-auth':
-            self.handle_check_auth()
-        else:
-            self.serve_file(parsed_path.path[1:])
+        routes.dispatch(self, 'GET', self.path)
 
     def do_POST(self):
         """处理POST请求"""
-        parsed_path = urlparse(self.path)
-
-        if parsed_path.path == '/api/save':
-            self.handle_save_data()
-        elif parsed_path.path == '/api/load':
-            self.handle_load_data()
-        elif parsed_path.path == '/api/login':
-            self.handle_login()
-        elif parsed_path.path == '/api/logout':
-            self.handle_logout()
+        if not routes.dispatch(self, 'POST', self.path):
+            self.send_error(404)
+
+    def handle_index(self):
+        """首页：已登录时进入应用，否则显示登录页"""
+        self.serve_file('server_index.html' if self.get_current_user() else 'login.html')
+
+    def handle_login_page(self):
+        if self.get_current_user():
+            self.redirect_to('/')
+        else:
+            self.serve_file('login.html')
+
+    def handle_app_page(self):
+        if self.get_current_user():
+            self.serve_file('server_index.html')
+        else:
+            self.redirect_to('/login.html')
+
+    def handle_favicon(self):
+        if os.path.exists('favicon.ico'):
+            self.serve_file('favicon.ico', 'image/x-icon')
         else:
             self.send_error(404)
 
+    def handle_static(self, path):
+        """其他路径按静态文件处理，数据、会话、日志目录和网站目录之外的路径返回404"""
+        filename = os.path.normpath(path.lstrip('/'))
+        parts = filename.replace('\\', '/').split('/')
+        if os.path.isabs(filename) or parts[0] == '..' or parts[0].lower() in PRIVATE_DIRS:
+            self.send_error(404)
+            return
+        self.serve_file(filename)
+
+    def timing_middleware(self, route, args, next_call):
+        """记录处理时间，通过Server-Timing响应头返回，处理较慢时打印提示"""
+        self.route = route
+        self.request_started = time.perf_counter()
+        next_call(self, route, args)
+        elapsed = time.perf_counter() - self.request_started
+        if elapsed > SLOW_REQUEST_SECONDS:
+            access_log.event('warning', 'slow_request', method=self.command, route=route.path, seconds=round(elapsed, 3))
+
+    def error_middleware(self, route, args, next_call):
+        """把处理函数中未捕获的异常转换为JSON错误响应"""
+        try:
+            next_call(self, route, args)
+        except (ConnectionAbortedError, ConnectionResetError, BrokenPipeError) as e:
+            self.close_connection = True
+            access_log.event('warning', 'client_disconnected', route=route.path, error=str(e))
+        except SlowClientError as e:
+            # 请求体发送过慢，连接中剩余的数据无法再使用
+            self.close_connection = True
+            access_log.event('warning', 'slow_client', route=route.path, ip=self.client_address[0], reason=e.reason)
+            if not self.response_started:
+                self.send_json_response(408, {'error': '请求超时'}, headers={'Connection': 'close'})
+        except Exception as e:
+            if self.response_started:
+                # 响应已经开始发送，无法再返回错误状态，关闭连接让客户端发现响应不完整
+                self.close_connection = True
+                access_log.event('error', 'handler_error', handler=route.name, error=repr(e))
+            elif isinstance(e, json.JSONDecodeError):
+                self.send_json_response(400, {'error': '请求数据格式错误'})
+            elif isinstance(e, HasherUnavailable):
+                self.send_json_response(503, {'error': '服务器繁忙，请稍后重试'}, headers={'Retry-After': '1'})
+            else:
+                # 异常详情只写入日志，不返回给客户端
+                access_log.event('error', 'handler_error', handler=route.name, error=repr(e),
+                                 traceback=traceback.format_exc())
+                self.send_json_response(500, {'error': '服务器内部错误'})
+
+    def compression_middleware(self, route, args, next_call):
+        """客户端支持gzip时压缩较大的响应体"""
+        self.compress = route.compress and 'gzip' in self.headers.get('Accept-Encoding', '')
+        next_call(self, route, args)
+
+    def auth_middleware(self, route, args, next_call):
+        """需要登录的路由在这里统一检查，解析出的用户保存在请求中供处理函数使用"""
+        if route.auth and not self.get_current_user():
+            self.send_json_response(401, {'status': 'error', 'error': '未认证', 'message': '未认证'})
+            return
+        next_call(self, route, args)
+
+    def compress_body(self, body, content_type):
+        """按需压缩响应体，返回 (响应体, 额外的响应头)"""
+        if not self.compress or len(body) < COMPRESS_MIN_BYTES or not content_type.startswith(COMPRESSIBLE_TYPES):
+            return body, {}
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        return compressor.compress(body) + compressor.flush(), {'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'}
+
     def redirect_to(self, path):
         """重定向到指定路径"""
         self.send_response(302)
         self.send_header('Location', path)
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def serve_file(self, filename, content_type=None):
@@ -271,10 +556,13 @@ class ProjectManagerHandler(BaseHTTPRequestHandler):
 
             with open(filename, 'rb') as f:
                 content = f.read()
+            content, encoding_headers = self.compress_body(content, content_type)
 
             self.send_response(200)
             self.send_header('Content-type', content_type)
             self.send_header('Content-Length', str(len(content)))
+            for name, value in encoding_headers.items():
+                self.send_header(name, value)
 
             # 添加缓存和兼容性头部
             if filename.endswith(('.css', '.js')):
@@ -292,22 +580,22 @@ class ProjectManagerHandler(BaseHTTPRequestHandler):
                 self.wfile.write(content)
             except (ConnectionAbortedError, ConnectionResetError, BrokenPipeError) as e:
                 # 客户端断开连接，这是正常情况，不应该打印错误
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Client disconnected: {e}")
+                self.close_connection = True
+                access_log.event('warning', 'client_disconnected', file=filename, error=str(e))
             except Exception as e:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Error writing response: {e}")
+                self.close_connection = True
+                access_log.event('error', 'write_failed', file=filename, error=repr(e))
 
         except FileNotFoundError:
             self.send_error(404, f"File not found: {filename}")
         except Exception as e:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Error serving file {filename}: {e}")
+            access_log.event('error', 'serve_file_failed', file=filename, error=repr(e))
             self.send_error(500, f"Internal server error: {e}")
 
     def handle_login(self):
         """处理登录请求"""
         try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            login_data = json.loads(post_data.decode('utf-8'))
+            login_data = json_codec.loads(self.read_body())
 
             username = login_data.get('username', '').strip()
             password = login_data.get('password', '')
@@ -321,47 +609,74 @@ class ProjectManagerHandler(BaseHTTPRequestHandler):
                 self.send_json_response(400, {'success': False, 'message': '密码格式不正确，至少6个字符，必须包含字母和数字'})
                 return
 
-            # 防止暴力破解 - 添加延迟
-            import time
-            time.sleep(0.5)  # 500ms延迟
-
-            users = self.load_json(self.users_file)
-            user = users.get(username)
-
-            if not user:
-                self.send_json_response(401, {'success': False, 'message': '用户名或密码错误'})
+            # 防止暴力破解 - 按IP和用户名限制尝试频率，连续失败后锁定
+            client_ip = self.client_address[0]
+            retry_after = login_limiter.acquire(client_ip, username)
+            if retry_after:
+                self.send_json_response(429, {
+                    'success': False,
+                    'message': f'登录尝试过于频繁，请 {math.ceil(retry_after)} 秒后再试'
+                }, headers={'Retry-After': str(math.ceil(retry_after))})
                 return
 
+            user = self.user_directory.get(username)
+
             # 使用安全的密码验证
-            if not verify_password(password, user['password_hash']):
+            if not user or not verify_password(password, user['password_hash']):
+                locked = login_limiter.record_failure(client_ip, username)
+                if locked:
+                    access_log.event('warning', 'login_locked', username=username, ip=client_ip, seconds=round(locked))
                 self.send_json_response(401, {'success': False, 'message': '用户名或密码错误'})
                 return
 
+            login_limiter.record_success(client_ip, username)
+            if needs_rehash(user['password_hash']):
+                self.upgrade_password_hash(username, password)
+
             # 登录成功，创建会话
-            session_id = self.create_session(username)
+            workspace = user_workspaces(user)[0]
+            session_id = self.create_session(username, workspace)
 
             # 检查是否需要修改密码
             requires_password_change = not user.get('password_changed', True)
 
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.set_cookie('session_id', session_id)
-            self.end_headers()
-            self.wfile.write(json.dumps({
+            body = json_codec.dumps({
                 'success': True,
                 'message': '登录成功',
                 'username': username,
                 'role': user.get('role', 'user'),
+                'workspace': workspace,
                 'requires_password_change': requires_password_change
-            }).encode('utf-8'))
-
+            })
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.set_cookie('session_id', session_id)
+            self.end_headers()
+            self.wfile.write(body)
+
+        except SlowClientError:
+            raise
+        except HasherUnavailable as e:
+            access_log.event('warning', 'hasher_unavailable', error=str(e))
+            self.send_json_response(503, {'success': False, 'message': '服务器繁忙，请稍后重试'},
+                                    headers={'Retry-After': '1'})
         except json.JSONDecodeError:
             self.send_json_response(400, {'success': False, 'message': '请求数据格式错误'})
         except Exception as e:
-            print(f"登录错误: {e}")
+            access_log.event('error', 'handler_error', handler='handle_login', error=repr(e))
             self.send_json_response(500, {'success': False, 'message': '服务器错误，请稍后重试'})
 
+    def upgrade_password_hash(self, username, password):
+        """登录成功后用当前的迭代次数重新计算密码哈希，失败时不影响登录"""
+        try:
+            password_hash = secure_hash_password(password)
+            self.user_directory.update_user(username, {'password_hash': password_hash})
+            access_log.event('info', 'password_hash_upgraded', username=username, iterations=password_hash['iterations'])
+        except (HasherUnavailable, KeyError, OSError) as e:
+            access_log.event('warning', 'password_hash_upgrade_failed', username=username, error=repr(e))
+
     def handle_logout(self):
         """处理登出请求"""
         try:
@@ -369,18 +684,20 @@ class ProjectManagerHandler(BaseHTTPRequestHandler):
             if session_id:
                 self.delete_session(session_id)
 
+            body = json_codec.dumps({
+                'success': True,
+                'message': '登出成功'
+            })
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
             self.send_header('Access-Control-Allow-Origin', '*')
             self.set_cookie('session_id', '', 0)  # 清除Cookie
             self.end_headers()
-            self.wfile.write(json.dumps({
-                'success': True,
-                'message': '登出成功'
-            }).encode('utf-8'))
+            self.wfile.write(body)
 
         except Exception as e:
-            print(f"登出错误: {e}")
+            access_log.event('error', 'handler_error', handler='handle_logout', error=repr(e))
             self.send_json_response(500, {'success': False, 'message': '服务器错误'})
 
     def handle_check_auth(self):
@@ -391,50 +708,291 @@ class ProjectManagerHandler(BaseHTTPRequestHandler):
                 self.send_json_response(200, {
                     'authenticated': True,
                     'username': current_user['username'],
-                    'role': current_user.get('role', 'user')
+                    'role': current_user.get('role', 'user'),
+                    'workspace': self.workspace
                 })
             else:
                 self.send_json_response(401, {'authenticated': False})
         except Exception as e:
-            print(f"检查认证状态错误: {e}")
+            access_log.event('error', 'handler_error', handler='handle_check_auth', error=repr(e))
             self.send_json_response(500, {'authenticated': False})
 
-    def send_json_response(self, status_code, data):
+    def send_json_response(self, status_code, data, headers=None):
         """发送JSON响应"""
+        body, encoding_headers = self.compress_body(json_codec.dumps(data), 'application/json')
         self.send_response(status_code)
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
         self.send_header('Access-Control-Allow-Origin', '*')
+        for name, value in {**encoding_headers, **(headers or {})}.items():
+            self.send_header(name, value)
         self.end_headers()
 
         try:
-            json_data = json.dumps(data, ensure_ascii=False)
-            self.wfile.write(json_data.encode('utf-8'))
+            self.wfile.write(body)
         except (ConnectionAbortedError, ConnectionResetError, BrokenPipeError) as e:
             # 客户端断开连接，这是正常情况
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Client disconnected during JSON response: {e}")
+            self.close_connection = True
+            access_log.event('warning', 'client_disconnected', status=status_code, error=str(e))
         except Exception as e:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Error sending JSON response: {e}")
+            self.close_connection = True
+            access_log.event('error', 'write_failed', status=status_code, error=repr(e))
+
+    def send_chunked_response(self, status_code, chunks, content_type='application/json'):
+        """边生成边发送响应体（分块传输），不需要先在内存中拼出完整的响应；HTTP/1.0客户端拼接后按长度发送"""
+        if self.request_version != 'HTTP/1.1':
+            body, encoding_headers = self.compress_body(b''.join(chunks), content_type)
+            self.send_response(status_code)
+            self.send_header('Content-type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Access-Control-Allow-Origin', '*')
+            for name, value in encoding_headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        # 分块传输时无法预先知道大小，客户端支持时总是压缩
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if self.compress else None
+        self.send_response(status_code)
+        self.send_header('Content-type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        if compressor is not None:
+            self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+        try:
+            pending = []
+            size = 0
+            for chunk in chunks:
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                pending.append(chunk)
+                size += len(chunk)
+                if size >= CHUNK_SIZE:
+                    self.wfile.write(b'%x\r\n%s\r\n' % (size, b''.join(pending)))
+                    pending, size = [], 0
+            if compressor is not None:
+                pending.append(compressor.flush())
+                size += len(pending[-1])
+            if size:
+                self.wfile.write(b'%x\r\n%s\r\n' % (size, b''.join(pending)))
+            self.wfile.write(b'0\r\n\r\n')
+        except (ConnectionAbortedError, ConnectionResetError, BrokenPipeError) as e:
+            self.close_connection = True
+            access_log.event('warning', 'client_disconnected', status=status_code, chunked=True, error=str(e))
+        except Exception as e:
+            # 响应头已经发出，无法再返回错误状态，只能中断连接让客户端发现响应不完整
+            self.close_connection = True
+            access_log.event('error', 'write_failed', status=status_code, chunked=True, error=repr(e))
 
     def handle_get_data(self):
         """处理获取数据请求"""
+        # 各数据类型分别编码并立即发送，不必先把全部数据编码成一个完整的响应；
+        # 没有变化的数据类型直接使用数据存储缓存的编码结果
+        data = {data_type: self.store.encoded(data_type) for data_type in ('plans', 'projects', 'tasks', 'records')}
+        data['rollups'] = self.store.get_index(RollupIndex).all_rollups()
+        self.send_chunked_response(200, self.iter_json_object(data))
+
+    def iter_json_object(self, data):
+        """按键逐个编码JSON对象，bytes类型的值视为已编码的JSON"""
+        separator = b'{'
+        for key, value in data.items():
+            yield separator + json_codec.dumps(key) + b':'
+            yield value if isinstance(value, bytes) else json_codec.dumps(value)
+            separator = b','
+        yield b'}' if separator == b',' else b'{}'
+
+    def handle_get_children(self, parent_type, parent_id, child_type):
+        """处理子数据查询请求，直接从反向索引获取"""
+        if CHILD_TYPES[parent_type] != child_type:
+            self.send_json_response(404, {'error': f'{parent_type}下没有{child_type}'})
+            return
+
+        children = self.store.get_index(ReferenceIndex).get_children(parent_type, parent_id)
+        if children is None:
+            self.send_json_response(404, {'error': f'{parent_type}中不存在id为 {parent_id} 的数据'})
+            return
+
+        response = {child_type: children}
+        if child_type == 'projects':
+            rollups = self.store.get_index(RollupIndex)
+            response['rollups'] = {project['id']: rollups.project_rollup(project['id']) for project in children}
+        self.send_json_response(200, response)
+
+    def handle_due(self, query):
+        """处理即将到期查询: ?within=7d（支持d/w），overdue=1包含已逾期，completed=1包含已完成"""
+        match = WITHIN_PATTERN.match(query.get('within', ['7d'])[0])
+        if not match:
+            self.send_json_response(400, {'error': 'within格式错误，例如 7d 或 2w'})
+            return
+        days = int(match.group(1)) * (7 if match.group(2) == 'w' else 1)
+        if days > MAX_DUE_DAYS:
+            self.send_json_response(400, {'error': f'within不能超过 {MAX_DUE_DAYS} 天'})
+            return
+
+        today = datetime.now().date()
+        start = None if query.get('overdue', ['0'])[0] == '1' else today.isoformat()
+        end = (today + timedelta(days=days)).isoformat()
+        include_completed = query.get('completed', ['0'])[0] == '1'
+
+        due = self.store.get_index(DateIndex).due_between(start, end, include_completed)
+        self.send_json_response(200, {'from': start, 'to': end, 'items': due})
+
+    def handle_timeline(self, query):
+        """处理时间线查询: ?from=YYYY-MM-DD&to=YYYY-MM-DD，默认从今天起30天"""
+        today = datetime.now().date()
+        start = parse_date(query.get('from', [today.isoformat()])[0])
+        end = parse_date(query.get('to', [(today + timedelta(days=30)).isoformat()])[0])
+        if not start or not end or end < start:
+            self.send_json_response(400, {'error': '日期格式错误，应为 YYYY-MM-DD 且 from 不晚于 to'})
+            return
+
+        dates = self.store.get_index(DateIndex)
+        self.send_json_response(200, {
+            'from': start,
+            'to': end,
+            'plans': dates.plans_overlapping(start, end),
+            'deadlines': dates.due_between(start, end, include_completed=True)
+        })
+
+    def handle_search(self, query):
+        """处理全文搜索请求: ?q=关键词&type=plans,projects&limit=20"""
+        text = query.get('q', [''])[0]
+        data_types = query['type'][0].split(',') if 'type' in query else None
         try:
-            # 检查用户是否已认证
-            current_user = self.get_current_user()
-            if not current_user:
-                self.send_json_response(401, {'error': '未认证'})
-                return
+            limit = int(query.get('limit', [DEFAULT_LIMIT])[0])
+        except ValueError:
+            limit = DEFAULT_LIMIT
 
-            data = {
-                'plans': self.load_data('plans'),
-                'projects': self.load_data('projects'),
-                'tasks': self.load_data('tasks'),
-                'records': self.load_data('records')
-            }
+        self.send_json_response(200, self.store.get_index(SearchIndex).search(text, data_types, limit))
+
+    def handle_records_archive(self, query):
+        """处理归档记录查询: ?page=1&limit=50（最新在前），或 ?from=&to=&offset=&limit=（按时间顺序）"""
+        try:
+            limit = min(max(int(query.get('limit', ['50'])[0]), 1), 500)
+            page = max(int(query.get('page', ['1'])[0]), 1)
+            offset = max(int(query.get('offset', ['0'])[0]), 0)
+        except ValueError:
+            self.send_json_response(400, {'error': '分页参数必须是整数'})
+            return
+
+        archive = get_archive(self.store.data_dir)
+        if 'from' in query or 'to' in query:
+            start = parse_date(query['from'][0]) if 'from' in query else None
+            end = parse_date(query['to'][0]) if 'to' in query else None
+            if ('from' in query and not start) or ('to' in query and not end):
+                self.send_json_response(400, {'error': '日期格式错误，应为 YYYY-MM-DD'})
+                return
+            try:
+                result = archive.between(start, end, offset, limit)
+            except ValueError:
+                self.send_json_response(400, {'error': '日期格式错误，应为 YYYY-MM-DD'})
+                return
+            self.send_json_response(200, result)
+        else:
+            self.send_json_response(200, archive.page(page, limit))
+
+    def handle_records_summary(self, query):
+        """处理记录时间序列汇总请求: ?bucket=day|week|month&project=<id>|task=<id>&from=&to="""
+        kind = query.get('bucket', ['month'])[0]
+        if kind not in BUCKET_KINDS:
+            self.send_json_response(400, {'error': f'bucket只能是 {", ".join(BUCKET_KINDS)}'})
+            return
+
+        if 'project' in query:
+            scope = ('projects', query['project'][0])
+        elif 'task' in query:
+            scope = ('tasks', query['task'][0])
+        else:
+            scope = ('all', '')
+
+        start = end = None
+        if 'from' in query or 'to' in query:
+            start = parse_date(query['from'][0]) if 'from' in query else None
+            end = parse_date(query['to'][0]) if 'to' in query else None
+            if ('from' in query and not start) or ('to' in query and not end):
+                self.send_json_response(400, {'error': '日期格式错误，应为 YYYY-MM-DD'})
+                return
 
-            self.send_json_response(200, data)
+        # 合并内存中的记录与已归档记录的汇总
+        buckets = merge_buckets(
+            self.store.get_index(RecordRollupIndex).summary(kind, scope, start, end),
+            get_archive(self.store.data_dir).summary(kind, scope, start, end)
+        )
+        self.send_json_response(200, {'bucket': kind, 'scope': scope[0], 'id': scope[1], 'buckets': buckets})
+
+    def handle_rollups(self, query):
+        """处理进度汇总请求，可用 ?plan=<id> 或 ?project=<id> 查询单个计划或项目"""
+        rollups = self.store.get_index(RollupIndex)
+        if 'plan' in query:
+            plan_id = query['plan'][0]
+            if self.store.get_item('plans', plan_id) is None:
+                self.send_json_response(404, {'error': f'plans中不存在id为 {plan_id} 的数据'})
+                return
+            self.send_json_response(200, rollups.plan_rollup(plan_id))
+        elif 'project' in query:
+            project_id = query['project'][0]
+            if self.store.get_item('projects', project_id) is None:
+                self.send_json_response(404, {'error': f'projects中不存在id为 {project_id} 的数据'})
+                return
+            self.send_json_response(200, rollups.project_rollup(project_id))
+        else:
+            self.send_json_response(200, rollups.all_rollups())
+
+    def handle_stats(self):
+        """处理仪表盘统计请求"""
+        self.send_json_response(200, self.store.get_index(StatsIndex).snapshot())
+
+    def handle_list_workspaces(self):
+        """列出当前用户可以进入的工作区"""
+        current_user = self.get_current_user()
+        response = {'current': self.workspace}
+        if current_user.get('role') == 'admin':
+            response['workspaces'] = self.workspaces.list_workspaces()
+            response['status'] = self.workspaces.status()
+        else:
+            response['workspaces'] = user_workspaces(current_user)
+        self.send_json_response(200, response)
+
+    def handle_switch_workspace(self):
+        """切换当前会话的工作区，管理员切换到不存在的工作区时会新建"""
+        current_user = self.get_current_user()
+        data = json_codec.loads(self.read_body() or b'{}')
+        workspace = data.get('workspace') if isinstance(data, dict) else None
+        if not can_access(current_user, workspace):
+            self.send_json_response(403, {'error': '无权访问该工作区'})
+            return
 
-        except Exception as e:
-            self.send_json_response(500, {'error': str(e)})
+        session_id = self.get_cookie('session_id')
+        headers = None
+        if self.session_tokens is not None:
+            # 工作区记录在令牌中，签发新令牌替换原令牌
+            self.delete_session(session_id)
+            new_session_id = self.create_session(current_user['username'], workspace)
+            headers = {'Set-Cookie': f'session_id={new_session_id}; Max-Age=86400; HttpOnly; Path=/'}
+        else:
+            with sessions_lock:
+                sessions = self.load_json(self.sessions_file)
+                if session_id in sessions:
+                    sessions[session_id]['workspace'] = workspace
+                    self.save_json(self.sessions_file, sessions)
+
+        self.use_workspace(workspace)
+        self.send_json_response(200, {'success': True, 'workspace': workspace}, headers=headers)
+
+    def handle_connections(self):
+        """查看因读取超时或请求头超限被断开的连接数（仅管理员）"""
+        if self.get_current_user().get('role') != 'admin':
+            self.send_json_response(403, {'error': '需要管理员权限'})
+            return
+        self.send_json_response(200, get_connection_stats().snapshot())
+
+    def handle_integrity(self):
+        """处理数据完整性检查请求，列出引用了不存在父级的数据"""
+        orphans = self.store.get_index(ReferenceIndex).check_integrity()
+        self.send_json_response(200, {'ok': not orphans, 'orphans': orphans})
 
     def handle_load_data(self):
         """处理加载数据请求（POST方式）"""
@@ -443,12 +1001,6 @@ class ProjectManagerHandler(BaseHTTPRequestHandler):
     def handle_save_data(self):
         """处理保存数据请求"""
         try:
-            # 检查用户是否已认证
-            current_user = self.get_current_user()
-            if not current_user:
-                self.send_json_response(401, {'status': 'error', 'message': '未认证'})
-                return
-
             content_length = int(self.headers['Content-Length'])
 
             # 检查内容长度，防止过大的请求
@@ -456,8 +1008,22 @@ class ProjectManagerHandler(BaseHTTPRequestHandler):
                 self.send_json_response(413, {'status': 'error', 'message': '数据太大，请减小图片尺寸'})
                 return
 
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
+            data = json_codec.loads(self.read_body())
+            if not isinstance(data, dict):
+                self.send_json_response(400, {'status': 'error', 'message': '数据格式错误'})
+                return
+            changes = {data_type: data[data_type] for data_type in DATA_TYPES if data_type in data}
+
+            # 校验数据结构、取值和引用关系，任何一条不合法都不保存
+            failures = validate_changes(changes, self.store)
+            if failures:
+                access_log.event('warning', 'validation_failed', count=len(failures))
+                self.send_json_response(400, {
+                    'status': 'error',
+                    'message': f'数据校验失败，{len(failures)} 条数据不合法',
+                    'errors': failures[:MAX_REPORTED_ERRORS]
+                })
+                return
 
             # 处理图片数据 - 如果太大则移除
             for data_type in ['plans', 'projects']:
@@ -467,22 +1033,53 @@ class ProjectManagerHandler(BaseHTTPRequestHandler):
                             # 检查图片数据大小
                             image_size = len(item['image'])
                             if image_size > 5 * 1024 * 1024:  # 5MB限制
-                                print(f"图片太大 ({image_size} bytes)，移除图片数据")
+                                access_log.event('warning', 'image_removed', data_type=data_type, size=image_size)
                                 item['image'] = None
 
-            # 保存各类数据
-            for data_type in ['plans', 'projects', 'tasks', 'records']:
-                if data_type in data:
-                    self.save_data(data_type, data[data_type])
+            # 保存各类数据（一次提交）
+            self.store.commit(changes)
 
             self.send_json_response(200, {'status': 'success', 'message': '数据保存成功'})
 
+        except SlowClientError:
+            raise
         except json.JSONDecodeError as e:
-            print(f"JSON解析错误: {e}")
+            access_log.event('warning', 'invalid_json', route=self.path, error=str(e))
             self.send_json_response(400, {'status': 'error', 'message': '数据格式错误，可能是图片太大'})
         except Exception as e:
-            print(f"保存数据错误: {e}")
-            self.send_json_response(500, {'status': 'error', 'message': f'保存失败: {str(e)}'})
+            access_log.event('error', 'handler_error', handler='handle_save_data', error=repr(e), traceback=traceback.format_exc())
+            self.send_json_response(500, {'status': 'error', 'message': '保存失败，服务器内部错误'})
+
+    def handle_batch(self):
+        """处理批量操作请求
+
+        请求格式: {"operations": [{"op": "status|patch|move|delete", "type": "tasks", "id": "...", ...}]}
+        所有操作全部成功才会保存，否则不做任何修改；删除会按反向索引级联处理子数据
+        """
+        try:
+            data = json_codec.loads(self.read_body())
+
+            operations = data.get('operations') if isinstance(data, dict) else None
+            if not isinstance(operations, list) or not operations:
+                self.send_json_response(400, {'status': 'error', 'message': '缺少operations'})
+                return
+            if len(operations) > MAX_BATCH_OPERATIONS:
+                self.send_json_response(413, {'status': 'error', 'message': f'单次最多 {MAX_BATCH_OPERATIONS} 个操作'})
+                return
+
+            success, results = self.store.apply_batch(operations)
+            if success:
+                self.send_json_response(200, {'status': 'success', 'message': '批量操作成功', 'results': results})
+            else:
+                self.send_json_response(409, {'status': 'error', 'message': '批量操作失败，未保存任何修改', 'results': results})
+
+        except SlowClientError:
+            raise
+        except json.JSONDecodeError:
+            self.send_json_response(400, {'status': 'error', 'message': '请求数据格式错误'})
+        except Exception as e:
+            access_log.event('error', 'handler_error', handler='handle_batch', error=repr(e), traceback=traceback.format_exc())
+            self.send_json_response(500, {'status': 'error', 'message': '批量操作失败，服务器内部错误'})
 
     def do_OPTIONS(self):
         """处理CORS预检请求"""
@@ -491,16 +1088,70 @@ class ProjectManagerHandler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type, Cookie')
         self.send_header('Access-Control-Allow-Credentials', 'true')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
+    def log_request(self, code='-', size='-'):
+        """请求在结束时由log_access统一记录"""
+
     def log_message(self, format, *args):
-        """自定义日志消息"""
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {format % args}")
+        """http.server内部的消息（如请求超时、错误响应）写入访问日志"""
+        access_log.event('warning', format % args, ip=self.client_address[0])
+
+# 路由表：中间件依次为计时、错误映射、压缩、认证；auth=False 的路由不要求登录，query=True 时传入解析后的查询参数
+routes = Router([
+    ProjectManagerHandler.timing_middleware,
+    ProjectManagerHandler.error_middleware,
+    ProjectManagerHandler.compression_middleware,
+    ProjectManagerHandler.auth_middleware,
+])
+
+# 页面和静态文件
+routes.add('GET', '/', ProjectManagerHandler.handle_index, auth=False)
+routes.add('GET', '/login.html', ProjectManagerHandler.handle_login_page, auth=False)
+routes.add('GET', '/server_index.html', ProjectManagerHandler.handle_app_page, auth=False)
+routes.add('GET', '/styles.css', ProjectManagerHandler.serve_file, args=('styles.css', 'text/css'), auth=False)
+for script in ('script.js', 'server_script.js', 'ui_functions.js'):
+    routes.add('GET', f'/{script}', ProjectManagerHandler.serve_file, args=(script, 'application/javascript'), auth=False)
+routes.add('GET', '/favicon.ico', ProjectManagerHandler.handle_favicon, auth=False)
+routes.fallback('GET', ProjectManagerHandler.handle_static, auth=False)
+
+# 查询接口
+routes.add('GET', '/api/data', ProjectManagerHandler.handle_get_data)
+routes.add('GET', '/api/check-auth', ProjectManagerHandler.handle_check_auth, auth=False)
+routes.add('GET', '/api/due', ProjectManagerHandler.handle_due, query=True)
+routes.add('GET', '/api/timeline', ProjectManagerHandler.handle_timeline, query=True)
+routes.add('GET', '/api/search', ProjectManagerHandler.handle_search, query=True)
+routes.add('GET', '/api/records/archive', ProjectManagerHandler.handle_records_archive, query=True)
+routes.add('GET', '/api/records/summary', ProjectManagerHandler.handle_records_summary, query=True)
+routes.add('GET', '/api/rollups', ProjectManagerHandler.handle_rollups, query=True)
+routes.add('GET', '/api/stats', ProjectManagerHandler.handle_stats)
+routes.add('GET', '/api/workspaces', ProjectManagerHandler.handle_list_workspaces)
+routes.add('GET', '/api/integrity', ProjectManagerHandler.handle_integrity)
+routes.add('GET', '/api/connections', ProjectManagerHandler.handle_connections)
+# 子数据查询，如 /api/projects/<id>/tasks
+routes.add('GET', '/api/(plans|projects|tasks)/([^/]+)/(projects|tasks|records)', ProjectManagerHandler.handle_get_children)
+
+# 修改接口
+routes.add('POST', '/api/save', ProjectManagerHandler.handle_save_data)
+routes.add('POST', '/api/batch', ProjectManagerHandler.handle_batch)
+routes.add('POST', '/api/workspace', ProjectManagerHandler.handle_switch_workspace)
+routes.add('POST', '/api/load', ProjectManagerHandler.handle_load_data)
+routes.add('POST', '/api/login', ProjectManagerHandler.handle_login, auth=False)
+routes.add('POST', '/api/logout', ProjectManagerHandler.handle_logout, auth=False)
 
 def run_server(port=8001):
     """运行HTTP服务器"""
+    # 预先加载默认工作区：优先从快照恢复内存数据和索引，快照与JSON文件不一致时按需从JSON加载
+    workspaces = get_workspace_manager('database')
+    workspaces.get(DEFAULT_WORKSPACE)
+
     server_address = ('', port)
-    httpd = HTTPServer(server_address, ProjectManagerHandler)
+    # 每个请求一个线程，密码验证等待进程池时不阻塞其他请求
+    httpd = ThreadingHTTPServer(server_address, ProjectManagerHandler)
+
+    # 服务管理器用SIGTERM停止服务，同样走正常退出流程以写入快照
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
     print(f"🚀 project_manager项目管理系统服务器已启动")
     print(f"📱 访问地址: http://localhost:{port}")
@@ -508,6 +1159,7 @@ def run_server(port=8001):
     print(f"   - 用户名: project_manager, 密码: 123456")
     print(f"   - 用户名: admin, 密码: admin123")
     print(f"💾 数据保存在: {os.path.abspath('database')} 目录")
+    print(f"📝 访问日志: {'标准输出' if access_log.path == '-' else os.path.abspath(access_log.path)}")
     print(f"🌐 支持公网访问，可在防火墙开放 {port} 端口")
     print("⏹️  按 Ctrl+C 停止服务器")
 
@@ -516,8 +1168,11 @@ def run_server(port=8001):
     except KeyboardInterrupt:
         print("\n服务器已停止")
         httpd.shutdown()
+    finally:
+        password_hasher.close()
+        workspaces.close()
+        access_log.close()
 
 if __name__ == "__main__":
-    import sys
     port = int(sys.argv[1]) if len(sys.argv) > 1 else 8001
     run_server(port)
\ No newline at end of file
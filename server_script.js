@@ -7,6 +7,7 @@ class ServerDataManager {
         this.projects = [];
         this.tasks = [];
         this.records = [];
+        this.rollups = { plans: {}, projects: {} }; // 服务器端计算的进度汇总
         this.serverUrl = ''; // 自动检测服务器URL
         this.init();
     }
@@ -33,6 +34,7 @@ class ServerDataManager {
                 this.projects = Array.isArray(data.projects) ? data.projects : [];
                 this.tasks = Array.isArray(data.tasks) ? data.tasks : [];
                 this.records = Array.isArray(data.records) ? data.records : [];
+                this.rollups = data.rollups || { plans: {}, projects: {} };
 
                 console.log('✅ 数据从服务器加载成功');
                 console.log(`📊 加载统计: 计划${this.plans.length}, 项目${this.projects.length}, 任务${this.tasks.length}, 记录${this.records.length}`);
@@ -84,7 +86,12 @@ class ServerDataManager {
                     return false;
                 }
             } else {
-                console.error('❌ 保存到服务器失败:', response.status, response.statusText);
+                const result = await response.json().catch(() => null);
+                if (result && result.errors) {
+                    console.error('❌ 数据校验失败:', result.message, result.errors);
+                } else {
+                    console.error('❌ 保存到服务器失败:', response.status, response.statusText);
+                }
                 return false;
             }
         } catch (error) {
@@ -250,6 +257,95 @@ class ServerDataManager {
         return Promise.resolve(false);
     }
 
+    // 服务器端全文搜索，types如 ['plans', 'projects']，失败时返回null
+    async search(query, types = null, limit = 20) {
+        try {
+            const params = new URLSearchParams({ q: query, limit: String(limit) });
+            if (types) {
+                params.set('type', types.join(','));
+            }
+            const response = await fetch(`${this.serverUrl}/api/search?${params}`);
+            if (response.ok) {
+                return await response.json();
+            }
+        } catch (error) {
+            console.error('❌ 搜索失败:', error.message);
+        }
+        return null;
+    }
+
+    // 获取服务器端统计数据，失败时返回null
+    async fetchStats() {
+        try {
+            const response = await fetch(`${this.serverUrl}/api/stats`);
+            if (response.ok) {
+                return await response.json();
+            }
+        } catch (error) {
+            console.error('❌ 获取统计数据失败:', error.message);
+        }
+        return null;
+    }
+
+    // 批量操作：operations为 [{op: 'status'|'patch'|'move'|'delete', type, id, ...}]
+    // 服务器原子执行，全部成功才保存，成功后重新加载数据
+    async applyBatch(operations) {
+        try {
+            const response = await fetch(`${this.serverUrl}/api/batch`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ operations })
+            });
+            const result = await response.json();
+            if (response.ok && result.status === 'success') {
+                await this.loadFromServer();
+                return result;
+            }
+            console.error('❌ 批量操作失败:', result.message, result.results);
+            return result;
+        } catch (error) {
+            console.error('❌ 批量操作错误:', error.message);
+            return { status: 'error', message: error.message, results: [] };
+        }
+    }
+
+    // 获取可以进入的工作区：{current, workspaces}
+    async fetchWorkspaces() {
+        try {
+            const response = await fetch(`${this.serverUrl}/api/workspaces`);
+            if (response.ok) {
+                return await response.json();
+            }
+        } catch (error) {
+            console.error('❌ 获取工作区失败:', error.message);
+        }
+        return null;
+    }
+
+    // 切换工作区，成功后重新加载该工作区的数据
+    async switchWorkspace(workspace) {
+        try {
+            const response = await fetch(`${this.serverUrl}/api/workspace`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ workspace })
+            });
+            const result = await response.json();
+            if (response.ok && result.success) {
+                await this.loadFromServer();
+                return true;
+            }
+            console.error('❌ 切换工作区失败:', result.error);
+        } catch (error) {
+            console.error('❌ 切换工作区错误:', error.message);
+        }
+        return false;
+    }
+
     generateId() {
         return 'id_' + Date.now() + '_' + Math.random().toString(36).substr(2, 9);
     }
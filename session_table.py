@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+线程安全的内存会话表
+auth_server.py 的每个请求在独立线程中处理，会话表按令牌分为多个分片，每个分片有自己的锁，
+不同会话的读写互不阻塞。
+
+过期会话由后台线程清理：所有会话按过期时间放在一个最小堆中，清理线程只需查看堆顶，
+等到最早的会话过期时醒来。会话在访问时延长有效期，堆中不逐一更新，弹出时发现已延期就按新的过期时间放回。
+
+会话数超过上限时移出最早过期的会话，内存占用不会随登录次数无限增长。
+计数器：live 当前会话数、expired 已过期清理的会话数、evicted 因超出上限被移出的会话数。
+"""
+
+import heapq
+import threading
+import time
+
+from access_log import get_access_log
+
+access_log = get_access_log()
+
+# 分片数量
+STRIPES = 16
+
+# 会话数上限
+DEFAULT_MAX_SESSIONS = 10000
+
+# 清理线程最长的等待间隔（秒）
+SWEEP_INTERVAL = 60
+
+# 清理线程最短的等待间隔（秒），同一时段过期的会话合并为一次清理
+MIN_SWEEP_DELAY = 1.0
+
+
+class SessionStripe:
+    __slots__ = ('lock', 'sessions')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}
+
+
+class SessionTable:
+    """按令牌分片加锁的会话表，会话为包含 expires 字段的dict"""
+
+    def __init__(self, max_sessions=DEFAULT_MAX_SESSIONS, stripes=STRIPES):
+        self.max_sessions = max_sessions
+        self.stripes = [SessionStripe() for _ in range(stripes)]
+        # (过期时间, 令牌)，可能包含已延期或已删除会话的旧条目
+        self.heap = []
+        self.heap_lock = threading.Lock()
+        self.counter_lock = threading.Lock()
+        self.live = 0
+        self.expired = 0
+        self.evicted = 0
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.sweeper = None
+
+    def stripe(self, token):
+        return self.stripes[hash(token) % len(self.stripes)]
+
+    def count(self, live=0, expired=0, evicted=0):
+        with self.counter_lock:
+            self.live += live
+            self.expired += expired
+            self.evicted += evicted
+            return self.live
+
+    def add(self, token, session):
+        """添加会话，超出上限时移出最早过期的会话"""
+        stripe = self.stripe(token)
+        with stripe.lock:
+            replaced = token in stripe.sessions
+            stripe.sessions[token] = session
+        live = self.count(live=0 if replaced else 1)
+        with self.heap_lock:
+            earliest = self.heap[0][0] if self.heap else None
+            heapq.heappush(self.heap, (session['expires'], token))
+        if earliest is None or session['expires'] < earliest:
+            self.wakeup.set()
+        if live > self.max_sessions:
+            self.evict(live - self.max_sessions)
+
+    def get(self, token):
+        """获取有效的会话，已过期时删除并返回None"""
+        if not token:
+            return None
+        stripe = self.stripe(token)
+        with stripe.lock:
+            session = stripe.sessions.get(token)
+            if session is None:
+                return None
+            if time.time() <= session['expires']:
+                return session
+            del stripe.sessions[token]
+        self.count(live=-1, expired=1)
+        return None
+
+    def touch(self, token, expires):
+        """延长会话有效期"""
+        stripe = self.stripe(token)
+        with stripe.lock:
+            session = stripe.sessions.get(token)
+            if session is not None:
+                session['expires'] = max(session['expires'], expires)
+
+    def remove(self, token):
+        """删除会话（登出或校验失败），返回被删除的会话"""
+        if not token:
+            return None
+        stripe = self.stripe(token)
+        with stripe.lock:
+            session = stripe.sessions.pop(token, None)
+        if session is not None:
+            self.count(live=-1)
+        return session
+
+    def pop_earliest(self, deadline=None):
+        """按过期时间弹出最早的会话：deadline为None时不论是否过期（用于移出），
+        否则只弹出在deadline之前过期的会话；返回 (令牌, 会话)，没有时返回None"""
+        while True:
+            with self.heap_lock:
+                if not self.heap or (deadline is not None and self.heap[0][0] > deadline):
+                    return None
+                expires, token = heapq.heappop(self.heap)
+            stripe = self.stripe(token)
+            with stripe.lock:
+                session = stripe.sessions.get(token)
+                if session is None:
+                    # 已删除会话的旧条目
+                    continue
+                if session['expires'] > expires:
+                    # 已延期，按新的过期时间放回
+                    requeue = session['expires']
+                else:
+                    del stripe.sessions[token]
+                    return token, session
+            with self.heap_lock:
+                heapq.heappush(self.heap, (requeue, token))
+
+    def evict(self, count):
+        for _ in range(count):
+            if self.pop_earliest() is None:
+                break
+            self.count(live=-1, evicted=1)
+
+    def sweep(self):
+        """清理全部已过期的会话，返回清理的数量"""
+        removed = 0
+        while self.pop_earliest(deadline=time.time()) is not None:
+            removed += 1
+        if removed:
+            self.count(live=-removed, expired=removed)
+        self.compact()
+        return removed
+
+    def compact(self):
+        """堆中的旧条目明显多于会话数时，按现有会话重建堆"""
+        with self.heap_lock:
+            if len(self.heap) <= 2 * max(self.live, 1) + len(self.stripes):
+                return
+            # 持有堆锁时再获取分片锁；其他地方不会在持有分片锁时获取堆锁，不会死锁
+            entries = []
+            for stripe in self.stripes:
+                with stripe.lock:
+                    entries.extend((session['expires'], token) for token, session in stripe.sessions.items())
+            heapq.heapify(entries)
+            self.heap = entries
+
+    def next_expiry(self):
+        with self.heap_lock:
+            return self.heap[0][0] if self.heap else None
+
+    def run_sweeper(self, interval):
+        while not self.stopping.is_set():
+            removed = self.sweep()
+            if removed:
+                access_log.event('info', 'sessions_expired', removed=removed, live=self.live)
+            next_expiry = self.next_expiry()
+            timeout = interval if next_expiry is None else min(interval, max(next_expiry - time.time(), MIN_SWEEP_DELAY))
+            self.wakeup.wait(timeout)
+            self.wakeup.clear()
+
+    def start_sweeper(self, interval=SWEEP_INTERVAL):
+        """启动后台清理线程"""
+        if self.sweeper is None:
+            self.stopping.clear()
+            self.sweeper = threading.Thread(target=self.run_sweeper, args=(interval,), name='session-sweeper', daemon=True)
+            self.sweeper.start()
+
+    def stop_sweeper(self):
+        if self.sweeper is not None:
+            self.stopping.set()
+            self.wakeup.set()
+            self.sweeper.join()
+            self.sweeper = None
+
+    def stats(self):
+        with self.counter_lock:
+            return {'live': self.live, 'expired': self.expired, 'evicted': self.evicted}
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+签名会话令牌
+可选的无状态会话模式：Cookie中直接携带经HMAC-SHA256签名的令牌，任何服务器进程只要持有同一组密钥即可验证，
+不再需要共享的会话文件或进程内的会话字典。
+
+设置环境变量 PM_SESSION_MODE=token 启用（默认 file，即原来的会话存储方式）。
+
+令牌格式：v1.<密钥id>.<载荷>.<签名>，载荷为base64url编码的JSON：
+    u    用户名
+    iat  签发时间（Unix秒）
+    exp  过期时间
+    jti  令牌id，用于单独吊销
+    其他  调用方附加的字段（如客户端IP、工作区）
+
+密钥与吊销列表保存在网站目录之外的密钥目录中（PM_TOKEN_KEYS_DIR，默认 ~/.project_manager），
+静态文件服务无论如何配置都不会把签名密钥发给客户端；旧版本保存在 sessions/ 中的文件第一次使用时自动移过去：
+    token_keys.json      {"active": 当前签发使用的密钥id, "keys": {密钥id: 密钥}}，第一次使用时自动生成
+    revoked_tokens.json  {"tokens": {jti: 过期时间}, "users": {用户名: 吊销时间}}
+吊销列表只保留尚未过期的令牌，因此始终很小；按用户吊销会使该用户在吊销时间那一秒及之前签发的全部令牌失效。
+修改这两个文件时持有同目录下 .lock 文件的文件锁，多个进程同时吊销时不会互相覆盖。
+两个文件修改后，其他进程最多1秒内重新加载。
+
+用法:
+    python session_tokens.py rotate             # 生成新密钥并用于签发，旧密钥保留用于验证
+    python session_tokens.py --keys-dir /etc/project_manager info  # 指定密钥目录
+    python session_tokens.py revoke-user admin  # 使某用户已签发的全部令牌失效
+    python session_tokens.py info               # 查看密钥和吊销列表
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import json_codec
+from access_log import get_access_log
+
+access_log = get_access_log()
+
+TOKEN_VERSION = 'v1'
+
+# 令牌有效期（秒），与文件会话相同
+DEFAULT_TTL = 4 * 3600
+
+# 轮换后保留用于验证的密钥数量（含当前密钥），超出的最旧密钥被删除，用它签发的令牌随即失效
+MAX_KEYS = 3
+
+# 签发时间允许超前的秒数（多台服务器时钟误差）
+CLOCK_SKEW = 60
+
+# 检查密钥和吊销文件是否变化的最短间隔（秒）
+RELOAD_CHECK_INTERVAL = 1.0
+
+KEYS_FILE_NAME = 'token_keys.json'
+REVOKED_FILE_NAME = 'revoked_tokens.json'
+
+# 默认的密钥目录，位于网站目录之外
+DEFAULT_KEYS_DIR = os.path.join(os.path.expanduser('~'), '.project_manager')
+
+# 旧版本保存密钥的目录（网站目录中）
+LEGACY_KEYS_DIR = 'sessions'
+
+
+def session_mode():
+    """当前的会话模式：file 或 token"""
+    return 'token' if os.environ.get('PM_SESSION_MODE', 'file') == 'token' else 'file'
+
+
+def keys_dir():
+    """密钥和吊销列表所在的目录"""
+    return os.environ.get('PM_TOKEN_KEYS_DIR') or DEFAULT_KEYS_DIR
+
+
+def move_legacy_files(keys_dir, legacy_dir=LEGACY_KEYS_DIR):
+    """把旧版本保存在网站目录中的密钥和吊销列表移到密钥目录，已签发的令牌继续有效"""
+    if os.path.abspath(legacy_dir) == os.path.abspath(keys_dir):
+        return
+    for name in (KEYS_FILE_NAME, REVOKED_FILE_NAME):
+        legacy_path = os.path.join(legacy_dir, name)
+        if not os.path.exists(legacy_path):
+            continue
+        target_path = os.path.join(keys_dir, name)
+        if os.path.exists(target_path):
+            os.remove(legacy_path)
+        else:
+            os.makedirs(keys_dir, mode=0o700, exist_ok=True)
+            shutil.move(legacy_path, target_path)
+            access_log.event('info', 'token_file_moved', source=legacy_path, target=target_path)
+
+
+def b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def write_atomic(path, obj):
+    """原子写入JSON文件，仅所有者可读写"""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(json_codec.dumps_file(obj))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+@contextmanager
+def file_lock(path):
+    """持有 path.lock 的排他文件锁，跨进程互斥"""
+    fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+        yield
+    finally:
+        # 关闭文件时锁随之释放
+        os.close(fd)
+
+
+class WatchedFile:
+    """按修改时间缓存的JSON文件"""
+
+    def __init__(self, path, default):
+        self.path = path
+        self.default = default
+        self.data = default()
+        self.signature = None
+        self.checked_at = None
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and self.checked_at is not None and now - self.checked_at < RELOAD_CHECK_INTERVAL:
+            return self.data
+        self.checked_at = now
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self.data, self.signature = self.default(), None
+            return self.data
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature != self.signature:
+            try:
+                data = json_codec.read_file(self.path)
+            except (FileNotFoundError, ValueError) as e:
+                access_log.event('warning', 'read_failed', file=self.path, error=str(e))
+                return self.data
+            self.data, self.signature = data, signature
+        return self.data
+
+    def write(self, data):
+        write_atomic(self.path, data)
+        self.data = data
+        self.signature = None
+        self.checked_at = None
+
+
+class SessionTokens:
+    """签发、验证和吊销会话令牌"""
+
+    def __init__(self, keys_dir, ttl=DEFAULT_TTL):
+        self.keys_dir = keys_dir
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.keys = WatchedFile(os.path.join(keys_dir, KEYS_FILE_NAME), lambda: {'active': None, 'keys': {}})
+        self.revoked = WatchedFile(os.path.join(keys_dir, REVOKED_FILE_NAME), lambda: {'tokens': {}, 'users': {}})
+
+    def keyring(self):
+        """当前的密钥，不存在时生成第一个密钥"""
+        with self.lock:
+            keyring = self.keys.refresh()
+            if keyring.get('active') in keyring.get('keys', {}):
+                return keyring
+            self.create_first_key()
+            return self.keys.refresh(force=True)
+
+    def create_first_key(self):
+        os.makedirs(self.keys_dir, mode=0o700, exist_ok=True)
+        kid = secrets.token_hex(4)
+        temp_path = f"{self.keys.path}.{os.getpid()}.new"
+        write_atomic(temp_path, {'active': kid, 'keys': {kid: secrets.token_hex(32)}})
+        try:
+            # 多个进程同时启动时只有一个能创建成功，其余使用已创建的密钥
+            os.link(temp_path, self.keys.path)
+            access_log.event('info', 'token_key_created', file=self.keys.path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp_path)
+
+    def sign(self, secret, message):
+        return b64encode(hmac.new(bytes.fromhex(secret), message.encode('ascii'), hashlib.sha256).digest())
+
+    def issue(self, username, **claims):
+        """签发令牌"""
+        keyring = self.keyring()
+        kid = keyring['active']
+        now = int(time.time())
+        payload = {'u': username, 'iat': now, 'exp': now + self.ttl, 'jti': secrets.token_urlsafe(12), **claims}
+        message = f"{TOKEN_VERSION}.{kid}.{b64encode(json_codec.dumps(payload))}"
+        return f"{message}.{self.sign(keyring['keys'][kid], message)}"
+
+    def verify(self, token):
+        """验证令牌，有效时返回载荷，否则返回None"""
+        if not isinstance(token, str) or not token.isascii() or token.count('.') != 3:
+            return None
+        version, kid, payload_text, signature = token.split('.')
+        secret = self.keyring()['keys'].get(kid)
+        if version != TOKEN_VERSION or secret is None:
+            return None
+        if not hmac.compare_digest(self.sign(secret, token.rsplit('.', 1)[0]), signature):
+            return None
+        try:
+            payload = json_codec.loads(b64decode(payload_text))
+        except ValueError:
+            return None
+
+        now = time.time()
+        if not isinstance(payload, dict) or not isinstance(payload.get('exp'), int) or payload['exp'] <= now:
+            return None
+        if not isinstance(payload.get('iat'), int) or payload['iat'] > now + CLOCK_SKEW:
+            return None
+        with self.lock:
+            revoked = self.revoked.refresh()
+        if payload.get('jti') in revoked.get('tokens', {}):
+            return None
+        revoked_at = revoked.get('users', {}).get(payload.get('u'))
+        # 签发时间只精确到秒，与吊销时间同一秒签发的令牌也视为已吊销
+        if revoked_at is not None and payload['iat'] <= revoked_at:
+            return None
+        return payload
+
+    def update_revoked(self, tokens=None, users=None):
+        """合并新的吊销记录并写入文件，同时清除已经过期的记录；读取到写入之间持有文件锁，避免覆盖其他进程的记录"""
+        os.makedirs(self.keys_dir, mode=0o700, exist_ok=True)
+        with self.lock, file_lock(self.revoked.path):
+            revoked = self.revoked.refresh(force=True)
+            now = time.time()
+            merged_tokens = {jti: exp for jti, exp in revoked.get('tokens', {}).items() if exp > now}
+            merged_users = {name: at for name, at in revoked.get('users', {}).items() if at + self.ttl > now}
+            merged_tokens.update(tokens or {})
+            merged_users.update(users or {})
+            self.revoked.write({'tokens': merged_tokens, 'users': merged_users})
+
+    def revoke(self, payload):
+        """吊销单个令牌（如登出），记录保留到令牌过期"""
+        self.update_revoked(tokens={payload['jti']: payload['exp']})
+
+    def revoke_user(self, username):
+        """吊销某用户此前签发的全部令牌"""
+        self.update_revoked(users={username: int(time.time())})
+
+    def rotate(self):
+        """生成新密钥用于签发，保留最近的 MAX_KEYS 个密钥用于验证，返回新密钥id"""
+        with self.lock:
+            keyring = self.keyring()
+            kid = secrets.token_hex(4)
+            keys = dict(keyring['keys'])
+            keys[kid] = secrets.token_hex(32)
+            # 字典保持插入顺序，最前面的是最旧的密钥
+            for old_kid in list(keys)[:-MAX_KEYS]:
+                del keys[old_kid]
+            self.keys.write({'active': kid, 'keys': keys})
+            return kid
+
+
+_token_managers = {}
+_token_managers_lock = threading.Lock()
+
+
+def get_session_tokens(directory=None):
+    """获取密钥目录对应的共享令牌管理器，默认使用 keys_dir()"""
+    directory = directory or keys_dir()
+    key = os.path.abspath(directory)
+    with _token_managers_lock:
+        if key not in _token_managers:
+            move_legacy_files(directory)
+            _token_managers[key] = SessionTokens(directory)
+        return _token_managers[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='会话令牌密钥管理')
+    parser.add_argument('--keys-dir', default=None, help=f'密钥目录（默认: PM_TOKEN_KEYS_DIR 或 {DEFAULT_KEYS_DIR}）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('rotate', help='生成新密钥')
+    revoke_parser = subparsers.add_parser('revoke-user', help='使某用户已签发的全部令牌失效')
+    revoke_parser.add_argument('username')
+    subparsers.add_parser('info', help='查看密钥和吊销列表')
+    args = parser.parse_args()
+
+    tokens = get_session_tokens(args.keys_dir)
+    if args.command == 'rotate':
+        kid = tokens.rotate()
+        print(f"🔑 新密钥 {kid} 已启用，保留最近 {MAX_KEYS} 个密钥用于验证")
+    elif args.command == 'revoke-user':
+        tokens.revoke_user(args.username)
+        print(f"🚫 用户 {args.username} 已签发的令牌全部失效")
+    elif args.command == 'info':
+        keyring = tokens.keyring()
+        revoked = tokens.revoked.refresh(force=True)
+        print(f"📁 密钥目录: {os.path.abspath(tokens.keys_dir)}")
+        print(f"🔑 当前密钥: {keyring['active']}，可验证的密钥: {', '.join(keyring['keys'])}")
+        print(f"🚫 已吊销令牌 {len(revoked.get('tokens', {}))} 个，已吊销用户 {len(revoked.get('users', {}))} 个")
+        print(f"⚙️  当前会话模式: {session_mode()}（PM_SESSION_MODE=token 启用令牌模式）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据快照
+把内存中的四类数据和已构建的索引保存为一个二进制快照文件（database/snapshot.bin），
+服务器启动时直接加载快照，不必重新解析全部JSON文件、重建索引。
+
+JSON文件仍是唯一的数据来源：快照中记录了生成时每个JSON文件的大小和校验和，
+加载时逐个比较，任何文件不一致、快照损坏或版本不符时都放弃快照，按原方式从JSON加载。
+
+文件格式：
+    头部     魔数(8字节) 版本(uint16) 来源信息长度(uint32) 数据长度(uint64) 数据CRC32(uint32)
+    来源信息  JSON，{数据类型: [[文件名, 大小, 校验和], ...]}
+    数据     pickle，{'collections': ..., 'indexes': ...}
+
+用法:
+    python snapshot.py write     # 从JSON重新生成快照（压缩）
+    python snapshot.py info      # 查看快照状态
+"""
+
+import argparse
+import gc
+import hashlib
+import os
+import pickle
+import struct
+import time
+import zlib
+from collections.abc import Mapping
+
+import json_codec
+from access_log import get_access_log
+from data_store import DATA_TYPES, PARTITION_FIELDS, ReferenceIndex, create_temp_file, get_store
+from date_index import DateIndex
+from record_rollup_index import RecordRollupIndex
+from rollup_index import RollupIndex
+from search_index import SearchIndex
+from stats_index import StatsIndex
+
+access_log = get_access_log()
+
+SNAPSHOT_FILE_NAME = 'snapshot.bin'
+SNAPSHOT_MAGIC = b'PMSNAP\x00\x00'
+
+# 实体或索引的内部结构变化时递增，旧快照自动失效
+SNAPSHOT_VERSION = 2
+
+HEADER = struct.Struct('<8sHIQI')
+
+# 离线生成快照时预先构建的索引
+SNAPSHOT_INDEXES = [ReferenceIndex, StatsIndex, RollupIndex, SearchIndex, DateIndex, RecordRollupIndex]
+
+
+class SnapshotError(Exception):
+    """快照无法使用"""
+
+
+def get_snapshot_path(data_dir):
+    return os.path.join(data_dir, SNAPSHOT_FILE_NAME)
+
+
+def source_files(store, data_type):
+    """某类数据对应的全部JSON文件"""
+    paths = [store.get_data_path(data_type)]
+    if data_type in PARTITION_FIELDS:
+        paths += [store.get_partition_path(data_type, partition) for partition in store.list_partitions(data_type)]
+    return [path for path in paths if os.path.exists(path)]
+
+
+def file_checksum(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_checksums(store):
+    """计算全部JSON文件的 [文件名, 大小, 校验和]"""
+    sources = {}
+    for data_type in DATA_TYPES:
+        sources[data_type] = [
+            [os.path.relpath(path, store.data_dir), os.path.getsize(path), file_checksum(path)]
+            for path in source_files(store, data_type)
+        ]
+    return sources
+
+
+def write_snapshot(store):
+    """把数据存储的当前状态写入快照，返回 (快照路径, 文件大小)"""
+    path = get_snapshot_path(store.data_dir)
+    with store.lock:
+        store.load_all()
+        sources = json_codec.dumps(source_checksums(store))
+        payload = pickle.dumps({
+            'collections': store.collections,
+            'indexes': store.indexes,
+            'compact': store.compact
+        }, protocol=pickle.HIGHEST_PROTOCOL)
+
+    f, temp_path = create_temp_file(path)
+    try:
+        with f:
+            f.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(sources), len(payload), zlib.crc32(payload)))
+            f.write(sources)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return path, HEADER.size + len(sources) + len(payload)
+
+
+def read_snapshot(path):
+    """读取并校验快照文件，返回 (来源信息, 数据字节)"""
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise SnapshotError('文件不完整')
+        magic, version, sources_length, payload_length, crc = HEADER.unpack(header)
+        if magic != SNAPSHOT_MAGIC:
+            raise SnapshotError('不是快照文件')
+        if version != SNAPSHOT_VERSION:
+            raise SnapshotError(f'版本不符（{version}，当前为{SNAPSHOT_VERSION}）')
+        sources = json_codec.loads(f.read(sources_length))
+        payload = f.read(payload_length)
+    if len(payload) != payload_length or zlib.crc32(payload) != crc:
+        raise SnapshotError('数据校验失败')
+    return sources, payload
+
+
+def load_snapshot(store):
+    """尝试用快照恢复数据存储，成功返回True；快照不存在或与JSON不一致时返回False"""
+    path = get_snapshot_path(store.data_dir)
+    if not os.path.exists(path):
+        return False
+
+    started = time.perf_counter()
+    try:
+        sources, payload = read_snapshot(path)
+        with store.lock:
+            # 先记下修改时间再计算校验和，期间文件若被修改，之后的load会按修改时间重新读取
+            mtimes = {data_type: store.file_mtime(data_type) for data_type in DATA_TYPES}
+            if sources != source_checksums(store):
+                raise SnapshotError('JSON文件已变化')
+            # 反序列化会一次创建大量对象，期间暂停垃圾回收
+            gc.disable()
+            try:
+                state = pickle.loads(payload)
+            finally:
+                gc.enable()
+            collections = state['collections']
+            indexes = state['indexes']
+            if set(collections) != set(DATA_TYPES):
+                raise SnapshotError('数据类型不完整')
+            if state.get('compact', True) != store.compact:
+                raise SnapshotError('数据表示方式（PM_COMPACT_ENTITIES）与快照不同')
+
+            store.collections = collections
+            store.generation += 1
+            store.encoded_cache = {}
+            store.by_id = {
+                data_type: {item['id']: item for item in items if isinstance(item, Mapping) and item.get('id')}
+                for data_type, items in collections.items()
+            }
+            store.mtimes = mtimes
+            for index in indexes.values():
+                index.store = store
+            store.indexes = indexes
+    except (SnapshotError, OSError, ValueError, pickle.UnpicklingError, AttributeError, ImportError,
+            EOFError, KeyError, TypeError) as e:
+        access_log.event('warning', 'snapshot_unusable', directory=store.data_dir, error=str(e))
+        return False
+
+    elapsed = (time.perf_counter() - started) * 1000
+    access_log.event('info', 'snapshot_loaded', directory=store.data_dir, indexes=len(indexes), ms=round(elapsed))
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='数据快照工具')
+    parser.add_argument('--data-dir', default='database', help='数据目录（默认: database）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('write', help='从JSON文件重新生成快照')
+    subparsers.add_parser('info', help='查看快照状态')
+    args = parser.parse_args()
+
+    store = get_store(args.data_dir)
+    if args.command == 'write':
+        started = time.perf_counter()
+        for index_class in SNAPSHOT_INDEXES:
+            store.get_index(index_class)
+        path, size = write_snapshot(store)
+        elapsed = time.perf_counter() - started
+        print(f"✅ 快照已写入: {path}（{size / 1024:.1f}KB，用时 {elapsed:.2f}s）")
+    elif args.command == 'info':
+        path = get_snapshot_path(args.data_dir)
+        if not os.path.exists(path):
+            print("📭 快照不存在")
+            return
+        try:
+            sources, _ = read_snapshot(path)
+        except (SnapshotError, OSError, ValueError) as e:
+            print(f"❌ 快照无效: {e}")
+            return
+        print(f"📦 快照文件: {os.path.abspath(path)}（{os.path.getsize(path) / 1024:.1f}KB）")
+        print("✅ 与JSON文件一致" if sources == source_checksums(store) else "⚠️  JSON文件已变化，快照将不会被使用")
+
+
+if __name__ == "__main__":
+    main()
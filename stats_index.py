@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+仪表盘统计索引
+按数据类型维护总数和分组计数，随数据变化增量更新，查询时不再遍历数据
+字段为空或缺失的数据（如不属于任何计划的项目）不计入分组，单独计入 unassigned
+"""
+
+from collections import Counter
+
+from data_store import DATA_TYPES, StoreIndex
+
+# 数据类型 -> [(字段, 统计名称)]
+GROUP_FIELDS = {
+    'plans': [('status', 'status'), ('category', 'category')],
+    'projects': [('status', 'status'), ('category', 'category'), ('priority', 'priority'), ('planId', 'plan')],
+    'tasks': [('status', 'status'), ('priority', 'priority')],
+    'records': [('type', 'type')],
+}
+
+
+class StatsIndex(StoreIndex):
+    """总数与分组计数"""
+
+    def reset(self):
+        self.totals = Counter()
+        self.groups = {
+            data_type: {field: Counter() for field, _ in GROUP_FIELDS[data_type]}
+            for data_type in DATA_TYPES
+        }
+        self.unassigned = {data_type: Counter() for data_type in DATA_TYPES}
+
+    def count(self, data_type, field, item, delta):
+        """调整单个分组计数，计数归零时移除该分组；字段为空时调整未分组计数"""
+        key = item.get(field)
+        if not key:
+            counter, key = self.unassigned[data_type], field
+        else:
+            counter = self.groups[data_type][field]
+        counter[key] += delta
+        if counter[key] <= 0:
+            del counter[key]
+
+    def on_add(self, data_type, item):
+        self.totals[data_type] += 1
+        for field, _ in GROUP_FIELDS[data_type]:
+            self.count(data_type, field, item, 1)
+
+    def on_remove(self, data_type, item):
+        self.totals[data_type] -= 1
+        for field, _ in GROUP_FIELDS[data_type]:
+            self.count(data_type, field, item, -1)
+
+    def on_update(self, data_type, old_item, new_item):
+        for field, _ in GROUP_FIELDS[data_type]:
+            if old_item.get(field) != new_item.get(field):
+                self.count(data_type, field, old_item, -1)
+                self.count(data_type, field, new_item, 1)
+
+    def snapshot(self):
+        """生成统计结果"""
+        with self.store.lock:
+            stats = {'totals': {data_type: self.totals[data_type] for data_type in DATA_TYPES}}
+            for data_type in DATA_TYPES:
+                stats[data_type] = {
+                    name: dict(self.groups[data_type][field])
+                    for field, name in GROUP_FIELDS[data_type]
+                }
+                stats[data_type]['unassigned'] = {
+                    name: self.unassigned[data_type][field]
+                    for field, name in GROUP_FIELDS[data_type]
+                    if self.unassigned[data_type][field]
+                }
+
+            project_status = self.groups['projects']['status']
+            stats['dashboard'] = {
+                'totalPlans': self.totals['plans'],
+                'totalProjects': self.totals['projects'],
+                'activeProjects': project_status['active'],
+                'completedProjects': project_status['completed']
+            }
+            return stats
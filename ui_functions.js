@@ -16,15 +16,27 @@ function generateId() {
 
 // 更新仪表盘
 function updateDashboard() {
-    document.getElementById('totalPlans').textContent = plans.length;
-    document.getElementById('totalProjects').textContent = projects.length;
-    document.getElementById('activeProjects').textContent = projects.filter(p => p.status === 'active').length;
-    document.getElementById('completedProjects').textContent = projects.filter(p => p.status === 'completed').length;
-
+    renderDashboardStats();
     renderRecentPlans();
     renderRecentProjects();
 }
 
+// 渲染统计数字，优先使用服务器端统计，获取失败时在本地计算
+async function renderDashboardStats() {
+    const stats = await dataManager.fetchStats();
+    const dashboard = stats ? stats.dashboard : {
+        totalPlans: plans.length,
+        totalProjects: projects.length,
+        activeProjects: projects.filter(p => p.status === 'active').length,
+        completedProjects: projects.filter(p => p.status === 'completed').length
+    };
+
+    document.getElementById('totalPlans').textContent = dashboard.totalPlans;
+    document.getElementById('totalProjects').textContent = dashboard.totalProjects;
+    document.getElementById('activeProjects').textContent = dashboard.activeProjects;
+    document.getElementById('completedProjects').textContent = dashboard.completedProjects;
+}
+
 // 渲染最近计划
 function renderRecentPlans() {
     const recentPlans = plans.slice(-3).reverse();
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用户目录
+users.json 只在文件变化时读取一次，之后按用户名在内存中查找，每个请求解析会话对应的用户只需一次字典查找。
+
+- 文件变化检测：最多每秒检查一次文件的修改时间和大小，外部修改（如手工编辑、管理脚本）会自动重新加载；
+  文件内容暂时不合法（例如正在写入）时继续使用上一次的数据
+- 写穿：创建用户、修改密码等通过 add_user / update_user 完成，先原子写入文件（临时文件 + 替换），
+  成功后再更新内存中的数据
+
+返回的用户数据是共享的，调用方不要直接修改。
+"""
+
+import os
+import threading
+import time
+
+import json_codec
+from access_log import get_access_log
+from data_store import create_temp_file
+
+access_log = get_access_log()
+
+# 检查文件是否变化的最短间隔（秒）
+RELOAD_CHECK_INTERVAL = 1.0
+
+
+class UserDirectory:
+    """按用户名索引的用户数据"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.users = {}
+        # 已加载文件的 (修改时间, 大小)，文件不存在时为None
+        self.signature = None
+        self.checked_at = None
+
+    def file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def refresh(self, force=False):
+        """文件变化时重新加载"""
+        now = time.monotonic()
+        if not force and self.checked_at is not None and now - self.checked_at < RELOAD_CHECK_INTERVAL:
+            return
+        with self.lock:
+            self.checked_at = now
+            signature = self.file_signature()
+            if signature == self.signature:
+                return
+            if signature is None:
+                self.users = {}
+                self.signature = None
+                return
+            try:
+                users = json_codec.read_file(self.path)
+            except (FileNotFoundError, ValueError) as e:
+                access_log.event('warning', 'read_failed', file=self.path, error=str(e))
+                return
+            self.users = users if isinstance(users, dict) else {}
+            self.signature = signature
+
+    def exists(self):
+        """用户文件是否存在"""
+        self.refresh()
+        return self.signature is not None
+
+    def get(self, username):
+        """按用户名获取用户，不存在时返回None"""
+        self.refresh()
+        return self.users.get(username)
+
+    def write(self, users):
+        """原子写入用户文件，并更新内存中的数据"""
+        # 每次写入使用唯一的临时文件，多个进程同时写入时不会写进同一个临时文件
+        f, temp_path = create_temp_file(self.path)
+        try:
+            with f:
+                f.write(json_codec.dumps_file(users))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.users = users
+        self.signature = self.file_signature()
+
+    def add_user(self, user):
+        """创建用户，用户名已存在时抛出ValueError"""
+        with self.lock:
+            self.refresh(force=True)
+            username = user['username']
+            if username in self.users:
+                raise ValueError(f'用户已存在: {username}')
+            users = dict(self.users)
+            users[username] = user
+            self.write(users)
+
+    def update_user(self, username, changes):
+        """修改用户的部分字段（如密码哈希），用户不存在时抛出KeyError"""
+        with self.lock:
+            self.refresh(force=True)
+            if username not in self.users:
+                raise KeyError(username)
+            users = dict(self.users)
+            users[username] = {**users[username], **changes}
+            self.write(users)
+            return users[username]
+
+
+_directories = {}
+_directories_lock = threading.Lock()
+
+
+def get_user_directory(path):
+    """获取用户文件对应的共享用户目录"""
+    key = os.path.abspath(path)
+    with _directories_lock:
+        if key not in _directories:
+            _directories[key] = UserDirectory(path)
+        return _directories[key]
@@ -5,23 +5,22 @@
 用于管理网站的用户名和密码
 """
 
-import hashlib
+import csv
 import os
 import getpass
+import time
 
-USERS_FILE = "users.txt"
+import json_codec
+from user_store import FILE_HEADER, USERS_FILE, get_user_store, hash_password
 
-def hash_password(password):
-    """生成密码的SHA-256哈希"""
-    return hashlib.sha256(password.encode('utf-8')).hexdigest()
+# 批量导入报告中最多列出的错误行数
+MAX_REPORTED_ERRORS = 10
 
 def init_users_file():
     """初始化用户文件"""
     if not os.path.exists(USERS_FILE):
         with open(USERS_FILE, 'w', encoding='utf-8') as f:
-            f.write("# 用户认证文件 - 格式: 用户名:密码哈希\n")
-            f.write("# 请勿手动修改此文件中的哈希值\n")
-            f.write("\n")
+            f.writelines(FILE_HEADER)
         print(f"✅ 已创建 {USERS_FILE} 文件")
         return True
     return False
@@ -32,48 +31,20 @@ def add_user(username, password):
         print("❌ 用户名和密码不能为空")
         return False
 
-    # 检查用户是否已存在
-    if user_exists(username):
+    if not get_user_store(USERS_FILE).add(username, hash_password(password)):
         print(f"❌ 用户 '{username}' 已存在")
         return False
 
-    hashed_password = hash_password(password)
-
-    with open(USERS_FILE, 'a', encoding='utf-8') as f:
-        f.write(f"{username}:{hashed_password}\n")
-
     print(f"✅ 用户 '{username}' 添加成功")
     return True
 
 def user_exists(username):
     """检查用户是否存在"""
-    if not os.path.exists(USERS_FILE):
-        return False
-
-    with open(USERS_FILE, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.startswith('#') or ':' not in line:
-                continue
-            line_username = line.split(':')[0]
-            if line_username == username:
-                return True
-    return False
+    return get_user_store(USERS_FILE).exists(username)
 
 def verify_user(username, password):
     """验证用户名和密码"""
-    if not os.path.exists(USERS_FILE):
-        return False
-
-    hashed_password = hash_password(password)
-
-    with open(USERS_FILE, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.startswith('#') or ':' not in line:
-                continue
-            line_username, line_hash = line.strip().split(':', 1)
-            if line_username == username and line_hash == hashed_password:
-                return True
-    return False
+    return get_user_store(USERS_FILE).verify(username, password)
 
 def list_users():
     """列出所有用户"""
@@ -81,14 +52,7 @@ def list_users():
         print("❌ 用户文件不存在")
         return
 
-    users = []
-    with open(USERS_FILE, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.startswith('#') or ':' not in line:
-                continue
-            username = line.split(':')[0]
-            users.append(username)
-
+    users = get_user_store(USERS_FILE).usernames()
     if users:
         print("👥 当前用户列表:")
         for i, user in enumerate(users, 1):
@@ -102,54 +66,93 @@ def remove_user(username):
         print("❌ 用户文件不存在")
         return False
 
-    lines = []
-    user_found = False
-
-    with open(USERS_FILE, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.startswith('#') or ':' not in line:
-                lines.append(line)
-            else:
-                line_username = line.split(':')[0]
-                if line_username == username:
-                    user_found = True
-                    print(f"✅ 已删除用户 '{username}'")
-                else:
-                    lines.append(line)
-
-    if not user_found:
+    if not get_user_store(USERS_FILE).remove(username):
         print(f"❌ 用户 '{username}' 不存在")
         return False
 
-    with open(USERS_FILE, 'w', encoding='utf-8') as f:
-        f.writelines(lines)
-
+    print(f"✅ 已删除用户 '{username}'")
     return True
 
 def change_password(username, new_password):
     """修改用户密码"""
-    if not user_exists(username):
+    if not get_user_store(USERS_FILE).set_hash(username, hash_password(new_password)):
         print(f"❌ 用户 '{username}' 不存在")
         return False
 
-    hashed_password = hash_password(new_password)
-    lines = []
-
-    with open(USERS_FILE, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.startswith('#') or ':' not in line:
-                lines.append(line)
-            else:
-                line_username = line.split(':')[0]
-                if line_username == username:
-                    lines.append(f"{username}:{hashed_password}\n")
-                    print(f"✅ 用户 '{username}' 密码修改成功")
-                else:
-                    lines.append(line)
+    print(f"✅ 用户 '{username}' 密码修改成功")
+    return True
 
-    with open(USERS_FILE, 'w', encoding='utf-8') as f:
-        f.writelines(lines)
+def read_import_rows(path):
+    """逐行读取CSV（表头含username、password列）或JSONL（每行一个对象）文件，产生 (行号, 用户名, 密码)"""
+    if path.endswith(('.jsonl', '.ndjson')):
+        with open(path, 'rb') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json_codec.loads(line)
+                except ValueError:
+                    yield line_number, None, None
+                    continue
+                if not isinstance(row, dict):
+                    yield line_number, None, None
+                    continue
+                yield line_number, row.get('username'), row.get('password')
+    else:
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row.get('username'), row.get('password')
+
+def import_users(path, update=False):
+    """从CSV/JSONL文件批量导入用户：逐行读取并计算哈希，全部完成后一次原子写入用户文件"""
+    if not os.path.exists(path):
+        print(f"❌ 文件不存在: {path}")
+        return False
 
+    started = time.perf_counter()
+    store = get_user_store(USERS_FILE)
+    store.refresh(force=True)
+    existing = store.users
+
+    # 待写入的 用户名 -> 哈希；明文密码读取后立即计算哈希，不会保留
+    pending = {}
+    seen = set()
+    duplicates = skipped = 0
+    errors = []
+    for line_number, username, password in read_import_rows(path):
+        username = username.strip() if isinstance(username, str) else ''
+        # 用户名不能包含分隔符、换行，也不能以注释符开头
+        if (not username or username.startswith('#') or any(c in username for c in ':\r\n')
+                or not isinstance(password, str) or not password):
+            errors.append(line_number)
+            continue
+        if username in seen:
+            duplicates += 1
+            continue
+        seen.add(username)
+        if username in existing and not update:
+            skipped += 1
+            continue
+        pending[username] = hash_password(password)
+
+    updated = sum(1 for username in pending if username in existing)
+    if pending:
+        store.update(pending)
+    elapsed = time.perf_counter() - started
+
+    print(f"📥 导入完成: {path}（用时 {elapsed:.2f}s）")
+    print(f"   新增用户: {len(pending) - updated}")
+    if update:
+        print(f"   更新密码: {updated}")
+    else:
+        print(f"   已存在跳过: {skipped}")
+    print(f"   文件内重复: {duplicates}")
+    print(f"   格式错误: {len(errors)}")
+    if errors:
+        shown = ', '.join(str(line_number) for line_number in errors[:MAX_REPORTED_ERRORS])
+        more = ' ...' if len(errors) > MAX_REPORTED_ERRORS else ''
+        print(f"   错误行号: {shown}{more}")
     return True
 
 def interactive_mode():
@@ -249,6 +252,12 @@ def main():
         elif command == "list":
             list_users()
 
+        elif command == "import":
+            if len(os.sys.argv) >= 3:
+                import_users(os.sys.argv[2], update='--update' in os.sys.argv[3:])
+            else:
+                print("用法: python3 user_manager.py import <users.csv|users.jsonl> [--update]")
+
         elif command == "hash":
             if len(os.sys.argv) >= 3:
                 password = os.sys.argv[2]
@@ -258,7 +267,7 @@ def main():
 
         else:
             print("未知命令")
-            print("可用命令: add, remove, list, hash")
+            print("可用命令: add, remove, list, import, hash")
     else:
         interactive_mode()
 
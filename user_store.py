@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+users.txt 用户存储
+user_manager.py 和 auth_server.py 共用：文件只在变化时读取一次，按用户名建立内存索引，
+查找、验证都是一次字典查找；修改时整体写入临时文件再替换原文件，写到一半中断也不会损坏用户文件。
+
+文件格式不变：每行 用户名:密码哈希（SHA-256），# 开头的行为注释。
+"""
+
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+from data_store import create_temp_file
+
+USERS_FILE = "users.txt"
+
+FILE_HEADER = [
+    "# 用户认证文件 - 格式: 用户名:密码哈希\n",
+    "# 请勿手动修改此文件中的哈希值\n",
+    "\n",
+]
+
+# 检查文件是否变化的最短间隔（秒）
+RELOAD_CHECK_INTERVAL = 1.0
+
+
+def hash_password(password):
+    """生成密码的SHA-256哈希"""
+    return hashlib.sha256(password.encode('utf-8')).hexdigest()
+
+
+class UserStore:
+    """按用户名索引的 users.txt"""
+
+    def __init__(self, path=USERS_FILE):
+        self.path = path
+        self.lock = threading.RLock()
+        # 用户名 -> 密码哈希，按文件中的顺序
+        self.users = {}
+        # 文件开头的注释行，写回时保留
+        self.header = list(FILE_HEADER)
+        self.signature = None
+        self.checked_at = None
+
+    def file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def refresh(self, force=False):
+        """文件变化时重新加载"""
+        now = time.monotonic()
+        if not force and self.checked_at is not None and now - self.checked_at < RELOAD_CHECK_INTERVAL:
+            return
+        with self.lock:
+            self.checked_at = now
+            signature = self.file_signature()
+            if signature == self.signature:
+                return
+            users = {}
+            header = []
+            if signature is not None:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.startswith('#') or ':' not in line:
+                            if not users:
+                                header.append(line)
+                            continue
+                        username, password_hash = line.strip().split(':', 1)
+                        # 同一用户名出现多次时以第一行为准
+                        users.setdefault(username, password_hash)
+            self.users = users
+            self.header = header or list(FILE_HEADER)
+            self.signature = signature
+
+    def exists(self, username):
+        self.refresh()
+        return username in self.users
+
+    def get_hash(self, username):
+        self.refresh()
+        return self.users.get(username)
+
+    def verify(self, username, password):
+        """验证用户名和密码"""
+        password_hash = self.get_hash(username)
+        return password_hash is not None and hmac.compare_digest(password_hash, hash_password(password))
+
+    def usernames(self):
+        self.refresh()
+        return list(self.users)
+
+    def write(self, users):
+        """原子写入用户文件，并更新内存索引"""
+        # 每次写入使用唯一的临时文件，user_manager.py 和 auth_server.py 同时写入时不会写进同一个临时文件
+        f, temp_path = create_temp_file(self.path)
+        try:
+            with f:
+                f.writelines(line.encode('utf-8') for line in self.header)
+                f.writelines(f"{username}:{password_hash}\n".encode('utf-8') for username, password_hash in users.items())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.users = users
+        self.signature = self.file_signature()
+
+    def update(self, changes=None, removals=()):
+        """在最新的文件内容上一次性应用修改并写入：changes为 {用户名: 密码哈希}，removals为要删除的用户名"""
+        with self.lock:
+            self.refresh(force=True)
+            users = {username: password_hash for username, password_hash in self.users.items() if username not in removals}
+            users.update(changes or {})
+            self.write(users)
+
+    def add(self, username, password_hash):
+        """添加用户，已存在时返回False"""
+        with self.lock:
+            self.refresh(force=True)
+            if username in self.users:
+                return False
+            self.update({username: password_hash})
+            return True
+
+    def set_hash(self, username, password_hash):
+        """修改密码哈希，用户不存在时返回False"""
+        with self.lock:
+            self.refresh(force=True)
+            if username not in self.users:
+                return False
+            self.update({username: password_hash})
+            return True
+
+    def remove(self, username):
+        """删除用户，不存在时返回False"""
+        with self.lock:
+            self.refresh(force=True)
+            if username not in self.users:
+                return False
+            self.update(removals={username})
+            return True
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_user_store(path=USERS_FILE):
+    """获取用户文件对应的共享用户存储"""
+    key = os.path.abspath(path)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = UserStore(path)
+        return _stores[key]
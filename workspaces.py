@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工作区
+每个工作区是一套独立存储的计划/项目/任务/记录数据，同一个服务器进程可以同时服务多个团队。
+
+    default 工作区      database/（与原来的数据位置相同）
+    其他工作区          database/workspaces/<工作区名>/
+
+工作区在第一次访问时加载（有快照时从快照恢复），已加载的工作区按最近使用顺序排列，
+估算的内存占用超过预算时，把最久未使用的工作区写入快照后移出内存，下次访问时再加载；
+请求处理期间工作区处于使用中（acquire/release），不会被其他请求移出。
+
+用户在users.json中的 workspace 字段是登录后默认进入的工作区，workspaces 字段列出允许切换的工作区；
+管理员可以进入任意工作区。
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from access_log import get_access_log
+from data_store import DATA_TYPES, get_store, release_store
+from snapshot import load_snapshot, source_files, write_snapshot
+
+access_log = get_access_log()
+
+DEFAULT_WORKSPACE = 'default'
+WORKSPACES_DIR_NAME = 'workspaces'
+WORKSPACE_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+
+# 内存预算（MB），可用环境变量 PM_WORKSPACE_MEMORY_MB 调整
+DEFAULT_MEMORY_BUDGET_MB = 512
+
+# 内存占用按JSON文件大小的倍数估算（实体对象加上各类索引）
+MEMORY_FACTOR = 3
+
+
+def valid_workspace_name(name):
+    return isinstance(name, str) and WORKSPACE_NAME_PATTERN.match(name) is not None
+
+
+def user_workspaces(user):
+    """用户可以进入的工作区，第一个是登录后默认进入的工作区"""
+    default = user.get('workspace') or DEFAULT_WORKSPACE
+    allowed = [default] + [name for name in user.get('workspaces', []) if name != default]
+    return [name for name in allowed if valid_workspace_name(name)] or [DEFAULT_WORKSPACE]
+
+
+def can_access(user, name):
+    if not valid_workspace_name(name):
+        return False
+    return user.get('role') == 'admin' or name in user_workspaces(user)
+
+
+class WorkspaceManager:
+    """按需加载工作区，并按LRU策略在内存预算内保留已加载的工作区"""
+
+    def __init__(self, root_dir, memory_budget=None):
+        self.root_dir = root_dir
+        if memory_budget is None:
+            memory_budget = int(os.environ.get('PM_WORKSPACE_MEMORY_MB', DEFAULT_MEMORY_BUDGET_MB)) * 1024 * 1024
+        self.memory_budget = memory_budget
+        self.lock = threading.RLock()
+        # 工作区名 -> 估算的内存占用，按最近使用顺序排列
+        self.loaded = OrderedDict()
+        # 工作区名 -> 估算内存占用时数据存储的generation，数据变化后才重新估算
+        self.estimated = {}
+        # 工作区名 -> 正在使用该工作区的请求数，大于0时不会被移出内存
+        self.pins = {}
+        self.evictions = 0
+
+    def workspace_dir(self, name):
+        if name == DEFAULT_WORKSPACE:
+            return self.root_dir
+        return os.path.join(self.root_dir, WORKSPACES_DIR_NAME, name)
+
+    def list_workspaces(self):
+        """列出已存在的工作区"""
+        try:
+            names = sorted(os.listdir(os.path.join(self.root_dir, WORKSPACES_DIR_NAME)))
+        except FileNotFoundError:
+            names = []
+        return [DEFAULT_WORKSPACE] + [name for name in names if valid_workspace_name(name) and name != DEFAULT_WORKSPACE]
+
+    def estimate_memory(self, store):
+        size = 0
+        for data_type in DATA_TYPES:
+            for path in source_files(store, data_type):
+                try:
+                    size += os.path.getsize(path)
+                except FileNotFoundError:
+                    continue
+        return size * MEMORY_FACTOR
+
+    def update_estimate(self, name, store):
+        """数据加载或提交后（generation变化）重新估算内存占用，否则沿用上次的结果，不必每次访问都读取文件大小"""
+        if self.estimated.get(name) != store.generation:
+            self.loaded[name] = self.estimate_memory(store)
+            self.estimated[name] = store.generation
+
+    def get(self, name):
+        """获取工作区的数据存储，未加载时加载，并在超出预算时移出最久未使用的工作区"""
+        if not valid_workspace_name(name):
+            raise ValueError(f'工作区名称不合法: {name}')
+        with self.lock:
+            store = get_store(self.workspace_dir(name))
+            if name not in self.loaded:
+                load_snapshot(store)
+                self.loaded[name] = 0
+            self.update_estimate(name, store)
+            self.loaded.move_to_end(name)
+            self.enforce_budget()
+            return store
+
+    def acquire(self, name):
+        """获取工作区并标记为使用中，请求结束时必须调用release"""
+        with self.lock:
+            store = self.get(name)
+            self.pins[name] = self.pins.get(name, 0) + 1
+            return store
+
+    def release(self, name):
+        """请求结束，取消使用中标记；请求期间提交的数据计入内存估算"""
+        with self.lock:
+            count = self.pins.get(name, 0) - 1
+            if count > 0:
+                self.pins[name] = count
+            else:
+                self.pins.pop(name, None)
+            if name in self.loaded:
+                self.update_estimate(name, get_store(self.workspace_dir(name)))
+            self.enforce_budget()
+
+    def enforce_budget(self):
+        """超出内存预算时按最久未使用的顺序移出工作区，正在被请求使用的和最近使用的一个除外"""
+        while sum(self.loaded.values()) > self.memory_budget:
+            candidates = [name for name in list(self.loaded)[:-1] if not self.pins.get(name)]
+            if not candidates:
+                break
+            name = candidates[0]
+            del self.loaded[name]
+            self.estimated.pop(name, None)
+            self.evict(name)
+
+    def evict(self, name):
+        store = release_store(self.workspace_dir(name))
+        self.evictions += 1
+        if store is not None and store.collections and os.path.isdir(store.data_dir):
+            try:
+                write_snapshot(store)
+            except Exception as e:
+                access_log.event('error', 'snapshot_failed', workspace=name, error=repr(e))
+        access_log.event('info', 'workspace_evicted', workspace=name)
+
+    def close(self):
+        """停止服务时为全部已加载的工作区写入快照"""
+        with self.lock:
+            for name in list(self.loaded):
+                store = get_store(self.workspace_dir(name))
+                if not os.path.isdir(store.data_dir):
+                    # 切换进入后从未保存过数据的工作区
+                    continue
+                try:
+                    path, size = write_snapshot(store)
+                    print(f"💾 工作区 {name} 数据快照已写入: {path}（{size / 1024:.1f}KB）")
+                except Exception as e:
+                    print(f"⚠️  工作区 {name} 写入快照失败: {e}")
+
+    def status(self):
+        with self.lock:
+            return {
+                'loaded': list(self.loaded),
+                'estimatedMemory': sum(self.loaded.values()),
+                'memoryBudget': self.memory_budget,
+                'pinned': sorted(self.pins),
+                'evictions': self.evictions
+            }
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_workspace_manager(root_dir):
+    """获取数据根目录对应的共享工作区管理器"""
+    key = os.path.abspath(root_dir)
+    with _managers_lock:
+        if key not in _managers:
+            _managers[key] = WorkspaceManager(root_dir)
+        return _managers[key]